@@ -0,0 +1,142 @@
+"""
+Control de admisión por clase de petición.
+
+Un reporte de un año ocupa un hilo del worker durante varios segundos; si llegan
+varios a la vez pueden tomar todos los hilos y las ventas de los vendedores quedan
+esperando detrás. Cada petición se clasifica por ruta:
+
+- write: registrar ventas, devoluciones, comentarios y solicitudes. Nunca se
+  rechazan ni esperan.
+- heavy: reportes, comparaciones, tendencias y exportaciones. Corren como máximo
+  `limit` a la vez; hasta `queue` más esperan turno (hasta `timeout` segundos) y
+  las demás reciben 503 con Retry-After.
+- standard: todo lo demás, sin límite.
+
+Con gthread (ver Dockerfile), limit + queue de heavy debe ser menor que los hilos
+del worker: el resto de los hilos queda siempre libre para las escrituras. Los
+límites son por proceso (cada worker de gunicorn tiene los suyos).
+"""
+import json
+import threading
+import time
+from fnmatch import fnmatch
+
+from werkzeug.wsgi import ClosingIterator
+
+WRITE_PATHS = ('/api/record_sale', '/api/process_return', '/api/process_product_return',
+               '/api/save_comment_events', '/api/save_comment_points',
+               '/api/create_solicitud', '/api/close_solicitud')
+HEAVY_PATHS = ('/api/reports', '/api/reports/*', '/api/analytics/*', '/api/export')
+
+
+class RequestClass:
+    """Límite de concurrencia con cola acotada y contadores para una clase de peticiones"""
+
+    def __init__(self, name, limit=None, queue=0, timeout=0.0):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self._condition = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.max_wait = 0.0
+
+    def acquire(self):
+        """True si la petición puede ejecutarse (esperando turno si hay lugar en la cola)"""
+        with self._condition:
+            if self.limit is None or self.in_flight < self.limit:
+                self.in_flight += 1
+                self.admitted += 1
+                return True
+            if self.waiting >= self.queue:
+                self.rejected += 1
+                return False
+            self.waiting += 1
+            started = time.monotonic()
+            try:
+                admitted = self._condition.wait_for(lambda: self.in_flight < self.limit, self.timeout)
+            finally:
+                self.waiting -= 1
+            self.max_wait = max(self.max_wait, time.monotonic() - started)
+            if not admitted:
+                self.timed_out += 1
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'limit': self.limit,
+                'queue': self.queue,
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'max_wait_ms': round(self.max_wait * 1000, 1)
+            }
+
+
+class AdmissionControl:
+    """Middleware WSGI: clasifica cada petición y aplica el límite de su clase"""
+
+    def __init__(self, wsgi_app, heavy_limit, heavy_queue, heavy_timeout, retry_after):
+        self.wsgi_app = wsgi_app
+        self.retry_after = retry_after
+        self.classes = {
+            'write': RequestClass('write'),
+            'heavy': RequestClass('heavy', heavy_limit, heavy_queue, heavy_timeout),
+            'standard': RequestClass('standard')
+        }
+
+    def classify(self, path):
+        if path in WRITE_PATHS:
+            return 'write'
+        if any(fnmatch(path, pattern) for pattern in HEAVY_PATHS):
+            return 'heavy'
+        return 'standard'
+
+    def __call__(self, environ, start_response):
+        request_class = self.classes[self.classify(environ.get('PATH_INFO', ''))]
+        if not request_class.acquire():
+            return self._busy(start_response)
+        if request_class.limit is None:
+            # Sin límite: el cuerpo se entrega tal cual (un wsgi.file_wrapper sigue usando sendfile)
+            try:
+                return self.wsgi_app(environ, start_response)
+            finally:
+                request_class.release()
+        try:
+            body = self.wsgi_app(environ, start_response)
+        except BaseException:
+            request_class.release()
+            raise
+        # Se libera al cerrar la respuesta (las exportaciones se generan mientras se envían)
+        return ClosingIterator(body, request_class.release)
+
+    def _busy(self, start_response):
+        body = json.dumps({
+            'success': False,
+            'message': f'Servidor ocupado con reportes, reintente en {self.retry_after} segundos'
+        }, ensure_ascii=False).encode('utf-8')
+        start_response('503 SERVICE UNAVAILABLE', [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(body))),
+            ('Retry-After', str(self.retry_after))
+        ])
+        return [body]
+
+    def stats(self):
+        return {name: request_class.stats() for name, request_class in self.classes.items()}
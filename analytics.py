@@ -0,0 +1,236 @@
+"""
+Matriz densa día × lugar para análisis de tendencias.
+
+Se mantienen tres matrices int64 (monto neto, ventas y devoluciones) con una fila
+por día desde `history_days` atrás y una columna por lugar. Los días cerrados se
+agregan una sola vez y se guardan en metrics/trends.npz; al pasar el día se
+agregan solo las filas nuevas, y la fila de hoy se recalcula cuando cambian los
+archivos del día. Las medias móviles, la comparación con el año anterior y el
+ranking de lugares son operaciones vectorizadas sobre esas matrices.
+
+La comparación anual usa 364 días (52 semanas) para comparar los mismos días de
+la semana.
+"""
+import os
+import threading
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from config import parse_amount
+from storage import clean_location
+
+YEAR_DAYS = 364
+_MATRICES = ('amount', 'sales', 'returns')
+
+
+class TrendMatrix:
+    """Montos y conteos por día y lugar, agregados una vez y extendidos a diario"""
+
+    def __init__(self, storage, path, history_days=732, delimiter=';'):
+        self.storage = storage
+        self.path = path
+        self.history_days = history_days
+        self.delimiter = delimiter
+        self._lock = threading.Lock()
+        self._origin = None        # fecha de la fila 0
+        self._closed = 0           # filas de días cerrados (ya no cambian)
+        self._today_version = None
+        self._locations = []
+        self._columns = {}         # lugar -> columna
+        self._data = {name: np.zeros((0, 0), dtype=np.int64) for name in _MATRICES}
+
+    # ------------------------------------------------------------------
+    # Persistencia
+    # ------------------------------------------------------------------
+    def _load(self):
+        try:
+            with np.load(self.path, allow_pickle=False) as saved:
+                origin = date.fromordinal(int(saved['origin']))
+                locations = [str(name) for name in saved['locations']]
+                data = {name: saved[name].astype(np.int64) for name in _MATRICES}
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            print(f"Matriz de tendencias inválida, se recalcula: {e}")
+            return False
+        self._origin = origin
+        self._locations = locations
+        self._columns = {name: i for i, name in enumerate(locations)}
+        self._data = data
+        self._closed = data['amount'].shape[0]
+        return True
+
+    def _save(self):
+        """Guardar solo los días cerrados (archivo temporal y rename)"""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp.npz"
+        try:
+            np.savez(tmp_path, origin=np.int64(self._origin.toordinal()),
+                     locations=np.array(self._locations, dtype=str),
+                     **{name: matrix[:self._closed] for name, matrix in self._data.items()})
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Error guardando matriz de tendencias: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    # ------------------------------------------------------------------
+    # Construcción
+    # ------------------------------------------------------------------
+    def _column(self, lugar):
+        column = self._columns.get(lugar)
+        if column is None:
+            column = self._columns[lugar] = len(self._locations)
+            self._locations.append(lugar)
+            for name, matrix in self._data.items():
+                self._data[name] = np.hstack([matrix, np.zeros((matrix.shape[0], 1), dtype=np.int64)])
+        return column
+
+    def _resize_days(self, rows):
+        for name, matrix in self._data.items():
+            if matrix.shape[0] < rows:
+                extra = np.zeros((rows - matrix.shape[0], matrix.shape[1]), dtype=np.int64)
+                self._data[name] = np.vstack([matrix, extra])
+
+    def _aggregate_days(self, start_date, end_date):
+        """Recalcular las filas de start_date a end_date desde los archivos"""
+        first = (start_date - self._origin).days
+        last = (end_date - self._origin).days
+        self._resize_days(last + 1)
+        for matrix in self._data.values():
+            matrix[first:last + 1] = 0
+        # Acumular en dicts (sumas de Python) y volcar a las matrices una vez por celda
+        cells = {}
+        for date_str, sources in self.storage.range_sources(start_date, end_date).items():
+            row = (date.fromisoformat(date_str) - self._origin).days
+            if not first <= row <= last:
+                continue
+            for source in sources:
+                is_return = source.kind == 'returns'
+                try:
+                    for sale in source.rows(self.delimiter):
+                        lugar = clean_location(sale.get('lugar', '') if is_return else source.location)
+                        if not lugar:
+                            continue
+                        counters = cells.get((row, lugar))
+                        if counters is None:
+                            counters = cells[(row, lugar)] = [0, 0, 0]
+                        counters[0] += parse_amount(sale.get('precio', '0')) or 0
+                        counters[2 if is_return else 1] += 1
+                except Exception as e:
+                    print(f"Error procesando {source.filename}: {e}")
+        for (row, lugar), (amount, sales, returns) in cells.items():
+            column = self._column(lugar)
+            self._data['amount'][row, column] = amount
+            self._data['sales'][row, column] = sales
+            self._data['returns'][row, column] = returns
+
+    def _ensure_current(self):
+        today = date.today()
+        if self._origin is None and not self._load():
+            started = time.time()
+            self._origin = today - timedelta(days=self.history_days)
+            self._aggregate_days(self._origin, today - timedelta(days=1))
+            self._closed = (today - self._origin).days
+            self._save()
+            print(f"Matriz de tendencias: {self._closed} días x {len(self._locations)} lugares "
+                  f"en {time.time() - started:.1f}s")
+
+        # Días cerrados desde la última vez (incluye la fila de "hoy" de ayer)
+        closed = (today - self._origin).days
+        if closed > self._closed:
+            self._aggregate_days(self._origin + timedelta(days=self._closed), today - timedelta(days=1))
+            self._closed = closed
+            self._today_version = None
+            self._save()
+
+        version = self.storage.range_version(today, today)
+        if version != self._today_version:
+            self._aggregate_days(today, today)
+            self._today_version = version
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+    def trends(self, start_date, end_date, window=7):
+        """
+        Series diarias del rango (monto, ventas, devoluciones y media móvil del monto),
+        comparación con el mismo rango 52 semanas antes y ranking de lugares con su
+        crecimiento respecto del período anterior de igual largo.
+        """
+        days = (end_date - start_date).days + 1
+
+        with self._lock:
+            self._ensure_current()
+            origin = self._origin
+            amount = self._data['amount']
+            first = (start_date - origin).days
+            index = np.arange(first, first + days)
+            history = amount.shape[0]
+
+            def rows(matrix, shift=0):
+                # Copia de las filas pedidas: _aggregate_days rehace la fila de hoy en el lugar
+                result = np.zeros((days, matrix.shape[1]), dtype=np.int64)
+                idx = index - shift
+                ok = (idx >= 0) & (idx < matrix.shape[0])
+                result[ok] = matrix[idx[ok]]
+                return result
+
+            current = rows(amount)
+            previous_year = rows(amount, YEAR_DAYS).sum(axis=1)
+            previous_period = rows(amount, days).sum(axis=0)
+            sales = rows(self._data['sales'])
+            returns = rows(self._data['returns'])
+            totals = amount.sum(axis=1)
+            locations = list(self._locations)
+
+        # Días fuera de la historia (o futuros) cuentan como cero
+        valid = (index >= 0) & (index < history)
+        daily_amount = current.sum(axis=1)
+
+        # Media móvil: suma acumulada sobre la serie completa (incluye días previos al rango)
+        padded = np.concatenate([np.zeros(window, dtype=np.int64), totals])
+        cumulative = np.cumsum(padded)
+        rolling = np.zeros(days)
+        ends = index[valid] + window
+        rolling[valid] = (cumulative[ends] - cumulative[ends - window]) / window
+
+        by_location = current.sum(axis=0)
+        location_sales = sales.sum(axis=0)
+        location_returns = returns.sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            growth = np.where(previous_period != 0,
+                              (by_location - previous_period) * 100.0 / np.abs(previous_period), np.nan)
+        ranking = np.argsort(-by_location, kind='stable')
+
+        total = int(daily_amount.sum())
+        total_previous_year = int(previous_year.sum())
+        return {
+            'start': start_date.strftime('%Y-%m-%d'),
+            'end': end_date.strftime('%Y-%m-%d'),
+            'window': window,
+            'dates': [(start_date + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days)],
+            'daily': {
+                'amount': daily_amount.tolist(),
+                'sales': sales.sum(axis=1).tolist(),
+                'returns': returns.sum(axis=1).tolist(),
+                'rolling_amount': np.round(rolling, 1).tolist(),
+                'previous_year_amount': previous_year.tolist()
+            },
+            'yoy': {
+                'amount': total,
+                'previous_amount': total_previous_year,
+                'pct': round((total - total_previous_year) * 100 / abs(total_previous_year), 1) if total_previous_year else None
+            },
+            'locations': [{
+                'rank': rank + 1,
+                'lugar': locations[column],
+                'amount': int(by_location[column]),
+                'sales': int(location_sales[column]),
+                'returns': int(location_returns[column]),
+                'previous_amount': int(previous_period[column]),
+                'growth_pct': None if np.isnan(growth[column]) else round(float(growth[column]), 1)
+            } for rank, column in enumerate(ranking)
+                if by_location[column] or location_sales[column] or previous_period[column]]
+        }
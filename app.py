@@ -1,11 +1,34 @@
-from flask import Flask, render_template, request, jsonify, session
-import csv
+from flask import Flask, render_template, request, jsonify, session, Response, stream_with_context, send_file
+import io
 import os
 from datetime import datetime, timedelta
 import json
+import zipfile
+from werkzeug.http import parse_content_range_header
+from werkzeug.security import safe_join
 
 # Importar configuración
 from config import get_config, ensure_directories, validate_sales_code, validate_factory_code
+from reports import aggregate_range, aggregate_ranges
+from topk import top_k
+from metrics import SalesMetrics
+from hours import HoursIndex
+from storage import create_storage, returns_key, sales_key
+from catalog import CATALOG_TABLE, Catalog, CatalogError
+from stock import StockLedger
+from solicitudes import TABLE as SOLICITUDES_TABLE, SolicitudesIndex
+from pagination import decode_cursor, page_desc, parse_limit
+from conditional import make_etag, not_modified, with_validators
+from pagecache import PageCache
+from analytics import TrendMatrix
+from profiling import RequestProfiler
+from admission import AdmissionControl
+from dimensions import DIMENSIONS, SELLERS_TABLE, STORE_TABLES, LocationDimensions
+from catalogfeed import CatalogFeed
+from photos import PhotoLibrary, iter_zip
+from media import ChunkedUploads, UploadError, send_media
+from snapshot import SnapshotError, create_snapshot_store
+from export import iter_export_rows, stream_csv, stream_xlsx
 
 app = Flask(__name__)
 
@@ -16,6 +39,7 @@ app.config.from_object(app_config)
 # Configuración de directorios desde config
 DATA_DIR = app_config.DATA_DIR
 SALES_DIR = app_config.SALES_DIR
+SALES_ARCHIVE_DIR = app_config.SALES_ARCHIVE_DIR
 COMMENTS_DIR = app_config.COMMENTS_DIR
 PHOTOS_DIR = app_config.PHOTOS_DIR
 TUTORIALS_DIR = app_config.TUTORIALS_DIR
@@ -23,65 +47,89 @@ TUTORIALS_DIR = app_config.TUTORIALS_DIR
 # Asegurar que los directorios existan
 ensure_directories(app_config)
 
+# Perfilado a pedido: desarmado solo agrega una comparación de tiempo por petición
+request_profiler = RequestProfiler(app.wsgi_app, app_config.PROFILES_DIR)
+app.wsgi_app = request_profiler
+
+# Admisión por clase: los reportes tienen cupo y cola acotados, las ventas nunca esperan
+admission = AdmissionControl(app.wsgi_app, app_config.ADMISSION_HEAVY_LIMIT, app_config.ADMISSION_HEAVY_QUEUE,
+                             app_config.ADMISSION_HEAVY_TIMEOUT, app_config.ADMISSION_RETRY_AFTER)
+app.wsgi_app = admission
+if app_config.ADMISSION_HEAVY_LIMIT + app_config.ADMISSION_HEAVY_QUEUE >= app_config.GUNICORN_THREADS:
+    print("Advertencia: los reportes pueden ocupar todos los hilos; bajar ADMISSION_HEAVY_LIMIT/QUEUE")
+
+# Almacenamiento (CSV locales o base compartida, según STORAGE_BACKEND)
+storage = create_storage(app_config)
+
+# Histogramas de ventas por hora/día (métricas de rendimiento)
+sales_metrics = SalesMetrics(storage, app_config.METRICS_DIR,
+                             app_config.CSV_ENCODING, app_config.CSV_DELIMITER)
+
 def load_csv(filename, fieldnames=None):
-    """Cargar archivo CSV con manejo de errores"""
-    filepath = os.path.join(DATA_DIR, filename)
-    data = []
-    try:
-        with open(filepath, 'r', encoding=app_config.CSV_ENCODING) as file:
-            # Detectar delimitador
-            sample = file.read(1024)
-            file.seek(0)
-            
-            # Determinar delimitador
-            if ';' in sample:
-                delimiter = ';'
-            elif ',' in sample:
-                delimiter = ','
-            else:
-                delimiter = ','  # por defecto
-            
-            print(f"Archivo: {filename}, Delimitador detectado: '{delimiter}'")  # Debug
-            
-            # Manejar archivos sin encabezados
-            if filename == 'productos.csv' and fieldnames:
-                reader = csv.DictReader(file, delimiter=delimiter, fieldnames=fieldnames)
-            else:
-                reader = csv.DictReader(file, delimiter=delimiter)
-                
-            for row in reader:
-                # Limpiar valores y normalizar nombres de columnas
-                cleaned_row = {}
-                for k, v in row.items():
-                    if v is not None:
-                        # Normalizar nombres de columnas (minúsculas, sin espacios)
-                        clean_key = k.strip().lower().replace(' ', '_')
-                        cleaned_row[clean_key] = v.strip() if isinstance(v, str) else str(v)
-                    else:
-                        cleaned_row[k.strip().lower()] = ''
-                
-                data.append(cleaned_row)
-                
-        print(f"Archivo {filename} cargado: {len(data)} registros")  # Debug
-        if data:
-            print(f"Columnas disponibles: {list(data[0].keys())}")  # Debug
-            
-    except Exception as e:
-        print(f"Error cargando {filename}: {e}")
-    return data
+    """Cargar tabla (CSV de data/) con manejo de errores"""
+    return storage.load_table(filename, fieldnames)
 
 def save_csv(filename, data, fieldnames):
-    """Guardar datos en CSV"""
-    filepath = os.path.join(DATA_DIR, filename)
-    try:
-        with open(filepath, 'w', newline='', encoding=app_config.CSV_ENCODING) as file:
-            writer = csv.DictWriter(file, fieldnames=fieldnames, delimiter=app_config.CSV_DELIMITER)
-            writer.writeheader()
-            writer.writerows(data)
-        return True
-    except Exception as e:
-        print(f"Error guardando {filename}: {e}")
-        return False
+    """Guardar tabla completa"""
+    return storage.save_table(filename, data, fieldnames)
+
+def data_validators(versions, day=None):
+    """
+    ETag (versiones de los datos + URL consultada + día) y Last-Modified de una respuesta de la API.
+    Si la respuesta depende del día (`day`, ej: ?period=week), Last-Modified no es anterior al
+    inicio de ese día: un If-Modified-Since de ayer no puede dar 304 con la ventana de ayer.
+    """
+    last_modified = storage.last_modified(versions)
+    if last_modified is not None and day:
+        last_modified = max(last_modified, datetime.strptime(day, '%Y-%m-%d').timestamp())
+    return make_etag(request.full_path, versions, day), last_modified
+
+# Stock por lugar (asignación inicial menos movimientos, con checkpoint en disco)
+# y ventana de devoluciones (vendido y devuelto por día en los últimos RETURN_WINDOW_DAYS días)
+stock_ledger = StockLedger(storage, app_config.STOCK_CHECKPOINT_PATH,
+                           app_config.CSV_ENCODING, app_config.CSV_DELIMITER,
+                           return_window_days=app_config.RETURN_WINDOW_DAYS)
+
+# Matriz día x lugar para tendencias (días cerrados en metrics/trends.npz)
+trend_matrix = TrendMatrix(storage, app_config.ANALYTICS_PATH,
+                           app_config.ANALYTICS_HISTORY_DAYS, app_config.CSV_DELIMITER)
+
+# Subidas por partes de tutoriales (videos grandes; cada parte hasta MAX_FILE_SIZE)
+tutorial_uploads = ChunkedUploads(app_config.UPLOADS_DIR, TUTORIALS_DIR, app_config.TUTORIAL_MAX_SIZE,
+                                  app_config.MAX_FILE_SIZE, app_config.ALLOWED_EXTENSIONS)
+
+# Snapshots incrementales de los datos (sin detener las ventas)
+snapshot_store = create_snapshot_store(app_config)
+
+# Fotos de productos indexadas por cod_fabrica (acepta nombres como ' 13100.jpeg')
+photo_library = PhotoLibrary(PHOTOS_DIR, app_config.MAX_FILE_SIZE)
+
+# Catálogo de productos en memoria (se recarga cuando cambia productos.csv)
+catalog = Catalog(storage, app_config)
+
+# Catálogo para los dispositivos: snapshot comprimido por versión y cambios incrementales
+catalog_feed = CatalogFeed(catalog, photo_library)
+
+# Tienda, vendedor, comuna y tipo de cada lugar (para reportes con group_by)
+location_dimensions = LocationDimensions(storage)
+
+# Índice de horarios de puntos de venta y bazares (se recarga si cambian las tablas)
+hours_index = HoursIndex(storage)
+
+# Solicitudes ordenadas e indexadas por estado, tipo y solicitante
+solicitudes_index = SolicitudesIndex(storage)
+
+# Páginas públicas ya renderizadas (se regeneran cuando cambian sus tablas)
+page_cache = PageCache(app, storage,
+                       os.path.join(app_config.BASE_DIR, app_config.PAGE_SNAPSHOT_DIR) if app_config.PAGE_SNAPSHOT_DIR else None)
+
+def cached_page(template, tables=(), extra=(), context=None, snapshot=None):
+    """Responder una página desde el caché de páginas (304 si el navegador ya la tiene)"""
+    etag, html = page_cache.render(template, tables, extra, context, snapshot)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    return with_validators(Response(html, mimetype='text/html'), etag)
 
 # Rutas principales
 @app.route('/')
@@ -89,13 +137,13 @@ def index():
     # Calcular notificaciones de solicitudes pendientes
     pendientes_count = 0
     try:
-        solicitudes = load_csv('solicitudes.csv')
         # Contar solo las que tienen estado "Pendiente"
-        pendientes_count = len([s for s in solicitudes if s.get('estado') == 'Pendiente'])
+        pendientes_count = solicitudes_index.count(estado='Pendiente')
     except:
         pass # Si no hay archivo, el contador queda en 0
         
-    return render_template('index.html', pendientes_count=pendientes_count)
+    return cached_page('index.html', extra=(pendientes_count,),
+                       context=lambda: {'pendientes_count': pendientes_count})
 
 @app.route('/search')
 def search():
@@ -109,28 +157,15 @@ def api_search_product():
     if len(code) == 5 and not code.startswith('BI'):
         potential_code = 'BI6' + code
         # Primero buscar con el código completo
-        productos = load_csv('productos.csv')
-        product = None
-        for p in productos:
-            if p.get('cod_venta', '') == potential_code:
-                product = p
-                code = potential_code  # Actualizar el código para usar el completo
-                break
+        product = catalog.find_sales_code(potential_code)
+        if product:
+            code = potential_code  # Actualizar el código para usar el completo
         
         if product:
-            # Verificar existencia de imagen
-            cod_fabrica = product.get('cod_fabrica', '')
-            image_path = None
-            for ext in ['.jpg', '.jpeg', '.png']:
-                potential_path = os.path.join(PHOTOS_DIR, f"{cod_fabrica}{ext}")
-                if os.path.exists(potential_path):
-                    image_path = f"/static/fotos/{cod_fabrica}{ext}"
-                    break
-            
             return jsonify({
                 'success': True,
                 'product': product,
-                'image': image_path
+                'image': photo_library.image_url(product.get('cod_fabrica', ''))
             })
     
     # Validar formato del código (código original o el completo después de la transformación)
@@ -140,29 +175,14 @@ def api_search_product():
             'message': 'Formato de código inválido. Use código fábrica (3-8 caracteres) o los últimos 5 dígitos del código venta'
         })
     
-    productos = load_csv('productos.csv')
-    
     # Buscar producto
-    product = None
-    for p in productos:
-        if p.get('cod_fabrica', '') == code or p.get('cod_venta', '') == code:
-            product = p
-            break
+    product = catalog.find(code)
     
     if product:
-        # Verificar existencia de imagen
-        cod_fabrica = product.get('cod_fabrica', '')
-        image_path = None
-        for ext in ['.jpg', '.jpeg', '.png']:
-            potential_path = os.path.join(PHOTOS_DIR, f"{cod_fabrica}{ext}")
-            if os.path.exists(potential_path):
-                image_path = f"/static/fotos/{cod_fabrica}{ext}"
-                break
-        
         return jsonify({
             'success': True,
             'product': product,
-            'image': image_path
+            'image': photo_library.image_url(product.get('cod_fabrica', ''))
         })
     else:
         return jsonify({
@@ -194,14 +214,8 @@ def api_record_sale():
     lugar = request.json.get('lugar')
     codigo = request.json.get('codigo', '').strip().upper()
     
-    # Validar producto - usando fieldnames específicos para productos
-    productos = load_csv('productos.csv', fieldnames=['cod_fabrica', 'cod_venta', 'descripcion', 'precio'])
-    
-    product = None
-    for p in productos:
-        if p.get('cod_fabrica') == codigo or p.get('cod_venta') == codigo:
-            product = p
-            break
+    # Validar producto
+    product = catalog.find(codigo)
     
     if not product:
         return jsonify({'success': False, 'message': 'Producto no encontrado'})
@@ -209,31 +223,18 @@ def api_record_sale():
     # Guardar venta
     fecha = datetime.now().strftime('%Y-%m-%d')
     
-    # Limpiar nombre del lugar para el archivo
-    lugar_limpio = "".join(c for c in lugar if c.isalnum() or c in (' ', '-', '_')).rstrip()
-    filename = f"{lugar_limpio}_{fecha}.csv"
-    filepath = os.path.join(SALES_DIR, filename)
-    
-    fieldnames = ['timestamp', 'lugar', 'cod_fabrica', 'cod_venta', 'descripcion', 'precio']
-    
-    # Si el archivo no existe, crearlo con header
-    file_exists = os.path.exists(filepath)
-    
     try:
-        with open(filepath, 'a', newline='', encoding=app_config.CSV_ENCODING) as file:
-            writer = csv.DictWriter(file, fieldnames=fieldnames, delimiter=app_config.CSV_DELIMITER)
-            if not file_exists:
-                writer.writeheader()
-            
-            writer.writerow({
-                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'lugar': lugar,
-                'cod_fabrica': product.get('cod_fabrica', ''),
-                'cod_venta': product.get('cod_venta', ''),
-                'descripcion': product.get('descripcion', ''),
-                'precio': product.get('precio', '')
-            })
+        key = storage.append_sale(lugar, {
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'lugar': lugar,
+            'cod_fabrica': product.get('cod_fabrica', ''),
+            'cod_venta': product.get('cod_venta', ''),
+            'descripcion': product.get('descripcion', ''),
+            'precio': product.get('precio', '')
+        }, fecha)
         
+        sales_metrics.observe_write(key)
+        stock_ledger.observe_write(key)
         return jsonify({'success': True, 'message': 'Venta registrada correctamente'})
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error al guardar: {str(e)}'})
@@ -241,54 +242,50 @@ def api_record_sale():
 
 @app.route('/events')
 def events():
-    # Usar bazares.csv para eventos (con fechas)
-    bazares = load_csv('bazares.csv')
-    
-    # Filtrar bazares activos (fecha término >= fecha actual)
-    from datetime import datetime
+    # Usar bazares.csv para eventos (con fechas), desde el índice de horarios
     hoy = datetime.now().date()
     
-    bazares_activos = []
-    for bazar in bazares:
-        try:
-            # Convertir fecha término de formato dd-mm-yy a objeto date
-            fecha_termino_str = bazar.get('fech_termino', '')
-            if fecha_termino_str:
-                fecha_termino = datetime.strptime(fecha_termino_str, '%d-%m-%y').date()
-                # Solo incluir si la fecha de término es mayor o igual a hoy
-                if fecha_termino >= hoy:
-                    bazares_activos.append(bazar)
-        except (ValueError, TypeError) as e:
-            print(f"Error procesando fecha para bazar {bazar.get('nombrepunto', '')}: {e}")
-            # En caso de error, incluir el bazar por seguridad
-            bazares_activos.append(bazar)
-    
-    print(f"Bazares activos encontrados: {len(bazares_activos)} de {len(bazares)} totales")
-    
-    return render_template('events.html', bazares=bazares_activos)
+    def context():
+        bazares_activos = hours_index.active_bazares(hoy)
+        print(f"Bazares activos encontrados: {len(bazares_activos)} de {len(hours_index.bazares)} totales")
+        return {'bazares': bazares_activos}
+    
+    return cached_page('events.html', tables=('bazares.csv',), extra=(hoy,),
+                       context=context, snapshot='events.html')
+
+@app.route('/api/events')
+def api_events():
+    """Bazares cuyo período se cruza con un rango de fechas"""
+    try:
+        start_date = datetime.strptime(request.args.get('start_date', ''), '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.args.get('end_date', '') or request.args.get('start_date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Fechas inválidas, use YYYY-MM-DD'}), 400
+    
+    return jsonify({'success': True, 'bazares': hours_index.bazares_between(start_date, end_date)})
+
+@app.route('/api/locations/open')
+def api_locations_open():
+    """Puntos de venta y bazares abiertos en un instante (por defecto, ahora)"""
+    at = request.args.get('at')
+    try:
+        at = datetime.fromisoformat(at) if at else datetime.now()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Fecha inválida, use YYYY-MM-DDTHH:MM'}), 400
+    
+    return jsonify({
+        'success': True,
+        'at': at.strftime('%Y-%m-%d %H:%M'),
+        'puntos': hours_index.open_points(at),
+        'bazares': hours_index.open_bazares(at)
+    })
 
 @app.route('/api/save_comment_events', methods=['POST'])
 def api_save_comment_events():
     comment = request.json.get('comment', '').strip()
     if comment:
-        fecha = datetime.now().strftime('%Y-%m-%d')
-        filename = f"commentsventa_{fecha}.csv"
-        filepath = os.path.join(COMMENTS_DIR, filename)
-        
-        fieldnames = ['timestamp', 'comment']
-        file_exists = os.path.exists(filepath)
-        
         try:
-            with open(filepath, 'a', newline='', encoding=app_config.CSV_ENCODING) as file:
-                writer = csv.DictWriter(file, fieldnames=fieldnames, delimiter=app_config.CSV_DELIMITER)
-                if not file_exists:
-                    writer.writeheader()
-                
-                writer.writerow({
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    'comment': comment
-                })
-            
+            storage.append_comment('events', comment)
             return jsonify({'success': True, 'message': 'Comentario guardado'})
         except Exception as e:
             return jsonify({'success': False, 'message': f'Error al guardar: {str(e)}'})
@@ -298,41 +295,105 @@ def api_save_comment_events():
 @app.route('/points')
 def points():
     # Usar puntosventa.csv para puntos de venta (sin fechas)
-    puntos = load_csv('puntosventa.csv')
-    return render_template('points.html', puntos=puntos)
+    return cached_page('points.html', tables=('puntosventa.csv',),
+                       context=lambda: {'puntos': load_csv('puntosventa.csv')}, snapshot='points.html')
 
 @app.route('/api/save_comment_points', methods=['POST'])
 def api_save_comment_points():
     comment = request.json.get('comment', '').strip()
     if comment:
-        fecha = datetime.now().strftime('%Y-%m-%d')
-        filename = f"commentsbazar_{fecha}.csv"
-        filepath = os.path.join(COMMENTS_DIR, filename)
-        
-        fieldnames = ['timestamp', 'comment']
-        file_exists = os.path.exists(filepath)
-        
         try:
-            with open(filepath, 'a', newline='', encoding=app_config.CSV_ENCODING) as file:
-                writer = csv.DictWriter(file, fieldnames=fieldnames, delimiter=app_config.CSV_DELIMITER)
-                if not file_exists:
-                    writer.writeheader()
-                
-                writer.writerow({
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    'comment': comment
-                })
-            
+            storage.append_comment('points', comment)
             return jsonify({'success': True, 'message': 'Comentario guardado'})
         except Exception as e:
             return jsonify({'success': False, 'message': f'Error al guardar: {str(e)}'})
     
     return jsonify({'success': False, 'message': 'Comentario vacío'})
 
+@app.route('/api/comments')
+def api_comments():
+    """Consultar comentarios paginados, filtrados por tipo, fechas y palabras"""
+    if not session.get('authorized'):
+        return jsonify({'error': 'No autorizado'}), 403
+    
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+        per_page = min(100, max(1, int(request.args.get('per_page', app_config.ITEMS_PER_PAGE))))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Paginación inválida'}), 400
+    
+    comments, total = storage.search_comments(
+        query=request.args.get('q', ''),
+        kind=request.args.get('tipo') or None,
+        start_date=request.args.get('start_date') or None,
+        end_date=request.args.get('end_date') or None,
+        page=page,
+        per_page=per_page
+    )
+    return jsonify({
+        'success': True,
+        'comments': comments,
+        'page': page,
+        'per_page': per_page,
+        'total': total
+    })
+
 @app.route('/tutorials')
 def tutorials():
-    tutoriales = load_csv('tutoriales.csv')
-    return render_template('tutorials.html', tutoriales=tutoriales)
+    return cached_page('tutorials.html', tables=('tutoriales.csv',),
+                       context=lambda: {'tutoriales': load_csv('tutoriales.csv')}, snapshot='tutorials.html')
+
+@app.route('/media/tutoriales/<path:filename>')
+def tutorial_media(filename):
+    """Videos y documentos de tutoriales con Range (el celular pide solo el tramo que reproduce)"""
+    path = safe_join(TUTORIALS_DIR, filename)
+    if not path or not os.path.isfile(path):
+        return jsonify({'error': 'Archivo no encontrado'}), 404
+    return send_media(path)
+
+@app.route('/api/tutorials/uploads', methods=['POST'])
+def api_tutorial_upload_start():
+    """Iniciar una subida por partes: {filename, size, sha256} -> {upload_id, offset, chunk_size}"""
+    if not session.get('authorized'):
+        return jsonify({'error': 'No autorizado'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        upload = tutorial_uploads.start(data.get('filename'), data.get('size'), data.get('sha256'))
+    except UploadError as e:
+        return jsonify({'success': False, 'message': str(e)}), e.status
+    return jsonify({'success': True, **upload})
+
+@app.route('/api/tutorials/uploads/<upload_id>', methods=['GET', 'PUT'])
+def api_tutorial_upload(upload_id):
+    """
+    GET: offset ya recibido (para reanudar). PUT: cuerpo crudo con la parte que empieza
+    en ?offset=N (o Content-Range: bytes N-M/total); con la última se verifica el sha256.
+    """
+    if not session.get('authorized'):
+        return jsonify({'error': 'No autorizado'}), 403
+    
+    try:
+        if request.method == 'GET':
+            return jsonify({'success': True, **tutorial_uploads.status(upload_id)})
+        
+        content_range = parse_content_range_header(request.headers.get('Content-Range'))
+        try:
+            offset = content_range.start if content_range else int(request.args.get('offset', ''))
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Indique offset o Content-Range'}), 400
+        # El cuerpo se lee del stream en bloques: la parte nunca se carga entera en memoria
+        upload = tutorial_uploads.write(upload_id, offset, request.stream, request.content_length)
+    except UploadError as e:
+        return jsonify({'success': False, 'message': str(e)}), e.status
+    except Exception as e:
+        print(f"Error en subida {upload_id}: {e}")
+        return jsonify({'success': False, 'message': f'Error al guardar la parte: {str(e)}'}), 500
+    
+    if upload['complete']:
+        upload['url'] = f"/media/tutoriales/{upload['filename']}"
+        print(f"Tutorial subido: {upload['filename']} ({upload['size']} bytes)")
+    return jsonify({'success': True, **upload})
 
 @app.route('/info')
 def info():
@@ -376,23 +437,19 @@ def get_sales_summary():
     locations_active = set()
     
     # Buscar archivos de ventas de hoy
-    for filename in os.listdir(SALES_DIR):
-        if today in filename:
-            filepath = os.path.join(SALES_DIR, filename)
-            location = filename.replace(f'_{today}.csv', '')
-            locations_active.add(location)
-            
-            try:
-                with open(filepath, 'r', encoding=app_config.CSV_ENCODING) as file:
-                    reader = csv.DictReader(file, delimiter=app_config.CSV_DELIMITER)
-                    for row in reader:
-                        total_sales += 1
-                        # Limpiar y convertir precio
-                        precio = str(row.get('precio', '0')).replace('$', '').replace('.', '').strip()
-                        if precio.isdigit():
-                            total_amount += int(precio)
-            except Exception as e:
-                print(f"Error procesando {filename}: {e}")
+    for source in storage.day_sources(today):
+        location = source.filename.replace(f'_{today}.csv', '')
+        locations_active.add(location)
+        
+        try:
+            for row in source.rows(app_config.CSV_DELIMITER):
+                total_sales += 1
+                # Limpiar y convertir precio
+                precio = str(row.get('precio', '0')).replace('$', '').replace('.', '').strip()
+                if precio.isdigit():
+                    total_amount += int(precio)
+        except Exception as e:
+            print(f"Error procesando {source.filename}: {e}")
     
     return {
         'total_sales': total_sales,
@@ -406,60 +463,50 @@ def get_top_products(limit=5):
     today = datetime.now().strftime('%Y-%m-%d')
     product_sales = {}
     
-    for filename in os.listdir(SALES_DIR):
-        if today in filename:
-            filepath = os.path.join(SALES_DIR, filename)
-            try:
-                with open(filepath, 'r', encoding=app_config.CSV_ENCODING) as file:
-                    reader = csv.DictReader(file, delimiter=app_config.CSV_DELIMITER)
-                    for row in reader:
-                        product_code = row.get('cod_venta') or row.get('cod_fabrica', '')
-                        if product_code:
-                            if product_code in product_sales:
-                                product_sales[product_code]['count'] += 1
-                            else:
-                                # Buscar información del producto
-                                productos = load_csv('productos.csv', fieldnames=['cod_fabrica', 'cod_venta', 'descripcion', 'precio'])
-                                product_info = next((p for p in productos if p.get('cod_fabrica') == product_code or p.get('cod_venta') == product_code), {})
-                                product_sales[product_code] = {
-                                    'count': 1,
-                                    'description': product_info.get('descripcion', 'Producto no encontrado'),
-                                    'price': product_info.get('precio', 0)
-                                }
-            except Exception as e:
-                print(f"Error procesando {filename}: {e}")
-    
-    # Ordenar por cantidad vendida
-    sorted_products = sorted(product_sales.items(), key=lambda x: x[1]['count'], reverse=True)
-    return sorted_products[:limit]
+    for source in storage.day_sources(today):
+        try:
+            for row in source.rows(app_config.CSV_DELIMITER):
+                product_code = row.get('cod_venta') or row.get('cod_fabrica', '')
+                if product_code:
+                    if product_code in product_sales:
+                        product_sales[product_code]['count'] += 1
+                    else:
+                        # Buscar información del producto
+                        product_info = catalog.find(product_code) or {}
+                        product_sales[product_code] = {
+                            'count': 1,
+                            'description': product_info.get('descripcion', 'Producto no encontrado'),
+                            'price': product_info.get('precio', 0)
+                        }
+        except Exception as e:
+            print(f"Error procesando {source.filename}: {e}")
+    
+    # Los más vendidos sin ordenar la lista completa
+    return top_k(product_sales.items(), limit, key=lambda x: x[1]['count'])
 
 def get_sales_by_location():
     """Ventas por ubicación del día"""
     today = datetime.now().strftime('%Y-%m-%d')
     location_sales = {}
     
-    for filename in os.listdir(SALES_DIR):
-        if today in filename:
-            filepath = os.path.join(SALES_DIR, filename)
-            location = filename.replace(f'_{today}.csv', '')
-            total_amount = 0
-            total_sales = 0
-            
-            try:
-                with open(filepath, 'r', encoding=app_config.CSV_ENCODING) as file:
-                    reader = csv.DictReader(file, delimiter=app_config.CSV_DELIMITER)
-                    for row in reader:
-                        total_sales += 1
-                        precio = str(row.get('precio', '0')).replace('$', '').replace('.', '').strip()
-                        if precio.isdigit():
-                            total_amount += int(precio)
-            except Exception as e:
-                print(f"Error procesando {filename}: {e}")
-            
-            location_sales[location] = {
-                'total_sales': total_sales,
-                'total_amount': total_amount
-            }
+    for source in storage.day_sources(today):
+        location = source.filename.replace(f'_{today}.csv', '')
+        total_amount = 0
+        total_sales = 0
+        
+        try:
+            for row in source.rows(app_config.CSV_DELIMITER):
+                total_sales += 1
+                precio = str(row.get('precio', '0')).replace('$', '').replace('.', '').strip()
+                if precio.isdigit():
+                    total_amount += int(precio)
+        except Exception as e:
+            print(f"Error procesando {source.filename}: {e}")
+        
+        location_sales[location] = {
+            'total_sales': total_sales,
+            'total_amount': total_amount
+        }
     
     return location_sales
 
@@ -468,43 +515,54 @@ def get_recent_activity():
     today = datetime.now().strftime('%Y-%m-%d')
     recent_sales = []
     
-    for filename in os.listdir(SALES_DIR):
-        if today in filename:
-            filepath = os.path.join(SALES_DIR, filename)
-            location = filename.replace(f'_{today}.csv', '')
-            
-            try:
-                with open(filepath, 'r', encoding=app_config.CSV_ENCODING) as file:
-                    reader = csv.DictReader(file, delimiter=app_config.CSV_DELIMITER)
-                    rows = list(reader)
-                    # Tomar las últimas 5 ventas de este archivo
-                    for row in rows[-5:]:
-                        recent_sales.append({
-                            'location': location,
-                            'product': row.get('cod_venta') or row.get('cod_fabrica', ''),
-                            'description': row.get('descripcion', ''),
-                            'price': row.get('precio', '0'),
-                            'timestamp': row.get('timestamp', '')
-                        })
-            except Exception as e:
-                print(f"Error procesando {filename}: {e}")
+    for source in storage.day_sources(today):
+        location = source.filename.replace(f'_{today}.csv', '')
+        
+        try:
+            rows = list(source.rows(app_config.CSV_DELIMITER))
+            # Tomar las últimas 5 ventas de este archivo
+            for row in rows[-5:]:
+                recent_sales.append({
+                    'location': location,
+                    'product': row.get('cod_venta') or row.get('cod_fabrica', ''),
+                    'description': row.get('descripcion', ''),
+                    'price': row.get('precio', '0'),
+                    'timestamp': row.get('timestamp', '')
+                })
+        except Exception as e:
+            print(f"Error procesando {source.filename}: {e}")
     
     # Ordenar por timestamp y tomar las 5 más recientes
     recent_sales.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
     return recent_sales[:5]
 
-def get_performance_metrics():
-    """Métricas de rendimiento"""
-    today = datetime.now()
-    week_ago = today - timedelta(days=7)
+@app.route('/api/stock')
+def api_stock():
+    """Stock por código de un lugar (?lugar=) o total por lugar"""
+    if not session.get('authorized'):
+        return jsonify({'error': 'No autorizado'}), 403
     
-    # Esta es una implementación básica - se puede expandir
-    return {
-        'avg_daily_sales': 150000,  # Ejemplo - implementar cálculo real
-        'best_selling_category': 'Jeans',
-        'peak_hour': '16:00-17:00',
-        'conversion_rate': '68%'
-    }
+    lugar = request.args.get('lugar', '').strip()
+    try:
+        if lugar:
+            items = stock_ledger.location_stock(lugar)
+            for item in items:
+                item['descripcion'] = (catalog.find(item['cod_venta']) or {}).get('descripcion', '')
+            return jsonify({'success': True, 'lugar': lugar, 'items': items})
+        return jsonify({'success': True, 'locations': stock_ledger.summary()})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error obteniendo stock: {str(e)}'})
+
+def get_performance_metrics(location=None):
+    """Métricas de rendimiento (hora peak, día peak, promedios y tendencia) desde los histogramas"""
+    return sales_metrics.performance(location=location)
+
+@app.route('/api/performance_metrics')
+def api_performance_metrics():
+    if not session.get('authorized'):
+        return jsonify({'error': 'No autorizado'}), 403
+    
+    return jsonify(get_performance_metrics(request.args.get('lugar') or None))
 
 
 @app.route('/api/authorize', methods=['POST'])
@@ -524,8 +582,8 @@ def under_construction():
 # =============================================================================
 # NUEVAS FUNCIONES PARA REPORTES AVANZADOS
 # =============================================================================
-def get_period_data(period):
-    """Obtener datos para períodos predefinidos - Versión corregida"""
+def period_range(period):
+    """Fechas (inicio, fin) de un período predefinido"""
     today = datetime.now().date()
     
     if period == 'today':
@@ -545,150 +603,79 @@ def get_period_data(period):
     else:
         start_date = today
         end_date = today
+    return start_date, end_date
+
+def get_period_data(period, mode='exact', group_by=None, products=True):
+    """Obtener datos para períodos predefinidos - Versión corregida"""
+    start_date, end_date = period_range(period)
     
     # Usar la misma función que para rangos personalizados
-    return get_sales_data_by_date_range(start_date, end_date)
+    return get_sales_data_by_date_range(start_date, end_date, mode, group_by, products)
 
 
 
 
-def get_sales_data_by_date_range(start_date, end_date):
-    """Obtener datos de ventas y devoluciones para un rango de fechas específico - Versión mejorada"""
-    total_sales = 0
-    total_returns = 0
-    total_amount = 0
-    locations_active = set()
-    daily_data = {}
-    product_sales = {}
-    location_sales = {}
-    
+def get_sales_data_by_date_range(start_date, end_date, mode='exact', group_by=None, products=True):
+    """
+    Obtener datos de ventas y devoluciones para un rango de fechas específico - Versión mejorada.
+    Con mode='approx' los productos se resumen en memoria acotada (para rangos muy largos).
+    Con group_by (store, seller, comuna o tipo) se agregan además los lugares por esa dimensión.
+    Con products=False el reporte sale sin top de productos y los meses archivados no se leen.
+    """
     # Convertir fechas a objetos datetime si son strings
     if isinstance(start_date, str):
         start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
     if isinstance(end_date, str):
         end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
     
-    # Cargar productos para obtener descripciones
-    productos = load_csv('productos.csv', fieldnames=['cod_fabrica', 'cod_venta', 'descripcion', 'precio'])
+    # Agregación por fragmentos (en paralelo para rangos largos)
+    partial = aggregate_range(
+        storage, start_date, end_date,
+        workers=app_config.REPORT_WORKERS,
+        min_parallel_days=app_config.REPORT_PARALLEL_MIN_DAYS,
+        delimiter=app_config.CSV_DELIMITER,
+        product_capacity=app_config.TOPK_SKETCH_CAPACITY if mode == 'approx' else None,
+        products=products
+    )
+    return build_report(partial, start_date, end_date, group_by)
+
+def build_report(partial, start_date, end_date, group_by=None):
+    """Armar el reporte (totales, top productos/ubicaciones y gráficos) desde un acumulador de reports.py"""
+    daily_data = {}
+    product_sales = {}
+    location_sales = {}
+    total_sales = partial['total_sales']
+    total_returns = partial['total_returns']
+    total_amount = partial['total_amount']
+    locations_active = partial['locations']
     
     current_date = start_date
     while current_date <= end_date:
         date_str = current_date.strftime('%Y-%m-%d')
-        daily_sales = 0
-        daily_returns = 0
-        daily_amount = 0
-        daily_locations = set()
-        
-        # Procesar archivos de ventas de esta fecha
-        for filename in os.listdir(SALES_DIR):
-            if date_str in filename and not filename.startswith('devoluciones_'):
-                filepath = os.path.join(SALES_DIR, filename)
-                location = filename.replace(f'_{date_str}.csv', '')
-                daily_locations.add(location)
-                locations_active.add(location)
-                
-                try:
-                    with open(filepath, 'r', encoding=app_config.CSV_ENCODING) as file:
-                        reader = csv.DictReader(file, delimiter=app_config.CSV_DELIMITER)
-                        for row in reader:
-                            total_sales += 1
-                            daily_sales += 1
-                            
-                            # Procesar producto
-                            product_code = row.get('cod_venta') or row.get('cod_fabrica', '')
-                            if product_code:
-                                if product_code not in product_sales:
-                                    # Buscar descripción del producto
-                                    descripcion = next((p.get('descripcion', '') for p in productos 
-                                                      if p.get('cod_venta') == product_code or p.get('cod_fabrica') == product_code), product_code)
-                                    product_sales[product_code] = {
-                                        'description': descripcion,
-                                        'sales_count': 0,
-                                        'returns_count': 0,
-                                        'amount': 0
-                                    }
-                                product_sales[product_code]['sales_count'] += 1
-                            
-                            # Procesar ubicación
-                            if location not in location_sales:
-                                location_sales[location] = {
-                                    'sales_count': 0,
-                                    'returns_count': 0,
-                                    'amount': 0
-                                }
-                            location_sales[location]['sales_count'] += 1
-                            
-                            # Procesar monto
-                            precio = str(row.get('precio', '0')).replace('$', '').replace('.', '').strip()
-                            if precio.isdigit():
-                                amount = int(precio)
-                                total_amount += amount
-                                daily_amount += amount
-                                if product_code:
-                                    product_sales[product_code]['amount'] += amount
-                                location_sales[location]['amount'] += amount
-                except Exception as e:
-                    print(f"Error procesando {filename}: {e}")
-        
-        # Procesar archivos de devoluciones de esta fecha
-        returns_filename = f"devoluciones_{date_str}.csv"
-        returns_filepath = os.path.join(SALES_DIR, returns_filename)
-        if os.path.exists(returns_filepath):
-            try:
-                with open(returns_filepath, 'r', encoding=app_config.CSV_ENCODING) as file:
-                    reader = csv.DictReader(file, delimiter=app_config.CSV_DELIMITER)
-                    for row in reader:
-                        total_returns += 1
-                        daily_returns += 1
-                        
-                        # Procesar producto en devolución
-                        product_code = row.get('cod_venta') or row.get('cod_fabrica', '')
-                        location = row.get('lugar', '')
-                        
-                        if product_code:
-                            if product_code not in product_sales:
-                                descripcion = next((p.get('descripcion', '') for p in productos 
-                                                  if p.get('cod_venta') == product_code or p.get('cod_fabrica') == product_code), product_code)
-                                product_sales[product_code] = {
-                                    'description': descripcion,
-                                    'sales_count': 0,
-                                    'returns_count': 0,
-                                    'amount': 0
-                                }
-                            product_sales[product_code]['returns_count'] += 1
-                        
-                        # Procesar ubicación en devolución
-                        if location and location not in location_sales:
-                            location_sales[location] = {
-                                'sales_count': 0,
-                                'returns_count': 0,
-                                'amount': 0
-                            }
-                        if location:
-                            location_sales[location]['returns_count'] += 1
-                        
-                        # Procesar monto de devolución
-                        precio = str(row.get('precio', '0')).replace('$', '').replace('.', '').strip()
-                        if precio.lstrip('-').isdigit():
-                            amount = int(precio)
-                            total_amount += amount
-                            daily_amount += amount
-                            if product_code:
-                                product_sales[product_code]['amount'] += amount
-                            if location:
-                                location_sales[location]['amount'] += amount
-            except Exception as e:
-                print(f"Error procesando {returns_filename}: {e}")
-        
+        sales, returns, amount, locations = partial['daily'].get(date_str, [0, 0, 0, set()])
         daily_data[date_str] = {
-            'sales': daily_sales,
-            'returns': daily_returns,
-            'amount': daily_amount,
-            'locations': len(daily_locations)
+            'sales': sales,
+            'returns': returns,
+            'amount': amount,
+            'locations': len(locations)
         }
-        
         current_date += timedelta(days=1)
     
+    for code, (sales_count, returns_count, amount) in partial['products'].items():
+        product_sales[code] = {
+            'description': (catalog.find(code) or {}).get('descripcion', code),
+            'sales_count': sales_count,
+            'returns_count': returns_count,
+            'amount': amount
+        }
+    
+    for location, (sales_count, returns_count, amount) in partial['location_sales'].items():
+        location_sales[location] = {
+            'sales_count': sales_count,
+            'returns_count': returns_count,
+            'amount': amount
+        }
+    
     net_sales = total_sales - total_returns
     
     # Preparar datos para top productos (ordenar por monto)
@@ -702,10 +689,9 @@ def get_sales_data_by_date_range(start_date, end_date):
                 'amount': info['amount']
             }])
     
-    # Ordenar por monto (descendente)
-    top_products_all.sort(key=lambda x: x[1]['amount'], reverse=True)
-    top_5_products = top_products_all[:5]
-    top_10_products = top_products_all[:10]
+    # Seleccionar los 10 de mayor monto sin ordenar la lista completa
+    top_10_products = top_k(top_products_all, 10, key=lambda x: x[1]['amount'])
+    top_5_products = top_10_products[:5]
     
     # Preparar datos para gráfico de top productos
     top_products_chart = {
@@ -723,7 +709,14 @@ def get_sales_data_by_date_range(start_date, end_date):
                 'amount': info['amount']
             }
     
-    return {
+    # Top 5 ubicaciones por monto
+    top_5_locations = top_k(location_sales_clean.items(), 5, key=lambda x: x[1]['amount'])
+    top_locations_chart = {
+        'names': [location for location, info in top_5_locations],
+        'amounts': [info['amount'] for location, info in top_5_locations]
+    }
+    
+    report = {
         'total_sales': total_sales,
         'total_returns': total_returns,
         'net_sales': net_sales,
@@ -744,9 +737,14 @@ def get_sales_data_by_date_range(start_date, end_date):
                 'amounts': [daily_data[date]['amount'] for date in sorted(daily_data.keys())]
             },
             'top_products': top_products_chart,
-            'top_locations': {'names': [], 'amounts': []}  # Se puede implementar si es necesario
+            'top_locations': top_locations_chart
         }
     }
+    if group_by:
+        # Lugares agrupados por tienda/vendedor/comuna/tipo (sumados por clave entera)
+        report['group_by'] = group_by
+        report['groups'] = location_dimensions.group_counters(partial['location_sales'], group_by)
+    return report
 
 # =============================================================================
 # NUEVAS RUTAS PARA REPORTES AVANZADOS
@@ -760,22 +758,155 @@ def api_reports():
     period = request.args.get('period', 'today')
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
+    mode = 'approx' if request.args.get('mode') == 'approx' else 'exact'
+    products = request.args.get('products') != '0'  # ?products=0: solo totales, sin top de productos
+    group_by = request.args.get('group_by') or None
+    if group_by and group_by not in DIMENSIONS:
+        return jsonify({'success': False, 'message': f"group_by debe ser uno de: {', '.join(DIMENSIONS)}"}), 400
     
     print(f"Solicitud de reporte - Periodo: {period}, Start: {start_date}, End: {end_date}")  # Debug
     
+    # Validador: archivos del rango (y catálogo, por las descripciones); 304 sin agregar nada
+    try:
+        if start_date and end_date and period == 'custom':
+            date_range = (datetime.strptime(start_date, '%Y-%m-%d').date(),
+                          datetime.strptime(end_date, '%Y-%m-%d').date())
+        else:
+            date_range = period_range(period)
+        etag, last_modified = data_validators(
+            [storage.range_version(*date_range), storage.table_version(CATALOG_TABLE)] + dimension_versions(group_by),
+            datetime.now().strftime('%Y-%m-%d'))
+    except ValueError:
+        etag, last_modified = None, None
+    if etag:
+        cached = not_modified(request, etag, last_modified)
+        if cached is not None:
+            return cached
+    
     if start_date and end_date and period == 'custom':
         # Usar rango personalizado
-        data = get_sales_data_by_date_range(start_date, end_date)
+        data = get_sales_data_by_date_range(start_date, end_date, mode, group_by, products)
     else:
         # Usar período predefinido
-        data = get_period_data(period)
+        data = get_period_data(period, mode, group_by, products)
     
     print(f"Datos devueltos - Ventas: {data.get('total_sales')}, Devoluciones: {data.get('total_returns')}")  # Debug
     print(f"Top productos: {len(data.get('top_products', []))}")  # Debug
     print(f"Ubicaciones: {len(data.get('location_sales', {}))}")  # Debug
     
+    if etag:
+        return with_validators(jsonify(data), etag, last_modified)
     return jsonify(data)
 
+def dimension_versions(group_by):
+    """Versiones de las tablas de las que salen los grupos (si el reporte agrupa)"""
+    return [storage.table_version(name) for name in STORE_TABLES + (SELLERS_TABLE,)] if group_by else []
+
+COMPARE_METRICS = ['total_sales', 'total_returns', 'net_sales', 'total_amount', 'active_locations']
+MAX_COMPARE_RANGES = 6
+
+def parse_compare_range(value):
+    """'YYYY-MM-DD:YYYY-MM-DD' o un período predefinido (today, week, month, year) a (inicio, fin)"""
+    if ':' in value:
+        start, end = value.split(':', 1)
+        start_date = datetime.strptime(start.strip(), '%Y-%m-%d').date()
+        end_date = datetime.strptime(end.strip(), '%Y-%m-%d').date()
+        if end_date < start_date:
+            raise ValueError(f'Rango invertido: {value}')
+        return start_date, end_date
+    if value in ('today', 'week', 'month', 'year'):
+        return period_range(value)
+    raise ValueError(f'Rango inválido: {value}')
+
+@app.route('/api/reports/compare')
+def api_reports_compare():
+    """
+    Comparar varios períodos: ?range=2026-10-12:2026-10-18&range=2026-10-05:2026-10-11
+    (o ?range=week). Los archivos de la unión de los rangos se leen una sola vez; cada
+    período trae su reporte y `deltas` tiene la diferencia del primero respecto de cada
+    uno de los demás (ej: esta semana contra la anterior). Con ?products=0 los períodos
+    salen sin top de productos y los meses archivados se suman desde sus totales.
+    """
+    if not session.get('authorized'):
+        return jsonify({'error': 'No autorizado'}), 403
+    
+    try:
+        ranges = [parse_compare_range(value.strip()) for value in request.args.getlist('range') if value.strip()]
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'{str(e)}. Use YYYY-MM-DD:YYYY-MM-DD'}), 400
+    if not 2 <= len(ranges) <= MAX_COMPARE_RANGES:
+        return jsonify({'success': False, 'message': f'Indique entre 2 y {MAX_COMPARE_RANGES} rangos'}), 400
+    group_by = request.args.get('group_by') or None
+    if group_by and group_by not in DIMENSIONS:
+        return jsonify({'success': False, 'message': f"group_by debe ser uno de: {', '.join(DIMENSIONS)}"}), 400
+    
+    etag, last_modified = data_validators(
+        [storage.range_version(start, end) for start, end in ranges] + [storage.table_version(CATALOG_TABLE)]
+        + dimension_versions(group_by),
+        datetime.now().strftime('%Y-%m-%d'))
+    cached = not_modified(request, etag, last_modified)
+    if cached is not None:
+        return cached
+    
+    partials = aggregate_ranges(
+        storage, ranges,
+        workers=app_config.REPORT_WORKERS,
+        min_parallel_days=app_config.REPORT_PARALLEL_MIN_DAYS,
+        delimiter=app_config.CSV_DELIMITER,
+        products=request.args.get('products') != '0'
+    )
+    periods = [build_report(partial, start, end, group_by) for partial, (start, end) in zip(partials, ranges)]
+    
+    # Diferencias del primer período respecto de cada uno de los demás
+    base = periods[0]
+    deltas = []
+    for period in periods[1:]:
+        delta = {}
+        for metric in COMPARE_METRICS:
+            diff = base[metric] - period[metric]
+            delta[metric] = {
+                'diff': diff,
+                'pct': round(diff * 100 / period[metric], 1) if period[metric] else None
+            }
+        deltas.append(delta)
+    
+    return with_validators(jsonify({'success': True, 'periods': periods, 'deltas': deltas}), etag, last_modified)
+
+@app.route('/api/analytics/trends')
+def api_analytics_trends():
+    """
+    Tendencias de un rango (por defecto los últimos 90 días): monto diario con media
+    móvil de `window` días, comparación con las mismas fechas 52 semanas antes y
+    ranking de lugares con su crecimiento respecto del período anterior.
+    """
+    if not session.get('authorized'):
+        return jsonify({'error': 'No autorizado'}), 403
+    
+    today = datetime.now().date()
+    try:
+        end_date = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date() if request.args.get('end_date') else today
+        start_date = (datetime.strptime(request.args['start_date'], '%Y-%m-%d').date() if request.args.get('start_date')
+                      else end_date - timedelta(days=89))
+        window = int(request.args.get('window', 7))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Parámetros inválidos (fechas YYYY-MM-DD, window entero)'}), 400
+    if start_date > end_date:
+        return jsonify({'success': False, 'message': 'La fecha de inicio es posterior a la de término'}), 400
+    if (end_date - start_date).days + 1 > app_config.ANALYTICS_MAX_DAYS:
+        return jsonify({'success': False, 'message': f'El rango no puede superar {app_config.ANALYTICS_MAX_DAYS} días'}), 400
+    if not 1 <= window <= 365:
+        return jsonify({'success': False, 'message': 'window debe estar entre 1 y 365'}), 400
+    
+    # Solo cambia con los movimientos de hoy: los días cerrados ya están en la matriz
+    etag, last_modified = data_validators([storage.range_version(today, today)], today.strftime('%Y-%m-%d'))
+    cached = not_modified(request, etag, last_modified)
+    if cached is not None:
+        return cached
+    
+    data = trend_matrix.trends(start_date, end_date, window)
+    data['success'] = True
+    return with_validators(jsonify(data), etag, last_modified)
+
 # Mantener la ruta original del dashboard para compatibilidad
 @app.route('/api/dashboard_data')
 def api_dashboard_data():
@@ -784,8 +915,191 @@ def api_dashboard_data():
     
     # Por defecto mostrar datos del día actual
     data = get_period_data('today')
+    data['performance_metrics'] = get_performance_metrics()
     return jsonify(data)
 
+@app.route('/api/export')
+def api_export():
+    """Exportar ventas y devoluciones de un rango (CSV o XLSX) en streaming"""
+    if not session.get('authorized'):
+        return jsonify({'error': 'No autorizado'}), 403
+    
+    export_format = request.args.get('format', 'csv').lower()
+    try:
+        start_date = datetime.strptime(request.args.get('start_date', ''), '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.args.get('end_date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Fechas inválidas, use YYYY-MM-DD'}), 400
+    if start_date > end_date:
+        return jsonify({'success': False, 'message': 'La fecha de inicio es posterior a la de término'}), 400
+    if export_format not in ('csv', 'xlsx'):
+        return jsonify({'success': False, 'message': 'Formato no soportado (csv o xlsx)'}), 400
+    
+    rows = iter_export_rows(storage, start_date, end_date, app_config.CSV_DELIMITER)
+    filename = f"movimientos_{start_date.strftime('%Y-%m-%d')}_{end_date.strftime('%Y-%m-%d')}.{export_format}"
+    if export_format == 'xlsx':
+        body = stream_xlsx(rows)
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    else:
+        body = stream_csv(rows, app_config.CSV_DELIMITER)
+        mimetype = 'text/csv; charset=utf-8'
+    
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+@app.route('/api/catalog/upload', methods=['POST'])
+def api_catalog_upload():
+    """Validar y publicar un productos.csv nuevo (dry_run=1 solo muestra la diferencia)"""
+    if not session.get('authorized'):
+        return jsonify({'error': 'No autorizado'}), 403
+    
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'success': False, 'message': 'No se envió archivo'}), 400
+    dry_run = request.args.get('dry_run', request.form.get('dry_run', '')) in ('1', 'true')
+    
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    try:
+        result = catalog.upload(stream, origin=f"web:{upload.filename}", dry_run=dry_run)
+    except CatalogError as e:
+        return jsonify({'success': False, 'message': str(e), 'errors': e.errors, 'error_count': e.total}), 400
+    except UnicodeDecodeError:
+        return jsonify({'success': False, 'message': 'El archivo debe estar en UTF-8'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error al publicar catálogo: {str(e)}'}), 500
+    
+    return jsonify({'success': True, **result})
+
+@app.route('/api/admin/profiling', methods=['GET', 'POST', 'DELETE'])
+def api_admin_profiling():
+    """
+    GET: estado y perfiles guardados. POST {pattern, count, tracemalloc}: perfilar las
+    próximas `count` peticiones cuya ruta coincida con `pattern` (ej: '/api/reports*').
+    DELETE: desarmar.
+    """
+    if not session.get('authorized'):
+        return jsonify({'error': 'No autorizado'}), 403
+    
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        pattern = str(data.get('pattern', '')).strip()
+        try:
+            count = int(data.get('count', 1))
+        except (TypeError, ValueError):
+            count = 0
+        if not pattern.startswith('/'):
+            return jsonify({'success': False, 'message': 'El patrón debe empezar con / (ej: /api/reports*)'}), 400
+        if not 1 <= count <= app_config.PROFILE_MAX_REQUESTS:
+            return jsonify({'success': False, 'message': f'count debe estar entre 1 y {app_config.PROFILE_MAX_REQUESTS}'}), 400
+        state = request_profiler.arm(pattern, count, trace_memory=bool(data.get('tracemalloc')))
+        print(f"Perfilador armado: {pattern} x{count}")
+        return jsonify({'success': True, 'armed': state})
+    
+    if request.method == 'DELETE':
+        request_profiler.disarm()
+        return jsonify({'success': True, 'armed': None})
+    
+    return jsonify({'success': True, 'armed': request_profiler.state(), 'profiles': request_profiler.list_profiles()})
+
+@app.route('/api/admin/admission')
+def api_admin_admission():
+    """Peticiones en curso, en espera, admitidas y rechazadas por clase (en este worker)"""
+    if not session.get('authorized'):
+        return jsonify({'error': 'No autorizado'}), 403
+    return jsonify({'success': True, 'pid': os.getpid(), 'classes': admission.stats()})
+
+@app.route('/api/admin/snapshots', methods=['GET', 'POST'])
+def api_admin_snapshots():
+    """GET: snapshots existentes. POST: tomar un snapshot incremental de los datos."""
+    if not session.get('authorized'):
+        return jsonify({'error': 'No autorizado'}), 403
+    
+    if request.method == 'POST':
+        try:
+            result = snapshot_store.create()
+        except SnapshotError as e:
+            return jsonify({'success': False, 'message': str(e)}), 409
+        except Exception as e:
+            print(f"Error tomando snapshot: {e}")
+            return jsonify({'success': False, 'message': f'Error al tomar snapshot: {str(e)}'}), 500
+        return jsonify({'success': True, 'snapshot': result})
+    
+    return jsonify({'success': True, 'snapshots': snapshot_store.list()})
+
+@app.route('/api/admin/profiling/<filename>')
+def api_admin_profile_file(filename):
+    """Descargar un perfil (.prof para pstats/snakeviz, .txt con el resumen)"""
+    if not session.get('authorized'):
+        return jsonify({'error': 'No autorizado'}), 403
+    
+    path = request_profiler.profile_path(filename)
+    if not path:
+        return jsonify({'error': 'Perfil no encontrado'}), 404
+    if filename.endswith('.txt'):
+        return send_file(path, mimetype='text/plain; charset=utf-8')
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True, download_name=filename)
+
+@app.route('/api/catalog/snapshot')
+def api_catalog_snapshot():
+    """Catálogo completo compacto (gzip si el cliente lo acepta) con su versión, para consulta local"""
+    etag, body, compressed = catalog_feed.snapshot()
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    
+    if 'gzip' in request.accept_encodings:
+        response = Response(compressed, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(body, mimetype='application/json')
+    response.headers['Vary'] = 'Accept-Encoding'
+    return with_validators(response, etag)
+
+@app.route('/api/catalog/delta')
+def api_catalog_delta():
+    """Productos nuevos o modificados y códigos eliminados desde ?since=<versión>"""
+    try:
+        since = int(request.args.get('since', ''))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Indique since con la versión del catálogo local'}), 400
+    return jsonify({'success': True, **catalog_feed.delta(since)})
+
+@app.route('/api/photos/ingest', methods=['POST'])
+def api_photos_ingest():
+    """
+    Ingerir fotos de productos: un zip en `file` o varias imágenes en `files`. Se nombran
+    por cod_fabrica, se descartan las repetidas (sha256) y se informan los códigos que no
+    están en el catálogo (dry_run=1 solo muestra lo que se haría).
+    """
+    if not session.get('authorized'):
+        return jsonify({'error': 'No autorizado'}), 403
+    
+    dry_run = request.args.get('dry_run', request.form.get('dry_run', '')) in ('1', 'true')
+    archive = request.files.get('file')
+    images = [upload for upload in request.files.getlist('files') if upload.filename]
+    if not images and not (archive and archive.filename):
+        return jsonify({'success': False, 'message': 'Envíe un zip en file o imágenes en files'}), 400
+    
+    # Werkzeug deja las partes grandes en archivos temporales: se leen en bloques, no enteras
+    items = [(upload.filename, upload.stream) for upload in images]
+    try:
+        if archive and archive.filename:
+            result = photo_library.ingest(iter_zip(archive.stream), catalog, dry_run=dry_run)
+        else:
+            result = photo_library.ingest(items, catalog, dry_run=dry_run)
+    except zipfile.BadZipFile:
+        return jsonify({'success': False, 'message': 'El archivo no es un zip válido'}), 400
+    except Exception as e:
+        print(f"Error en ingesta de fotos: {e}")
+        return jsonify({'success': False, 'message': f'Error al ingerir fotos: {str(e)}'}), 500
+    
+    print(f"Fotos: {result['added']} agregadas, {result['replaced']} reemplazadas, "
+          f"{result['duplicate']} duplicadas, {result['missing']} sin producto")
+    return jsonify({'success': True, **result})
+
 def get_all_daily_sales(lugar):
     """Obtener todas las ventas del día para un lugar específico"""
     today = datetime.now().strftime('%Y-%m-%d')
@@ -793,31 +1107,23 @@ def get_all_daily_sales(lugar):
     total_amount = 0
     total_sales = 0
     
-    # Limpiar nombre del lugar para el archivo
-    lugar_limpio = "".join(c for c in lugar if c.isalnum() or c in (' ', '-', '_')).rstrip()
-    filename = f"{lugar_limpio}_{today}.csv"
-    filepath = os.path.join(SALES_DIR, filename)
-    
-    if os.path.exists(filepath):
-        try:
-            with open(filepath, 'r', encoding=app_config.CSV_ENCODING) as file:
-                reader = csv.DictReader(file, delimiter=app_config.CSV_DELIMITER)
-                for row in reader:
-                    sales_data.append({
-                        'cod_fabrica': row.get('cod_fabrica', ''),
-                        'cod_venta': row.get('cod_venta', ''),
-                        'descripcion': row.get('descripcion', ''),
-                        'precio': row.get('precio', '0'),
-                        'timestamp': row.get('timestamp', '')
-                    })
-                    total_sales += 1
-                    precio = str(row.get('precio', '0')).replace('$', '').replace('.', '').strip()
-                    if precio.isdigit():
-                        total_amount += int(precio)
-        except Exception as e:
-            print(f"Error leyendo archivo diario {filename}: {e}")
+    try:
+        for row in storage.sales_rows(lugar, today):
+            sales_data.append({
+                'cod_fabrica': row.get('cod_fabrica', ''),
+                'cod_venta': row.get('cod_venta', ''),
+                'descripcion': row.get('descripcion', ''),
+                'precio': row.get('precio', '0'),
+                'timestamp': row.get('timestamp', '')
+            })
+            total_sales += 1
+            precio = str(row.get('precio', '0')).replace('$', '').replace('.', '').strip()
+            if precio.isdigit():
+                total_amount += int(precio)
+    except Exception as e:
+        print(f"Error leyendo ventas del día de {lugar}: {e}")
     
-        return {
+    return {
         'sales_data': sales_data,
         'total_amount': total_amount,
         'total_sales': total_sales,
@@ -843,6 +1149,17 @@ def api_get_all_daily_sales(lugar):
 # FUNCIONALIDAD DE DEVOLUCIONES
 # =============================================================================
 
+def record_return(lugar, product, row, fecha):
+    """
+    Registrar una devolución si quedan unidades del producto vendidas en el lugar dentro
+    de la ventana de devoluciones y aún no devueltas. Retorna (unidades que quedaban, clave o None).
+    """
+    code = product.get('cod_venta') or product.get('cod_fabrica', '')
+    available, key = stock_ledger.record_return(lugar, code, lambda: storage.append_return(row, fecha))
+    if key:
+        sales_metrics.observe_write(key)
+    return available, key
+
 @app.route('/api/process_return', methods=['POST'])
 def api_process_return():
     """Procesar devolución de producto"""
@@ -851,80 +1168,46 @@ def api_process_return():
     motivo = request.json.get('motivo', '').strip()
     
     # Validar producto
-    productos = load_csv('productos.csv', fieldnames=['cod_fabrica', 'cod_venta', 'descripcion', 'precio'])
-    
-    product = None
-    for p in productos:
-        if p.get('cod_fabrica') == codigo or p.get('cod_venta') == codigo:
-            product = p
-            break
+    product = catalog.find(codigo)
     
     if not product:
         return jsonify({'success': False, 'message': 'Producto no encontrado'})
     
-    # Verificar que exista al menos una venta de este producto hoy
+    # Guardar devolución (con precio negativo)
     today = datetime.now().strftime('%Y-%m-%d')
-    lugar_limpio = "".join(c for c in lugar if c.isalnum() or c in (' ', '-', '_')).rstrip()
-    filename = f"{lugar_limpio}_{today}.csv"
-    filepath = os.path.join(SALES_DIR, filename)
-    
-    if not os.path.exists(filepath):
-        return jsonify({'success': False, 'message': 'No hay ventas registradas hoy para este lugar'})
-    
-    # Contar ventas de este producto hoy
-    product_sales_count = 0
     try:
-        with open(filepath, 'r', encoding=app_config.CSV_ENCODING) as file:
-            reader = csv.DictReader(file, delimiter=app_config.CSV_DELIMITER)
-            for row in reader:
-                row_codigo = row.get('cod_venta') or row.get('cod_fabrica', '')
-                if row_codigo == codigo:
-                    product_sales_count += 1
+        # Obtener precio original y hacerlo negativo
+        precio_original = product.get('precio', '0')
+        try:
+            # Convertir a número, hacer negativo y volver a string
+            precio_num = float(str(precio_original).replace('$', '').replace('.', '').strip())
+            precio_devolucion = f"-{precio_num}"
+        except:
+            precio_devolucion = f"-{precio_original}"
+        
+        # Solo se registra si quedan unidades vendidas (y no devueltas) dentro de la ventana
+        available, key = record_return(lugar, product, {
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'lugar': lugar,
+            'cod_fabrica': product.get('cod_fabrica', ''),
+            'cod_venta': product.get('cod_venta', ''),
+            'descripcion': product.get('descripcion', ''),
+            'precio': precio_devolucion,
+            'motivo': motivo,
+            'tipo': 'devolucion'
+        }, today)
     except Exception as e:
-        print(f"Error leyendo ventas del día: {e}")
-    
-    if product_sales_count == 0:
-        return jsonify({'success': False, 'message': 'No se encontraron ventas de este producto hoy'})
-    
-    # Guardar devolución (con precio negativo)
-    returns_filename = f"devoluciones_{today}.csv"
-    returns_filepath = os.path.join(SALES_DIR, returns_filename)
-    
-    fieldnames = ['timestamp', 'lugar', 'cod_fabrica', 'cod_venta', 'descripcion', 'precio', 'motivo', 'tipo']
-    file_exists = os.path.exists(returns_filepath)
+        return jsonify({'success': False, 'message': f'Error al guardar devolución: {str(e)}'})
     
-    try:
-        with open(returns_filepath, 'a', newline='', encoding=app_config.CSV_ENCODING) as file:
-            writer = csv.DictWriter(file, fieldnames=fieldnames, delimiter=app_config.CSV_DELIMITER)
-            if not file_exists:
-                writer.writeheader()
-            
-            # Obtener precio original y hacerlo negativo
-            precio_original = product.get('precio', '0')
-            try:
-                # Convertir a número, hacer negativo y volver a string
-                precio_num = float(str(precio_original).replace('$', '').replace('.', '').strip())
-                precio_devolucion = f"-{precio_num}"
-            except:
-                precio_devolucion = f"-{precio_original}"
-            
-            writer.writerow({
-                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'lugar': lugar,
-                'cod_fabrica': product.get('cod_fabrica', ''),
-                'cod_venta': product.get('cod_venta', ''),
-                'descripcion': product.get('descripcion', ''),
-                'precio': precio_devolucion,
-                'motivo': motivo,
-                'tipo': 'devolucion'
-            })
-        
+    if not key:
         return jsonify({
-            'success': True, 
-            'message': f'Devolución registrada correctamente. Ventas encontradas del producto: {product_sales_count}'
+            'success': False,
+            'message': f'No hay ventas de este producto en los últimos {app_config.RETURN_WINDOW_DAYS} días que queden por devolver'
         })
-    except Exception as e:
-        return jsonify({'success': False, 'message': f'Error al guardar devolución: {str(e)}'})
+    return jsonify({
+        'success': True, 
+        'message': f'Devolución registrada correctamente. Unidades que quedaban por devolver: {available}'
+    })
 
 def get_all_daily_transactions(lugar):
     """Obtener todas las transacciones del día (ventas y devoluciones)"""
@@ -936,46 +1219,33 @@ def get_all_daily_transactions(lugar):
     returns_amount = 0
     
     # Cargar ventas del día
-    lugar_limpio = "".join(c for c in lugar if c.isalnum() or c in (' ', '-', '_')).rstrip()
-    sales_filename = f"{lugar_limpio}_{today}.csv"
-    sales_filepath = os.path.join(SALES_DIR, sales_filename)
-    
-    if os.path.exists(sales_filepath):
-        try:
-            with open(sales_filepath, 'r', encoding=app_config.CSV_ENCODING) as file:
-                reader = csv.DictReader(file, delimiter=app_config.CSV_DELIMITER)
-                for row in reader:
-                    row['tipo'] = 'venta'
-                    transactions.append(row)
-                    total_sales += 1
-                    
-                    precio = str(row.get('precio', '0')).replace('$', '').replace('.', '').strip()
-                    if precio and precio != '' and precio.lstrip('-').isdigit():
-                        total_amount += int(precio)
-        except Exception as e:
-            print(f"Error leyendo ventas del día {sales_filename}: {e}")
+    try:
+        for row in storage.sales_rows(lugar, today):
+            row['tipo'] = 'venta'
+            transactions.append(row)
+            total_sales += 1
+            
+            precio = str(row.get('precio', '0')).replace('$', '').replace('.', '').strip()
+            if precio and precio != '' and precio.lstrip('-').isdigit():
+                total_amount += int(precio)
+    except Exception as e:
+        print(f"Error leyendo ventas del día de {lugar}: {e}")
     
     # Cargar devoluciones del día
-    returns_filename = f"devoluciones_{today}.csv"
-    returns_filepath = os.path.join(SALES_DIR, returns_filename)
-    
-    if os.path.exists(returns_filepath):
-        try:
-            with open(returns_filepath, 'r', encoding=app_config.CSV_ENCODING) as file:
-                reader = csv.DictReader(file, delimiter=app_config.CSV_DELIMITER)
-                for row in reader:
-                    # Solo incluir devoluciones de este lugar
-                    if row.get('lugar') == lugar:
-                        row['tipo'] = 'devolucion'
-                        transactions.append(row)
-                        total_returns += 1
-                        
-                        precio = str(row.get('precio', '0')).replace('$', '').replace('.', '').strip()
-                        if precio and precio != '' and precio.lstrip('-').isdigit():
-                            total_amount += int(precio)  # Suma el valor negativo
-                            returns_amount += abs(int(precio))
-        except Exception as e:
-            print(f"Error leyendo devoluciones {returns_filename}: {e}")
+    try:
+        for row in storage.returns_rows(today):
+            # Solo incluir devoluciones de este lugar
+            if row.get('lugar') == lugar:
+                row['tipo'] = 'devolucion'
+                transactions.append(row)
+                total_returns += 1
+                
+                precio = str(row.get('precio', '0')).replace('$', '').replace('.', '').strip()
+                if precio and precio != '' and precio.lstrip('-').isdigit():
+                    total_amount += int(precio)  # Suma el valor negativo
+                    returns_amount += abs(int(precio))
+    except Exception as e:
+        print(f"Error leyendo devoluciones del día: {e}")
     
     # Ordenar transacciones por timestamp
     transactions.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
@@ -1017,13 +1287,7 @@ def api_process_product_return():
     motivo = request.json.get('motivo', '').strip()
     
     # Validar producto
-    productos = load_csv('productos.csv', fieldnames=['cod_fabrica', 'cod_venta', 'descripcion', 'precio'])
-    
-    product = None
-    for p in productos:
-        if p.get('cod_fabrica') == codigo or p.get('cod_venta') == codigo:
-            product = p
-            break
+    product = catalog.find(codigo)
     
     if not product:
         return jsonify({'success': False, 'message': 'Producto no encontrado'})
@@ -1031,45 +1295,36 @@ def api_process_product_return():
     # Guardar devolución (con precio negativo)
     fecha = datetime.now().strftime('%Y-%m-%d')
     
-    # Limpiar nombre del lugar para el archivo
-    lugar_limpio = "".join(c for c in lugar if c.isalnum() or c in (' ', '-', '_')).rstrip()
-    filename = f"devoluciones_{fecha}.csv"
-    filepath = os.path.join(SALES_DIR, filename)
-    
-    fieldnames = ['timestamp', 'lugar', 'cod_fabrica', 'cod_venta', 'descripcion', 'precio', 'motivo', 'tipo']
-    
-    # Si el archivo no existe, crearlo con header
-    file_exists = os.path.exists(filepath)
-    
     try:
-        with open(filepath, 'a', newline='', encoding=app_config.CSV_ENCODING) as file:
-            writer = csv.DictWriter(file, fieldnames=fieldnames, delimiter=app_config.CSV_DELIMITER)
-            if not file_exists:
-                writer.writeheader()
-            
-            # Convertir precio a negativo
-            precio_original = product.get('precio', '0')
-            try:
-                # Intentar convertir a número y hacer negativo
-                precio_num = int(precio_original.replace('$', '').replace('.', '').strip())
-                precio_devolucion = -precio_num
-            except:
-                precio_devolucion = f"-{precio_original}"
-            
-            writer.writerow({
-                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'lugar': lugar,
-                'cod_fabrica': product.get('cod_fabrica', ''),
-                'cod_venta': product.get('cod_venta', ''),
-                'descripcion': product.get('descripcion', ''),
-                'precio': precio_devolucion,
-                'motivo': motivo,
-                'tipo': 'devolucion'
-            })
+        # Convertir precio a negativo
+        precio_original = product.get('precio', '0')
+        try:
+            # Intentar convertir a número y hacer negativo
+            precio_num = int(precio_original.replace('$', '').replace('.', '').strip())
+            precio_devolucion = -precio_num
+        except:
+            precio_devolucion = f"-{precio_original}"
         
-        return jsonify({'success': True, 'message': 'Devolución registrada correctamente'})
+        # No se aceptan más devoluciones que las unidades vendidas en la ventana
+        _, key = record_return(lugar, product, {
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'lugar': lugar,
+            'cod_fabrica': product.get('cod_fabrica', ''),
+            'cod_venta': product.get('cod_venta', ''),
+            'descripcion': product.get('descripcion', ''),
+            'precio': precio_devolucion,
+            'motivo': motivo,
+            'tipo': 'devolucion'
+        }, fecha)
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error al guardar: {str(e)}'})
+    
+    if not key:
+        return jsonify({
+            'success': False,
+            'message': f'No hay ventas de este producto en los últimos {app_config.RETURN_WINDOW_DAYS} días que queden por devolver'
+        })
+    return jsonify({'success': True, 'message': 'Devolución registrada correctamente'})
 
 def get_daily_transactions_with_returns(lugar):
     """Obtener todas las transacciones del día (ventas y devoluciones) para un lugar específico"""
@@ -1080,53 +1335,41 @@ def get_daily_transactions_with_returns(lugar):
     total_returns = 0
     returns_amount = 0
     
-    # Cargar ventas del día
-    lugar_limpio = "".join(c for c in lugar if c.isalnum() or c in (' ', '-', '_')).rstrip()
-    sales_filename = f"{lugar_limpio}_{today}.csv"
-    sales_filepath = os.path.join(SALES_DIR, sales_filename)
-    
-    if os.path.exists(sales_filepath):
-        try:
-            with open(sales_filepath, 'r', encoding=app_config.CSV_ENCODING) as file:
-                reader = csv.DictReader(file, delimiter=app_config.CSV_DELIMITER)
-                for row in reader:
-                    row['tipo'] = 'venta'
-                    transactions.append(row)
-                    total_sales += 1
-                    
-                    precio = str(row.get('precio', '0')).replace('$', '').replace('.', '').strip()
-                    if precio and precio != '' and precio.lstrip('-').isdigit():
-                        total_amount += int(precio)
-        except Exception as e:
-            print(f"Error leyendo ventas del día {sales_filename}: {e}")
+    # Cargar ventas del día (con su posición en el archivo, para paginar con cursor)
+    try:
+        for seq, row in enumerate(storage.sales_rows(lugar, today)):
+            row['tipo'] = 'venta'
+            transactions.append(((row.get('timestamp', ''), 'venta', seq), row))
+            total_sales += 1
+            
+            precio = str(row.get('precio', '0')).replace('$', '').replace('.', '').strip()
+            if precio and precio != '' and precio.lstrip('-').isdigit():
+                total_amount += int(precio)
+    except Exception as e:
+        print(f"Error leyendo ventas del día de {lugar}: {e}")
     
     # Cargar devoluciones del día (de todos los lugares, pero filtraremos por lugar)
-    returns_filename = f"devoluciones_{today}.csv"
-    returns_filepath = os.path.join(SALES_DIR, returns_filename)
-    
-    if os.path.exists(returns_filepath):
-        try:
-            with open(returns_filepath, 'r', encoding=app_config.CSV_ENCODING) as file:
-                reader = csv.DictReader(file, delimiter=app_config.CSV_DELIMITER)
-                for row in reader:
-                    # Solo incluir devoluciones de este lugar
-                    if row.get('lugar') == lugar:
-                        row['tipo'] = 'devolucion'
-                        transactions.append(row)
-                        total_returns += 1
-                        
-                        precio = str(row.get('precio', '0')).replace('$', '').replace('.', '').strip()
-                        if precio and precio != '' and precio.lstrip('-').isdigit():
-                            total_amount += int(precio)  # Suma el valor negativo
-                            returns_amount += abs(int(precio))
-        except Exception as e:
-            print(f"Error leyendo devoluciones {returns_filename}: {e}")
+    try:
+        for seq, row in enumerate(storage.returns_rows(today)):
+            # Solo incluir devoluciones de este lugar
+            if row.get('lugar') == lugar:
+                row['tipo'] = 'devolucion'
+                transactions.append(((row.get('timestamp', ''), 'devolucion', seq), row))
+                total_returns += 1
+                
+                precio = str(row.get('precio', '0')).replace('$', '').replace('.', '').strip()
+                if precio and precio != '' and precio.lstrip('-').isdigit():
+                    total_amount += int(precio)  # Suma el valor negativo
+                    returns_amount += abs(int(precio))
+    except Exception as e:
+        print(f"Error leyendo devoluciones del día: {e}")
     
-    # Ordenar transacciones por timestamp
-    transactions.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
+    # Ordenar transacciones por timestamp (y posición, para que el orden sea estable)
+    transactions.sort(key=lambda x: x[0], reverse=True)
     
     return {
-        'transactions': transactions,
+        'transactions': [row for _, row in transactions],
+        'transaction_keys': [key for key, _ in transactions],
         'total_amount': total_amount,
         'total_sales': total_sales,
         'total_returns': total_returns,
@@ -1138,13 +1381,31 @@ def get_daily_transactions_with_returns(lugar):
 
 @app.route('/api/get_daily_transactions_with_returns/<lugar>')
 def api_get_daily_transactions_with_returns(lugar):
-    """API para obtener todas las transacciones del día (ventas + devoluciones) de un lugar específico"""
+    """
+    API para obtener las transacciones del día (ventas + devoluciones) de un lugar específico.
+    Con ?limit= (y ?cursor= de la página anterior) se retorna una página; los totales son del día.
+    Responde 304 si los archivos del día no cambiaron desde el ETag que envía el cliente.
+    """
+    today = datetime.now().strftime('%Y-%m-%d')
     try:
+        etag, last_modified = data_validators(
+            [storage.key_version(sales_key(lugar, today)), storage.key_version(returns_key(today))], today)
+        cached = not_modified(request, etag, last_modified)
+        if cached is not None:
+            return cached
         daily_data = get_daily_transactions_with_returns(lugar)
-        return jsonify({
+        keys = daily_data.pop('transaction_keys')
+        if request.args.get('limit') or request.args.get('cursor'):
+            limit = parse_limit(request.args.get('limit'), app_config.ITEMS_PER_PAGE)
+            cursor = decode_cursor(request.args.get('cursor'), (str, str, int))
+            pairs, next_cursor = page_desc(list(zip(keys, daily_data['transactions'])),
+                                           key=lambda pair: pair[0], cursor=cursor, limit=limit)
+            daily_data['transactions'] = [row for _, row in pairs]
+            daily_data['next_cursor'] = next_cursor
+        return with_validators(jsonify({
             'success': True,
             'daily_data': daily_data
-        })
+        }), etag, last_modified)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -1184,11 +1445,25 @@ def api_solicitudes_login():
 
 @app.route('/api/get_solicitudes', methods=['GET'])
 def api_get_solicitudes():
+    """
+    Solicitudes de la más reciente a la más antigua. Filtros: ?estado=, ?tipo=, ?solicitante=.
+    Con ?limit= (y ?cursor= de la página anterior) se retorna una página y next_cursor.
+    Responde 304 si solicitudes.csv no cambió desde el ETag que envía el cliente.
+    """
     try:
-        solicitudes = load_csv('solicitudes.csv')
-        solicitudes.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-        return jsonify({'success': True, 'solicitudes': solicitudes})
-    except:
+        etag, last_modified = data_validators([storage.table_version(SOLICITUDES_TABLE)])
+        cached = not_modified(request, etag, last_modified)
+        if cached is not None:
+            return cached
+        filters = {name: request.args.get(name, '').strip() for name in ('estado', 'tipo', 'solicitante')}
+        paged = bool(request.args.get('limit') or request.args.get('cursor'))
+        limit = parse_limit(request.args.get('limit'), app_config.ITEMS_PER_PAGE) if paged else None
+        cursor = decode_cursor(request.args.get('cursor'), (str, str))
+        solicitudes, next_cursor, total = solicitudes_index.page(cursor=cursor, limit=limit, **filters)
+        return with_validators(jsonify({'success': True, 'solicitudes': solicitudes, 'next_cursor': next_cursor, 'total': total}),
+                               etag, last_modified)
+    except Exception as e:
+        print(f"Error obteniendo solicitudes: {e}")
         return jsonify({'success': True, 'solicitudes': []})
 
 @app.route('/api/create_solicitud', methods=['POST'])
@@ -1204,34 +1479,7 @@ def api_create_solicitud():
         elif not data.get('motivo'):
              return jsonify({'success': False, 'message': 'Debe detallar la solicitud'})
 
-        import random
-        nuevo_id = f"{datetime.now().strftime('%Y%m%d%H%M%S')}{random.randint(10,99)}"
-        
-        nueva = {
-            'id': nuevo_id,
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'solicitante_nombre': data.get('solicitante', ''),
-            'tipo': tipo,
-            'cliente_nombre': data.get('cliente', ''),
-            'banco': data.get('banco', ''),
-            'rut': data.get('rut', ''),
-            'email': data.get('email', ''),
-            'monto': data.get('monto', '0'),
-            'motivo': data.get('motivo', ''),
-            'estado': 'Pendiente',
-            'comentario_cierre': ''
-        }
-        
-        fieldnames = ['id', 'timestamp', 'solicitante_nombre', 'tipo', 'cliente_nombre', 
-                      'banco', 'rut', 'email', 'monto', 'motivo', 'estado', 'comentario_cierre']
-        
-        filepath = os.path.join(DATA_DIR, 'solicitudes.csv')
-        file_exists = os.path.exists(filepath)
-        
-        with open(filepath, 'a', newline='', encoding=app_config.CSV_ENCODING) as f:
-            w = csv.DictWriter(f, fieldnames=fieldnames, delimiter=app_config.CSV_DELIMITER)
-            if not file_exists: w.writeheader()
-            w.writerow(nueva)
+        solicitudes_index.create(dict(data, tipo=tipo))
             
         return jsonify({'success': True})
     except Exception as e:
@@ -1245,16 +1493,8 @@ def api_close_solicitud():
         
         if not comment: return jsonify({'success': False, 'message': 'Comentario obligatorio'})
         
-        solicitudes = load_csv('solicitudes.csv')
-        for s in solicitudes:
-            if s.get('id') == sid:
-                s['estado'] = 'Cerrado'
-                s['comentario_cierre'] = comment
-                break
-        
-        fieldnames = ['id', 'timestamp', 'solicitante_nombre', 'tipo', 'cliente_nombre', 
-                      'banco', 'rut', 'email', 'monto', 'motivo', 'estado', 'comentario_cierre']
-        save_csv('solicitudes.csv', solicitudes, fieldnames)
+        if not solicitudes_index.close(sid, comment):
+            return jsonify({'success': False, 'message': 'Solicitud no encontrada'})
         
         return jsonify({'success': True})
     except Exception as e:
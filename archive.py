@@ -0,0 +1,396 @@
+"""
+Archivo mensual comprimido de sales_data.
+
+Los meses cerrados se agrupan en una partición por mes (sales_archive/YYYY-MM.part).
+Cada archivo diario se guarda como un miembro gzip independiente y al final de la
+partición va un índice (footer) con el rango de bytes de cada día/lugar y sus
+totales precalculados (filas y monto por lugar), de modo que leer un día no obliga
+a descomprimir el mes y los reportes sin detalle por producto no descomprimen nada.
+
+Formato:  [gzip archivo 1][gzip archivo 2]...[gzip footer JSON][largo footer: 8 bytes][MAGIC]
+
+Uso:  python archive.py [--dry-run]
+"""
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import struct
+from datetime import datetime, timedelta
+
+from config import get_config, parse_amount
+
+MAGIC = b'PGVARC01'
+TRAILER_SIZE = 8 + len(MAGIC)
+RETURNS_PREFIX = 'devoluciones_'
+
+# Encabezados antiguos de algunos archivos diarios -> nombres actuales
+HEADER_ALIASES = {
+    'time_stamp': 'timestamp',
+    'local': 'lugar',
+    'id_fabrica': 'cod_fabrica',
+    'id_venta': 'cod_venta',
+    'description': 'descripcion',
+    'price': 'precio'
+}
+
+_FILENAME_RE = re.compile(r'^(?P<location>.+)_(?P<date>\d{4}-\d{2}-\d{2})\.csv$')
+
+# Caché de particiones abiertas: ruta -> (mtime, MonthPartition)
+_partition_cache = {}
+
+
+def parse_sales_filename(filename):
+    """Separar '<lugar>_<YYYY-MM-DD>.csv' en (lugar, fecha, tipo) o None si no corresponde"""
+    match = _FILENAME_RE.match(filename)
+    if not match:
+        return None
+    location = match.group('location')
+    if filename.startswith(RETURNS_PREFIX):
+        return '', match.group('date'), 'returns'
+    return location, match.group('date'), 'sales'
+
+
+class SalesSource:
+    """Un archivo diario de ventas o devoluciones, vivo o archivado"""
+
+    def __init__(self, filename, location, date, kind, path=None, partition=None, entry=None, encoding='utf-8'):
+        self.filename = filename
+        self.location = location
+        self.date = date
+        self.kind = kind
+        self.path = path
+        self.partition = partition
+        self.entry = entry
+        self.encoding = encoding
+
+    @property
+    def archived(self):
+        return self.partition is not None
+
+    @property
+    def totals(self):
+        """Totales precalculados del archivo ({'rows', 'amount', 'locations'}) o None si no los hay"""
+        if self.entry is None or 'locations' not in self.entry:
+            return None  # archivo vivo o partición escrita sin totales
+        return self.entry
+
+    def open(self):
+        """Abrir el contenido como texto (archivo en disco o miembro descomprimido)"""
+        if self.partition is not None:
+            return io.StringIO(self.partition.read_entry(self.entry).decode(self.encoding))
+        return open(self.path, 'r', encoding=self.encoding, newline='')
+
+    def rows(self, delimiter=';'):
+        """Iterar las filas del archivo como diccionarios (normalizando encabezados antiguos)"""
+        with self.open() as file:
+            yield from _dict_rows(file, delimiter)
+
+
+def _dict_rows(file, delimiter):
+    """DictReader de un archivo diario abierto (detecta ',' y normaliza encabezados)"""
+    header = file.readline()
+    if delimiter not in header and ',' in header:
+        delimiter = ','
+    fieldnames = [HEADER_ALIASES.get(name.strip(), name.strip())
+                  for name in next(csv.reader([header], delimiter=delimiter), [])]
+    return csv.DictReader(file, fieldnames=fieldnames, delimiter=delimiter)
+
+
+def read_new_rows(path, offset=0, header=None, encoding='utf-8', delimiter=';'):
+    """
+    Leer las filas agregadas a un archivo diario desde `offset` (bytes).
+    `header` es (campos, delimitador) leído la primera vez; se pasa de vuelta en las
+    lecturas siguientes. Retorna (filas, nuevo_offset, header). Una fila a medio
+    escribir (sin salto de línea final) se deja para la próxima lectura.
+    """
+    try:
+        with open(path, 'rb') as file:
+            file.seek(offset)
+            data = file.read()
+    except OSError:
+        return [], offset, header
+    end = data.rfind(b'\n') + 1
+    if end == 0:
+        return [], offset, header
+    lines = data[:end].decode(encoding).splitlines()
+    if header is None:
+        header_line = lines.pop(0)
+        if delimiter not in header_line and ',' in header_line:
+            delimiter = ','
+        header = ([HEADER_ALIASES.get(name.strip(), name.strip())
+                   for name in next(csv.reader([header_line], delimiter=delimiter), [])], delimiter)
+    fieldnames, file_delimiter = header
+    rows = list(csv.DictReader(io.StringIO('\n'.join(lines)), fieldnames=fieldnames, delimiter=file_delimiter))
+    return rows, offset + end, header
+
+
+class MonthPartition:
+    """Partición comprimida de un mes con su índice de rangos de bytes"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            file.seek(0, os.SEEK_END)
+            size = file.tell()
+            if size < TRAILER_SIZE:
+                raise ValueError(f"Partición inválida: {path}")
+            file.seek(size - TRAILER_SIZE)
+            trailer = file.read(TRAILER_SIZE)
+            if trailer[8:] != MAGIC:
+                raise ValueError(f"Partición sin índice: {path}")
+            footer_length = struct.unpack('<Q', trailer[:8])[0]
+            file.seek(size - TRAILER_SIZE - footer_length)
+            footer = json.loads(gzip.decompress(file.read(footer_length)).decode('utf-8'))
+        self.month = footer['month']
+        self.entries = footer['entries']
+        self._by_date = {}
+        for entry in self.entries:
+            self._by_date.setdefault(entry['date'], []).append(entry)
+
+    def entries_for_date(self, date_str):
+        return self._by_date.get(date_str, [])
+
+    def read_entry(self, entry):
+        """Leer y descomprimir solo el rango de bytes de una entrada"""
+        with open(self.path, 'rb') as file:
+            file.seek(entry['offset'])
+            return gzip.decompress(file.read(entry['length']))
+
+
+def partition_path(archive_dir, month):
+    return os.path.join(archive_dir, f"{month}.part")
+
+
+def get_partition(archive_dir, month):
+    """Obtener la partición de un mes (cacheada por mtime) o None si no existe"""
+    path = partition_path(archive_dir, month)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        _partition_cache.pop(path, None)
+        return None
+    cached = _partition_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    partition = MonthPartition(path)
+    _partition_cache[path] = (mtime, partition)
+    return partition
+
+
+def _month_of(date_str):
+    return date_str[:7]
+
+
+def get_range_sources(sales_dir, archive_dir, start_date, end_date, encoding='utf-8'):
+    """
+    Agrupar por fecha todos los archivos (vivos y archivados) entre start_date y end_date.
+    Retorna un dict fecha -> lista de SalesSource, leyendo el directorio vivo una sola vez.
+    """
+    start_str = start_date.strftime('%Y-%m-%d')
+    end_str = end_date.strftime('%Y-%m-%d')
+    by_date = {}
+
+    for filename in os.listdir(sales_dir):
+        parsed = parse_sales_filename(filename)
+        if not parsed:
+            continue
+        location, date_str, kind = parsed
+        if start_str <= date_str <= end_str:
+            by_date.setdefault(date_str, []).append(SalesSource(
+                filename, location, date_str, kind,
+                path=os.path.join(sales_dir, filename), encoding=encoding))
+
+    # Meses del rango que pueden estar archivados
+    month = start_date.replace(day=1)
+    while month <= end_date:
+        month_str = month.strftime('%Y-%m')
+        try:
+            partition = get_partition(archive_dir, month_str)
+        except Exception as e:
+            print(f"Error leyendo partición {month_str}: {e}")
+            partition = None
+        if partition:
+            for entry in partition.entries:
+                if start_str <= entry['date'] <= end_str:
+                    by_date.setdefault(entry['date'], []).append(SalesSource(
+                        entry['filename'], entry['location'], entry['date'], entry['kind'],
+                        partition=partition, entry=entry, encoding=encoding))
+        month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+    return by_date
+
+
+def get_range_version(sales_dir, archive_dir, start_date, end_date):
+    """
+    (mtime_ns máximo, bytes, archivos) de los archivos vivos y particiones del rango:
+    cambia con cada venta, devolución o archivado, sin leer los archivos.
+    """
+    start_str = start_date.strftime('%Y-%m-%d')
+    end_str = end_date.strftime('%Y-%m-%d')
+    latest, size, count = 0, 0, 0
+
+    def add(stat):
+        nonlocal latest, size, count
+        latest = max(latest, stat.st_mtime_ns)
+        size += stat.st_size
+        count += 1
+
+    for entry in os.scandir(sales_dir):
+        parsed = parse_sales_filename(entry.name)
+        if parsed and start_str <= parsed[1] <= end_str:
+            try:
+                add(entry.stat())
+            except OSError:
+                continue  # archivado entre el listado y el stat
+
+    month = start_date.replace(day=1)
+    while month <= end_date:
+        try:
+            add(os.stat(partition_path(archive_dir, month.strftime('%Y-%m'))))
+        except OSError:
+            pass
+        month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+    return (latest, size, count)
+
+
+def get_day_sources(sales_dir, archive_dir, date_str, encoding='utf-8'):
+    """Lista de SalesSource de una fecha 'YYYY-MM-DD'"""
+    day = datetime.strptime(date_str, '%Y-%m-%d').date()
+    return get_range_sources(sales_dir, archive_dir, day, day, encoding).get(date_str, [])
+
+
+def _file_totals(data, location, kind, encoding, delimiter):
+    """
+    Filas y monto de un archivo diario, en total y por lugar (en las devoluciones el
+    lugar sale de cada fila), leídos igual que SalesSource.rows.
+    """
+    rows, amount, locations = 0, 0, {}
+    for row in _dict_rows(io.StringIO(data.decode(encoding)), delimiter):
+        value = parse_amount(row.get('precio', '0')) or 0
+        lugar = row.get('lugar', '') if kind == 'returns' else location
+        counters = locations.setdefault(lugar, [0, 0])
+        counters[0] += 1
+        counters[1] += value
+        rows += 1
+        amount += value
+    return {'rows': rows, 'amount': amount, 'locations': locations}
+
+
+def write_partition(archive_dir, month, files, encoding='utf-8', delimiter=';'):
+    """
+    Escribir la partición de un mes a partir de una lista de (filename, bytes).
+    Se escribe en un temporal y se reemplaza de forma atómica.
+    """
+    path = partition_path(archive_dir, month)
+    tmp_path = path + '.tmp'
+    entries = []
+
+    with open(tmp_path, 'wb') as out:
+        for filename, data in sorted(files):
+            parsed = parse_sales_filename(filename)
+            if not parsed:
+                continue
+            location, date_str, kind = parsed
+            member = gzip.compress(data, mtime=0)
+            entry = {
+                'filename': filename,
+                'location': location,
+                'date': date_str,
+                'kind': kind,
+                'offset': out.tell(),
+                'length': len(member)
+            }
+            try:
+                entry.update(_file_totals(data, location, kind, encoding, delimiter))
+            except Exception as e:
+                # Sin totales la entrada se lee fila a fila, como un archivo vivo
+                print(f"Error calculando totales de {filename}: {e}")
+            entries.append(entry)
+            out.write(member)
+
+        footer = gzip.compress(json.dumps({
+            'version': 1,
+            'month': month,
+            'entries': entries
+        }, ensure_ascii=False).encode('utf-8'), mtime=0)
+        out.write(footer)
+        out.write(struct.pack('<Q', len(footer)) + MAGIC)
+        out.flush()
+        os.fsync(out.fileno())
+
+    os.replace(tmp_path, path)
+    _partition_cache.pop(path, None)
+    return entries
+
+
+def archive_closed_months(sales_dir, archive_dir, today=None, encoding='utf-8', delimiter=';', dry_run=False):
+    """
+    Mover a particiones comprimidas todos los meses anteriores al mes actual.
+    Si el mes ya tenía partición, los archivos nuevos se agregan a ella.
+    Retorna dict mes -> cantidad de archivos archivados.
+    """
+    current_month = (today or datetime.now().date()).strftime('%Y-%m')
+    pending = {}
+    for filename in os.listdir(sales_dir):
+        parsed = parse_sales_filename(filename)
+        if parsed and _month_of(parsed[1]) < current_month:
+            pending.setdefault(_month_of(parsed[1]), []).append(filename)
+
+    summary = {}
+    for month, filenames in sorted(pending.items()):
+        summary[month] = len(filenames)
+        if dry_run:
+            continue
+
+        # Contenido ya archivado del mes (si existe)
+        contents = {}
+        partition = get_partition(archive_dir, month)
+        if partition:
+            for entry in partition.entries:
+                contents[entry['filename']] = partition.read_entry(entry)
+
+        for filename in filenames:
+            with open(os.path.join(sales_dir, filename), 'rb') as file:
+                data = file.read()
+            if filename in contents:
+                # Mismo archivo ya archivado: agregar solo las filas (sin encabezado)
+                data = data.split(b'\n', 1)[1] if b'\n' in data else b''
+                previous = contents[filename]
+                if previous and not previous.endswith(b'\n'):
+                    previous += b'\n'
+                contents[filename] = previous + data
+            else:
+                contents[filename] = data
+
+        write_partition(archive_dir, month, list(contents.items()), encoding, delimiter)
+
+        # Solo se borran los archivos vivos una vez que la partición quedó en disco
+        for filename in filenames:
+            os.remove(os.path.join(sales_dir, filename))
+        print(f"Mes {month} archivado: {len(filenames)} archivos")
+
+    return summary
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Archivar meses cerrados de sales_data')
+    parser.add_argument('--dry-run', action='store_true', help='Solo mostrar qué se archivaría')
+    args = parser.parse_args()
+
+    app_config = get_config()
+    os.makedirs(app_config.SALES_ARCHIVE_DIR, exist_ok=True)
+    result = archive_closed_months(
+        app_config.SALES_DIR,
+        app_config.SALES_ARCHIVE_DIR,
+        encoding=app_config.CSV_ENCODING,
+        delimiter=app_config.CSV_DELIMITER,
+        dry_run=args.dry_run
+    )
+    for month, count in result.items():
+        print(f"{month}: {count} archivos")
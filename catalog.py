@@ -0,0 +1,358 @@
+"""
+Catálogo de productos (productos.csv) con caché por versión y carga validada.
+
+`Catalog` busca por código en el catálogo compilado (catalogfile.py, abierto con
+mmap); antes de cada consulta compara la versión de la tabla en el almacenamiento
+y, si cambió, lo vuelve a compilar (sin reiniciar la app). Un archivo copiado a
+medias no reemplaza al catálogo vigente: si la versión cambia mientras se lee, o
+el archivo nuevo queda vacío, se mantiene el catálogo anterior.
+
+Para publicar un catálogo nuevo se usa `Catalog.upload` (endpoint /api/catalog/upload
+o `python catalog.py upload archivo.csv`): se parsea fila a fila, se validan los
+códigos y precios, se informa la diferencia con el catálogo vigente y recién
+entonces se reemplaza la tabla de forma atómica y se registra una nueva versión.
+Cada versión guarda además sus cambios por producto en catalogo_cambios.csv, de
+donde sale el feed incremental para los dispositivos (catalogfeed.py).
+"""
+import csv
+import io
+import threading
+from datetime import datetime
+
+from catalogfile import CompiledCatalog, build_catalog, write_catalog
+from config import parse_amount, validate_factory_code, validate_sales_code
+
+CATALOG_TABLE = 'productos.csv'
+VERSIONS_TABLE = 'catalogo_versiones.csv'
+FIELDNAMES = ['cod_fabrica', 'cod_venta', 'descripcion', 'precio']
+VERSION_FIELDNAMES = ['version', 'timestamp', 'filas', 'agregados', 'eliminados', 'cambios_precio', 'origen']
+CHANGES_TABLE = 'catalogo_cambios.csv'
+CHANGE_FIELDNAMES = ['version', 'accion', 'cod_venta', 'cod_fabrica', 'descripcion', 'precio', 'tabla']
+# accion: 'upsert' (producto nuevo o modificado), 'delete' (eliminado), 'version' (marca de
+# versión completa: sin ella no se sabe si los cambios de esa versión se guardaron todos) o
+# 'reset' (versión publicada sobre un productos.csv reemplazado fuera de upload: cambios
+# desconocidos). Las marcas guardan en 'tabla' la versión de productos.csv publicada con ese número.
+MAX_REPORTED_ERRORS = 50
+_NOT_LOADED = object()
+
+
+class CatalogError(Exception):
+    """Archivo de catálogo inválido (con los primeros errores por fila y el total)"""
+
+    def __init__(self, errors, total=None):
+        self.total = total if total is not None else len(errors)
+        super().__init__(f"{self.total} errores en el catálogo")
+        self.errors = errors
+
+
+def parse_catalog(stream, config_obj):
+    """
+    Leer un catálogo fila a fila desde un stream de texto y validarlo.
+    Retorna (productos, errores, total_errores); se detallan hasta MAX_REPORTED_ERRORS
+    errores, cada uno {'linea', 'mensaje'}.
+    """
+    first_line = stream.readline()
+    delimiter = ';' if ';' in first_line else ','
+    header = [name.strip().lower().replace(' ', '_') for name in next(csv.reader([first_line], delimiter=delimiter), [])]
+    products = []
+    errors = []
+    error_count = 0
+    seen = {}
+
+    def error(line, message):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({'linea': line, 'mensaje': message})
+
+    if 'cod_venta' in header:
+        rows = csv.DictReader(stream, fieldnames=header, delimiter=delimiter)
+        line = 1
+    else:
+        # Archivo sin encabezados: la primera línea ya es un producto
+        rows = csv.DictReader(io.StringIO(first_line), fieldnames=FIELDNAMES, delimiter=delimiter)
+        rows = _chain(rows, csv.DictReader(stream, fieldnames=FIELDNAMES, delimiter=delimiter))
+        line = 0
+
+    for row in rows:
+        line += 1
+        if not any((value or '').strip() for value in row.values() if isinstance(value, str)):
+            continue  # línea vacía
+        product = {name: (row.get(name) or '').strip() for name in FIELDNAMES}
+        product['cod_fabrica'] = product['cod_fabrica'].upper()
+        product['cod_venta'] = product['cod_venta'].upper()
+        cod_venta = product['cod_venta']
+
+        if not validate_factory_code(product['cod_fabrica'], config_obj):
+            error(line, f"Código de fábrica inválido: '{product['cod_fabrica']}'")
+            continue
+        # Se aceptan los mismos formatos que en la búsqueda (código de venta o de fábrica)
+        if not (validate_sales_code(cod_venta, config_obj) or validate_factory_code(cod_venta, config_obj)):
+            error(line, f"Código de venta inválido: '{cod_venta}'")
+            continue
+        price = parse_amount(product['precio'])
+        if price is None or price < 0:
+            error(line, f"Precio inválido para {cod_venta}: '{product['precio']}'")
+            continue
+        if cod_venta in seen:
+            error(line, f"Código de venta {cod_venta} repetido (línea {seen[cod_venta]})")
+            continue
+        seen[cod_venta] = line
+        products.append(product)
+
+    return products, errors, error_count
+
+
+def _chain(*iterables):
+    for iterable in iterables:
+        yield from iterable
+
+
+def diff_catalogs(old_products, new_products):
+    """Productos agregados, eliminados y con cambio de precio (por código de venta)"""
+    old = {p.get('cod_venta', ''): p for p in old_products if p.get('cod_venta')}
+    new = {p['cod_venta']: p for p in new_products}
+    added = [new[code] for code in new if code not in old]
+    removed = [old[code] for code in old if code not in new]
+    repriced = []
+    for code in new.keys() & old.keys():
+        old_price = parse_amount(old[code].get('precio'))
+        new_price = parse_amount(new[code].get('precio'))
+        if old_price != new_price:
+            repriced.append({
+                'cod_venta': code,
+                'descripcion': new[code].get('descripcion', ''),
+                'precio_anterior': old_price,
+                'precio_nuevo': new_price
+            })
+    repriced.sort(key=lambda item: item['cod_venta'])
+    return {'added': added, 'removed': removed, 'repriced': repriced}
+
+
+def catalog_changes(old_products, new_products):
+    """(productos nuevos o con alguna columna distinta, códigos eliminados) por código de venta"""
+    old = {p.get('cod_venta', ''): p for p in old_products if p.get('cod_venta')}
+    new = {p['cod_venta']: p for p in new_products}
+    upserts = [product for code, product in new.items()
+               if code not in old or any((old[code].get(name) or '') != (product.get(name) or '') for name in FIELDNAMES)]
+    deletes = [code for code in old if code not in new]
+    return upserts, deletes
+
+
+class Catalog:
+    """
+    Catálogo compilado (mmap), recompilado cuando cambia la versión de productos.csv.
+    El archivo compilado lo comparten todos los workers: el primero que ve una versión
+    nueva lo escribe y los demás solo lo abren.
+    """
+
+    def __init__(self, storage, config_obj):
+        self.storage = storage
+        self.config = config_obj
+        self.compiled_path = config_obj.CATALOG_COMPILED_PATH
+        self._lock = threading.Lock()
+        self._version = _NOT_LOADED
+        self._compiled = None
+
+    def _load(self):
+        products = self.storage.load_table(CATALOG_TABLE)
+        if products and 'cod_venta' not in products[0]:
+            # productos.csv sin encabezados
+            products = self.storage.load_table(CATALOG_TABLE, fieldnames=FIELDNAMES)
+        return products
+
+    def _open_compiled(self, source):
+        """Catálogo compilado de esta versión si ya existe (lo escribió otro worker), o None"""
+        try:
+            compiled = CompiledCatalog.open(self.compiled_path)
+        except (OSError, ValueError):
+            return None
+        return compiled if compiled.source == source else None
+
+    def _ensure_loaded(self):
+        version = self.storage.table_version(CATALOG_TABLE)
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            source = repr(version)
+            compiled = self._open_compiled(source)
+            if compiled is None:
+                products = self._load()
+                if self.storage.table_version(CATALOG_TABLE) != version:
+                    # El archivo cambió mientras se leía (copia en curso): se reintenta en la próxima consulta
+                    if self._compiled is not None:
+                        return
+                    compiled = CompiledCatalog(build_catalog(products, source))
+                elif not products and self._compiled is not None and len(self._compiled):
+                    print("Catálogo nuevo vacío; se mantiene la versión anterior")
+                    return
+                else:
+                    try:
+                        write_catalog(self.compiled_path, products, source)
+                        compiled = CompiledCatalog.open(self.compiled_path)
+                    except Exception as e:
+                        print(f"Error compilando catálogo, se usa en memoria: {e}")
+                        compiled = CompiledCatalog(build_catalog(products, source))
+            self._compiled = compiled
+            self._version = version
+
+    def products(self):
+        """Lista de productos vigente (leída de la tabla; para consultas por código usar find)"""
+        return self._load()
+
+    def find(self, code):
+        """Primer producto cuyo código de fábrica o de venta coincide, o None"""
+        self._ensure_loaded()
+        return self._compiled.find(code)
+
+    def find_sales_code(self, code):
+        """Producto por código de venta exacto, o None"""
+        self._ensure_loaded()
+        return self._compiled.find_sales_code(code)
+
+    def version(self):
+        """Número de la última versión publicada con upload (0 si nunca se publicó)"""
+        versions = self.storage.load_table(VERSIONS_TABLE)
+        return int(versions[-1].get('version') or 0) if versions else 0
+
+    def _replaced(self, rows, version):
+        """Si productos.csv ya no es la tabla publicada con `version` (se reemplazó fuera de upload)"""
+        recorded = next((row.get('tabla') for row in reversed(rows)
+                         if row.get('accion') in ('version', 'reset') and row.get('version') == str(version)), None)
+        return recorded != repr(self.storage.table_version(CATALOG_TABLE))
+
+    def published(self):
+        """(versión publicada, productos) leídos juntos (no se mezclan con un upload en curso)"""
+        with self._lock:
+            return self.version(), self._load()
+
+    def changes_since(self, since):
+        """
+        (versión actual, productos nuevos o modificados, códigos eliminados) desde la versión
+        `since`, con el último cambio de cada código. None si no se puede armar (versión
+        desconocida, cambios no registrados o productos.csv reemplazado fuera de upload, hasta
+        el próximo upload): el cliente debe bajar el catálogo completo. Solo lee.
+        """
+        with self._lock:
+            current = self.version()
+            rows = self.storage.load_table(CHANGES_TABLE)
+            if self._replaced(rows, current):
+                return None
+        if since == current:
+            return current, [], []
+        if since < 0 or since > current:
+            return None
+        changes = {}
+        complete = set()
+        for row in rows:
+            try:
+                version = int(row.get('version') or 0)
+            except ValueError:
+                continue
+            if not since < version <= current:
+                continue
+            if row.get('accion') == 'reset':
+                return None
+            if row.get('accion') == 'version':
+                complete.add(version)
+            else:
+                changes[row.get('cod_venta', '')] = row
+        if complete != set(range(since + 1, current + 1)):
+            return None
+        upserts = [{name: row.get(name, '') for name in FIELDNAMES}
+                   for row in changes.values() if row.get('accion') == 'upsert']
+        deletes = [code for code, row in changes.items() if row.get('accion') == 'delete']
+        return current, upserts, deletes
+
+    def _save_changes(self, version, upserts, deletes, table, action='version'):
+        """Reescribir catalogo_cambios.csv con los cambios de `version` (descarta restos de intentos fallidos)"""
+        rows = [row for row in self.storage.load_table(CHANGES_TABLE)
+                if (row.get('version') or '0').isdigit() and int(row['version']) < version]
+        rows += [{'version': version, 'accion': 'upsert', **{name: p.get(name, '') for name in FIELDNAMES}}
+                 for p in upserts]
+        rows += [{'version': version, 'accion': 'delete', 'cod_venta': code} for code in deletes]
+        rows.append({'version': version, 'accion': action, 'tabla': repr(table)})
+        return self.storage.save_table(CHANGES_TABLE, rows, CHANGE_FIELDNAMES)
+
+    def upload(self, stream, origin='', dry_run=False):
+        """
+        Validar un catálogo nuevo y, si no tiene errores, reemplazar el vigente.
+        Retorna un resumen con la diferencia; lanza CatalogError si hay filas inválidas.
+        """
+        products, errors, error_count = parse_catalog(stream, self.config)
+        if error_count:
+            raise CatalogError(errors, error_count)
+        if not products:
+            raise CatalogError([{'linea': 0, 'mensaje': 'El catálogo no tiene productos'}])
+
+        old_products = self.products()
+        diff = diff_catalogs(old_products, products)
+        summary = {
+            'rows': len(products),
+            'added': len(diff['added']),
+            'removed': len(diff['removed']),
+            'repriced': len(diff['repriced']),
+            'diff': diff,
+            'dry_run': dry_run
+        }
+        if dry_run:
+            summary['version'] = self.version()
+            return summary
+
+        with self._lock:
+            version = self.version() + 1
+            # Si productos.csv se reemplazó fuera de upload, los dispositivos pueden tener
+            # cualquiera de las dos tablas con el número anterior: la versión nueva es 'reset'
+            action = 'reset' if self._replaced(self.storage.load_table(CHANGES_TABLE), version - 1) else 'version'
+            if not self.storage.save_table(CATALOG_TABLE, products, FIELDNAMES):
+                raise IOError('No se pudo guardar el catálogo')
+            upserts, deletes = catalog_changes(old_products, products)
+            table = self.storage.table_version(CATALOG_TABLE)
+            if not self._save_changes(version, upserts, deletes, table, action):
+                print(f"No se guardaron los cambios de la versión {version}; los dispositivos recargarán el catálogo")
+            self.storage.append_table_row(VERSIONS_TABLE, {
+                'version': version,
+                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'filas': len(products),
+                'agregados': len(diff['added']),
+                'eliminados': len(diff['removed']),
+                'cambios_precio': len(diff['repriced']),
+                'origen': origin
+            }, VERSION_FIELDNAMES)
+        summary['version'] = version
+        print(f"Catálogo versión {version} publicado: {len(products)} productos, "
+              f"{summary['added']} agregados, {summary['removed']} eliminados, {summary['repriced']} con cambio de precio")
+        return summary
+
+
+if __name__ == '__main__':
+    import argparse
+    from config import get_config
+    from storage import create_storage
+
+    parser = argparse.ArgumentParser(description='Publicar un catálogo de productos validado')
+    parser.add_argument('command', choices=['upload'], help='upload: validar y reemplazar productos.csv')
+    parser.add_argument('file', help='CSV con cod_fabrica, cod_venta, descripcion, precio')
+    parser.add_argument('--dry-run', action='store_true', help='Solo validar y mostrar la diferencia')
+    args = parser.parse_args()
+
+    app_config = get_config()
+    catalog = Catalog(create_storage(app_config), app_config)
+    with open(args.file, 'r', encoding='utf-8-sig', newline='') as file:
+        try:
+            result = catalog.upload(file, origin=f'cli:{args.file}', dry_run=args.dry_run)
+        except CatalogError as e:
+            for item in e.errors:
+                print(f"Línea {item['linea']}: {item['mensaje']}")
+            if e.total > len(e.errors):
+                print(f"... y {e.total - len(e.errors)} errores más")
+            raise SystemExit(1)
+    for product in result['diff']['added']:
+        print(f"+ {product['cod_venta']} {product['descripcion']} {product['precio']}")
+    for product in result['diff']['removed']:
+        print(f"- {product.get('cod_venta')} {product.get('descripcion', '')}")
+    for item in result['diff']['repriced']:
+        print(f"~ {item['cod_venta']} {item['precio_anterior']} -> {item['precio_nuevo']}")
+    print(f"{'Validación' if args.dry_run else 'Versión ' + str(result['version'])}: {result['rows']} productos")
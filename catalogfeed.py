@@ -0,0 +1,72 @@
+"""
+Catálogo para consulta sin conexión en los dispositivos de venta.
+
+/api/catalog/snapshot entrega el catálogo completo en forma compacta (una lista
+por producto, sin repetir los nombres de las columnas) y comprimido con gzip,
+junto con su número de versión. El dispositivo lo guarda y resuelve los escaneos
+localmente; después pide /api/catalog/delta?since=<versión> y recibe solo los
+productos nuevos o modificados y los códigos eliminados desde esa versión. El
+servidor sigue verificando cada producto al registrar la venta.
+
+El snapshot comprimido se arma una vez por versión de productos.csv (y de la
+carpeta de fotos, por la columna foto) y se reutiliza para todos los dispositivos.
+"""
+import gzip
+import json
+import threading
+
+from catalog import CATALOG_TABLE
+from conditional import make_etag
+from config import parse_amount
+
+FIELDS = ['cod_venta', 'cod_fabrica', 'descripcion', 'precio', 'foto']
+
+
+class CatalogFeed:
+    """Snapshot comprimido del catálogo (cacheado por versión) y cambios incrementales"""
+
+    def __init__(self, catalog, photo_library):
+        self.catalog = catalog
+        self.photo_library = photo_library
+        self._lock = threading.Lock()
+        self._snapshot = None   # (firma, etag, json, json gzip)
+
+    def _row(self, product):
+        cod_fabrica = product.get('cod_fabrica', '')
+        return [product.get('cod_venta', ''), cod_fabrica, product.get('descripcion', ''),
+                parse_amount(product.get('precio')), self.photo_library.photo_name(cod_fabrica)]
+
+    def snapshot(self):
+        """(etag, json, json gzip) del catálogo vigente"""
+        signature = (self.catalog.storage.table_version(CATALOG_TABLE), self.photo_library.version())
+        cached = self._snapshot
+        if cached and cached[0] == signature:
+            return cached[1:]
+        with self._lock:
+            cached = self._snapshot
+            if cached and cached[0] == signature:
+                return cached[1:]
+            version, products = self.catalog.published()
+            body = json.dumps({
+                'version': version,
+                'fields': FIELDS,
+                'products': [self._row(product) for product in products if product.get('cod_venta')]
+            }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            self._snapshot = (signature, make_etag('catalog', version, signature), body,
+                              gzip.compress(body, compresslevel=6))
+            return self._snapshot[1:]
+
+    def delta(self, since):
+        """Cambios desde `since` en la misma forma compacta, o {'reset': True} si hay que recargar"""
+        changes = self.catalog.changes_since(since)
+        if changes is None:
+            return {'version': self.catalog.version(), 'reset': True}
+        version, upserts, deletes = changes
+        return {
+            'version': version,
+            'since': since,
+            'reset': False,
+            'fields': FIELDS,
+            'upserts': [self._row(product) for product in upserts],
+            'deletes': deletes
+        }
@@ -0,0 +1,157 @@
+"""
+Catálogo compilado (data/productos.catalog) para buscar por código con mmap.
+
+En lugar de un dict por producto en cada worker, el catálogo se compila a un
+archivo binario de solo lectura que todos los procesos abren con mmap: la
+memoria la comparte el page cache del sistema y abrirlo es instantáneo.
+
+Formato:  [MAGIC][N, ventas, fabrica, ancho, largo meta: 5 x uint32][meta JSON]
+          [claves cod_venta: (código de `ancho` bytes, fila uint32) ordenadas]
+          [claves cod_fabrica: ídem]
+          [filas: (offset uint32, largo uint32, precio int64) x N]
+          [heap: valores de cada fila en UTF-8 separados por \\x1f]
+
+Las claves se ordenan por (código, fila); la primera coincidencia de la búsqueda
+binaria es el primer producto del archivo con ese código, igual que la búsqueda
+lineal original. El meta guarda las columnas y la versión de productos.csv de la
+que se compiló.
+"""
+import json
+import mmap
+import os
+import struct
+
+from config import parse_amount
+
+MAGIC = b'PGVCAT01'
+HEADER = struct.Struct('<5I')
+ROW = struct.Struct('<IIq')
+ROW_INDEX = struct.Struct('<I')
+FIELD_SEPARATOR = '\x1f'
+NO_PRICE = -2 ** 63
+
+
+def build_catalog(products, source):
+    """Compilar una lista de productos (dicts) a bytes; `source` identifica la versión de origen"""
+    fieldnames = []
+    for product in products:
+        for name in product:
+            if name not in fieldnames:
+                fieldnames.append(name)
+
+    heap = bytearray()
+    rows = bytearray()
+    sales_keys = []
+    factory_keys = []
+    for i, product in enumerate(products):
+        values = [str(product.get(name) or '').replace(FIELD_SEPARATOR, ' ') for name in fieldnames]
+        record = FIELD_SEPARATOR.join(values).encode('utf-8')
+        price = parse_amount(product.get('precio'))
+        rows += ROW.pack(len(heap), len(record), NO_PRICE if price is None else price)
+        heap += record
+        if product.get('cod_venta'):
+            sales_keys.append((product['cod_venta'].encode('utf-8'), i))
+        if product.get('cod_fabrica'):
+            factory_keys.append((product['cod_fabrica'].encode('utf-8'), i))
+
+    width = max([len(code) for code, _ in sales_keys + factory_keys] or [1])
+    meta = json.dumps({'source': source, 'fieldnames': fieldnames}, ensure_ascii=False).encode('utf-8')
+    out = bytearray(MAGIC)
+    out += HEADER.pack(len(products), len(sales_keys), len(factory_keys), width, len(meta))
+    out += meta
+    for keys in (sales_keys, factory_keys):
+        for code, i in sorted(keys):
+            out += code.ljust(width, b'\0') + ROW_INDEX.pack(i)
+    out += rows
+    out += heap
+    return bytes(out)
+
+
+def write_catalog(path, products, source):
+    """Compilar y escribir el catálogo (temporal y rename: los workers nunca ven un archivo a medias)"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as file:
+            file.write(build_catalog(products, source))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class CompiledCatalog:
+    """Catálogo compilado sobre un buffer (mmap del archivo o bytes en memoria)"""
+
+    def __init__(self, buffer):
+        if buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError('Catálogo compilado inválido')
+        self._buffer = buffer
+        offset = len(MAGIC)
+        self.count, sales_count, factory_count, self.width, meta_length = HEADER.unpack_from(buffer, offset)
+        offset += HEADER.size
+        meta = json.loads(bytes(buffer[offset:offset + meta_length]).decode('utf-8'))
+        self.source = meta['source']
+        self.fieldnames = meta['fieldnames']
+        offset += meta_length
+        self._key_size = self.width + ROW_INDEX.size
+        self._sales = (offset, sales_count)
+        offset += sales_count * self._key_size
+        self._factory = (offset, factory_count)
+        offset += factory_count * self._key_size
+        self._rows = offset
+        self._heap = offset + self.count * ROW.size
+
+    @classmethod
+    def open(cls, path):
+        """Abrir un archivo compilado con mmap de solo lectura"""
+        with open(path, 'rb') as file:
+            return cls(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def __len__(self):
+        return self.count
+
+    def _search(self, section, code):
+        """Fila del primer producto con `code` en la sección de claves, o None"""
+        start, count = section
+        key = code.encode('utf-8')
+        if len(key) > self.width:
+            return None
+        key = key.ljust(self.width, b'\0')
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            position = start + mid * self._key_size
+            if self._buffer[position:position + self.width] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        position = start + lo * self._key_size
+        if lo < count and self._buffer[position:position + self.width] == key:
+            return ROW_INDEX.unpack_from(self._buffer, position + self.width)[0]
+        return None
+
+    def product(self, row):
+        """Producto de una fila como dict (mismas columnas que productos.csv)"""
+        offset, length, _ = ROW.unpack_from(self._buffer, self._rows + row * ROW.size)
+        record = bytes(self._buffer[self._heap + offset:self._heap + offset + length]).decode('utf-8')
+        return dict(zip(self.fieldnames, record.split(FIELD_SEPARATOR)))
+
+    def price(self, row):
+        """Precio entero de una fila, o None si no se pudo leer"""
+        price = ROW.unpack_from(self._buffer, self._rows + row * ROW.size)[2]
+        return None if price == NO_PRICE else price
+
+    def find_row(self, code):
+        """Fila del primer producto cuyo código de fábrica o de venta coincide, o None"""
+        rows = [row for row in (self._search(self._factory, code), self._search(self._sales, code)) if row is not None]
+        return min(rows) if rows else None
+
+    def find(self, code):
+        row = self.find_row(code) if code else None
+        return self.product(row) if row is not None else None
+
+    def find_sales_code(self, code):
+        row = self._search(self._sales, code) if code else None
+        return self.product(row) if row is not None else None
@@ -0,0 +1,265 @@
+"""
+Almacén de comentarios con índice invertido y consulta paginada.
+
+Los comentarios se siguen guardando en un CSV por día (comments/<prefijo>_YYYY-MM-DD.csv).
+Además, por cada comentario se agrega una línea al índice mensual
+comments/index/YYYY-MM.idx con su posición (archivo, offset, largo) y sus palabras:
+
+    timestamp \\t tipo \\t archivo \\t offset \\t largo \\t palabra palabra ...
+
+La línea del índice se escribe mientras se tiene el lock del archivo diario; al
+iniciar, `reconcile` indexa las filas que hayan quedado sin línea (ej: un corte
+entre las dos escrituras). Agregar sigue siendo O(1). Las consultas leen solo los
+índices de los meses del rango (cacheados e incrementales) y abren únicamente los
+archivos de la página pedida.
+"""
+import csv
+import fcntl
+import io
+import os
+import re
+import threading
+import unicodedata
+from datetime import datetime
+
+# Tipo de comentario -> prefijo del archivo diario
+COMMENT_KINDS = {
+    'events': 'commentsventa',
+    'points': 'commentsbazar'
+}
+FIELDNAMES = ['timestamp', 'comment']
+
+_WORD_RE = re.compile(r'\w{2,}')
+
+
+def tokenize(text):
+    """Palabras en minúsculas y sin tildes (para indexar y buscar)"""
+    normalized = unicodedata.normalize('NFKD', text.lower())
+    normalized = ''.join(c for c in normalized if not unicodedata.combining(c))
+    return set(_WORD_RE.findall(normalized))
+
+
+class _MonthIndex:
+    """Entradas e índice invertido de un mes, leídos de forma incremental"""
+
+    def __init__(self):
+        self.size = 0
+        self.entries = []   # (timestamp, tipo, archivo, offset, largo)
+        self.postings = {}  # palabra -> lista de posiciones en entries
+
+
+class CommentStore:
+    """Guardar comentarios diarios y consultarlos por fecha, tipo y palabras"""
+
+    def __init__(self, comments_dir, encoding='utf-8', delimiter=';'):
+        self.comments_dir = comments_dir
+        self.index_dir = os.path.join(comments_dir, 'index')
+        self.encoding = encoding
+        self.delimiter = delimiter
+        self._lock = threading.Lock()
+        self._months = {}
+        if not os.path.isdir(self.index_dir):
+            self.rebuild_index()
+        else:
+            self.reconcile()
+
+    def _daily_files(self):
+        """(archivo, tipo, mes) de los archivos diarios de comentarios"""
+        prefixes = {prefix: kind for kind, prefix in COMMENT_KINDS.items()}
+        for filename in sorted(os.listdir(self.comments_dir)):
+            match = re.match(r'^(\w+?)_(\d{4}-\d{2})-\d{2}\.csv$', filename)
+            if match and match.group(1) in prefixes:
+                yield filename, prefixes[match.group(1)], match.group(2)
+
+    def _row_lines(self, data, offset, kind, filename):
+        """Líneas de índice de las filas de `data` desde `offset` (inicio de una fila)"""
+        lines = []
+        while offset and offset < len(data):
+            end = offset
+            # Una fila puede ocupar varias líneas si el comentario tiene saltos (entre comillas)
+            while True:
+                newline = data.find(b'\n', end)
+                end = len(data) if newline == -1 else newline + 1
+                if data[offset:end].count(b'"') % 2 == 0 or end == len(data):
+                    break
+            raw = data[offset:end]
+            row = next(csv.reader(io.StringIO(raw.decode(self.encoding)), delimiter=self.delimiter), [])
+            if len(row) >= 2:
+                lines.append(self._index_line(row[0], kind, filename, offset, len(raw), row[1]))
+            offset = end
+        return lines
+
+    def _indexed_ends(self, month):
+        """Archivo -> fin de la última fila indexada en el índice del mes"""
+        ends = {}
+        try:
+            with open(self._index_path(month), 'r', encoding='utf-8') as index:
+                for line in index:
+                    parts = line.split('\t')
+                    if len(parts) >= 6:
+                        ends[parts[2]] = max(ends.get(parts[2], 0), int(parts[3]) + int(parts[4]))
+        except OSError:
+            pass
+        return ends
+
+    def reconcile(self):
+        """Indexar las filas de los archivos diarios que no tienen línea en el índice"""
+        ends_by_month = {}
+        repaired = 0
+        for filename, kind, month in self._daily_files():
+            if month not in ends_by_month:
+                ends_by_month[month] = self._indexed_ends(month)
+            filepath = os.path.join(self.comments_dir, filename)
+            if os.path.getsize(filepath) <= ends_by_month[month].get(filename, 0):
+                continue
+            with open(filepath, 'rb') as file:
+                # Con el lock del archivo nadie agrega filas ni líneas de índice para él
+                fcntl.flock(file, fcntl.LOCK_EX)
+                try:
+                    indexed = self._indexed_ends(month).get(filename, 0)
+                    data = file.read()
+                    start = indexed or data.find(b'\n') + 1  # sin filas indexadas: después del encabezado
+                    lines = self._row_lines(data, start, kind, filename)
+                    if lines:
+                        self._write_index(month, ''.join(lines))
+                        repaired += len(lines)
+                finally:
+                    fcntl.flock(file, fcntl.LOCK_UN)
+        if repaired:
+            print(f"Índice de comentarios: {repaired} comentarios sin indexar agregados")
+
+    def _write_index(self, month, text):
+        os.makedirs(self.index_dir, exist_ok=True)
+        with open(self._index_path(month), 'a', encoding='utf-8') as index:
+            fcntl.flock(index, fcntl.LOCK_EX)
+            try:
+                index.write(text)
+                index.flush()
+            finally:
+                fcntl.flock(index, fcntl.LOCK_UN)
+
+    def _index_path(self, month):
+        return os.path.join(self.index_dir, f"{month}.idx")
+
+    @staticmethod
+    def _index_line(timestamp, kind, filename, offset, length, comment):
+        words = ' '.join(sorted(tokenize(comment)))
+        return f"{timestamp}\t{kind}\t{filename}\t{offset}\t{length}\t{words}\n"
+
+    def append(self, kind, comment, now=None):
+        """Agregar un comentario al archivo del día y registrar su posición en el índice"""
+        now = now or datetime.now()
+        timestamp = now.strftime('%Y-%m-%d %H:%M:%S')
+        filename = f"{COMMENT_KINDS[kind]}_{now.strftime('%Y-%m-%d')}.csv"
+        filepath = os.path.join(self.comments_dir, filename)
+
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=FIELDNAMES, delimiter=self.delimiter)
+        writer.writerow({'timestamp': timestamp, 'comment': comment})
+        row = buffer.getvalue().encode(self.encoding)
+
+        with open(filepath, 'ab') as file:
+            # Bloqueo para que el offset sea correcto aunque escriban varios procesos
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                offset = file.seek(0, os.SEEK_END)
+                if offset == 0:
+                    header = io.StringIO()
+                    csv.DictWriter(header, fieldnames=FIELDNAMES, delimiter=self.delimiter).writeheader()
+                    offset += file.write(header.getvalue().encode(self.encoding))
+                file.write(row)
+                file.flush()
+                # Índice con el lock del archivo tomado (reconcile cuenta con eso)
+                self._write_index(now.strftime('%Y-%m'),
+                                  self._index_line(timestamp, kind, filename, offset, len(row), comment))
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def rebuild_index(self):
+        """Reconstruir los índices mensuales leyendo todos los archivos diarios existentes"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        lines_by_month = {}
+        for filename, kind, month in self._daily_files():
+            with open(os.path.join(self.comments_dir, filename), 'rb') as file:
+                data = file.read()
+            # saltar encabezado
+            lines_by_month.setdefault(month, []).extend(self._row_lines(data, data.find(b'\n') + 1, kind, filename))
+        for month, lines in lines_by_month.items():
+            with open(self._index_path(month), 'w', encoding='utf-8') as index:
+                index.writelines(lines)
+        self._months = {}
+        print(f"Índice de comentarios reconstruido: {sum(len(v) for v in lines_by_month.values())} comentarios")
+
+    def _load_month(self, month):
+        """Índice de un mes, leyendo solo las líneas agregadas desde la última vez"""
+        path = self._index_path(month)
+        with self._lock:
+            index = self._months.setdefault(month, _MonthIndex())
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                return index
+            if size > index.size:
+                with open(path, 'rb') as file:
+                    file.seek(index.size)
+                    data = file.read(size - index.size)
+                end = data.rfind(b'\n') + 1
+                for line in data[:end].decode('utf-8').splitlines():
+                    parts = line.split('\t')
+                    if len(parts) < 6:
+                        continue
+                    position = len(index.entries)
+                    index.entries.append((parts[0], parts[1], parts[2], int(parts[3]), int(parts[4])))
+                    for word in parts[5].split():
+                        index.postings.setdefault(word, []).append(position)
+                index.size += end
+            return index
+
+    def _read_comment(self, filename, offset, length):
+        with open(os.path.join(self.comments_dir, filename), 'rb') as file:
+            file.seek(offset)
+            raw = file.read(length).decode(self.encoding)
+        row = next(csv.reader(io.StringIO(raw), delimiter=self.delimiter), ['', ''])
+        return row[1] if len(row) > 1 else ''
+
+    def search(self, query='', kind=None, start_date=None, end_date=None, page=1, per_page=20):
+        """
+        Comentarios más recientes primero, filtrados por tipo, fechas ('YYYY-MM-DD')
+        y palabras (todas deben aparecer). Retorna (comentarios_de_la_página, total).
+        """
+        words = tokenize(query or '')
+        months = sorted((name[:-4] for name in os.listdir(self.index_dir) if name.endswith('.idx')), reverse=True)
+        if start_date:
+            months = [m for m in months if m >= start_date[:7]]
+        if end_date:
+            months = [m for m in months if m <= end_date[:7]]
+
+        matches = []
+        for month in months:
+            index = self._load_month(month)
+            if words:
+                positions = None
+                for word in words:
+                    found = set(index.postings.get(word, ()))
+                    positions = found if positions is None else positions & found
+                    if not positions:
+                        break
+                candidates = [index.entries[p] for p in positions or ()]
+            else:
+                candidates = index.entries
+            for entry in candidates:
+                day = entry[0][:10]
+                if kind and entry[1] != kind:
+                    continue
+                if (start_date and day < start_date) or (end_date and day > end_date):
+                    continue
+                matches.append(entry)
+
+        matches.sort(key=lambda e: e[0], reverse=True)
+        page_entries = matches[(page - 1) * per_page: page * per_page]
+        comments = [{
+            'timestamp': timestamp,
+            'tipo': entry_kind,
+            'comment': self._read_comment(filename, offset, length)
+        } for timestamp, entry_kind, filename, offset, length in page_entries]
+        return comments, len(matches)
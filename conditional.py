@@ -0,0 +1,46 @@
+"""
+Respuestas condicionales (ETag / Last-Modified) para las APIs que se consultan
+periódicamente.
+
+El validador se arma solo con las versiones de lo que usa el endpoint (mtime y
+tamaño de los archivos, o contadores de la base) y con los parámetros de la
+consulta. Si el cliente ya tiene esa versión (If-None-Match o If-Modified-Since)
+se responde 304 sin cargar ni agregar datos.
+"""
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from flask import Response
+
+
+def make_etag(*parts):
+    """ETag a partir de las versiones y parámetros de los que depende una respuesta"""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:24]
+
+
+def _http_datetime(timestamp):
+    return datetime.fromtimestamp(int(timestamp), tz=timezone.utc) if timestamp else None
+
+
+def not_modified(request, etag, last_modified=None):
+    """Respuesta 304 si el cliente ya tiene esta versión, o None para construir la respuesta"""
+    if request.if_none_match:
+        # If-None-Match tiene prioridad sobre If-Modified-Since
+        if not request.if_none_match.contains_weak(etag):
+            return None
+    elif not (last_modified and request.if_modified_since
+              and request.if_modified_since >= _http_datetime(last_modified)):
+        return None
+    return with_validators(Response(status=304), etag, last_modified)
+
+
+def with_validators(response, etag, last_modified=None):
+    """Agregar ETag y Last-Modified; el cliente debe revalidar siempre (no-cache)"""
+    response.set_etag(etag)
+    # Last-Modified tiene resolución de segundos: si el dato cambió en el segundo en
+    # curso podría volver a cambiar sin que la fecha cambie, y no se envía
+    if last_modified and int(last_modified) < int(time.time()):
+        response.last_modified = _http_datetime(last_modified)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
@@ -1,4 +1,5 @@
 import os
+import re
 from datetime import timedelta
 
 # Configuración base
@@ -8,20 +9,68 @@ class Config:
     
     # Configuración de directorios
     BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-    DATA_DIR = os.path.join(BASE_DIR, 'data')
-    SALES_DIR = os.path.join(BASE_DIR, 'sales_data')
-    COMMENTS_DIR = os.path.join(BASE_DIR, 'comments')
+    # Raíz de los datos (por defecto junto al código; loadtest.py usa un directorio sintético)
+    DATA_ROOT = os.environ.get('DATA_ROOT') or BASE_DIR
+    DATA_DIR = os.path.join(DATA_ROOT, 'data')
+    SALES_DIR = os.path.join(DATA_ROOT, 'sales_data')
+    SALES_ARCHIVE_DIR = os.path.join(DATA_ROOT, 'sales_archive')
+    COMMENTS_DIR = os.path.join(DATA_ROOT, 'comments')
+    METRICS_DIR = os.path.join(DATA_ROOT, 'metrics')
+    UPLOADS_DIR = os.path.join(DATA_ROOT, 'uploads')
     PHOTOS_DIR = os.path.join(BASE_DIR, 'static', 'fotos')
     TUTORIALS_DIR = os.path.join(BASE_DIR, 'static', 'tutoriales')
     
     # Configuración de archivos
     ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'pdf', 'mp4', 'txt', 'html'}
     MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
+    # Tutoriales: subida por partes (cada parte hasta MAX_FILE_SIZE) con un total máximo
+    TUTORIAL_MAX_SIZE = int(os.environ.get('TUTORIAL_MAX_SIZE', 2 * 1024 * 1024 * 1024))  # 2GB
     
     # Configuración de aplicación
     SESSION_TIMEOUT = timedelta(hours=2)
     ITEMS_PER_PAGE = 20
     
+    # Reportes: procesos para agregar rangos largos y mínimo de días para usar el pool
+    REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', os.cpu_count() or 1))
+    REPORT_PARALLEL_MIN_DAYS = int(os.environ.get('REPORT_PARALLEL_MIN_DAYS', 31))
+    # Modo aproximado de reportes: productos monitoreados por el resumen Space-Saving
+    TOPK_SKETCH_CAPACITY = int(os.environ.get('TOPK_SKETCH_CAPACITY', 200))
+
+    # Almacenamiento: 'filesystem' (CSV locales) o 'sqlite' (base compartida entre instancias)
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'filesystem')
+    STORAGE_SQLITE_PATH = os.environ.get('STORAGE_SQLITE_PATH') or os.path.join(DATA_ROOT, 'shared', 'progesven.db')
+
+    # Stock por lugar: checkpoint de los contadores de movimientos
+    STOCK_CHECKPOINT_PATH = os.path.join(METRICS_DIR, 'stock_checkpoint.json')
+    # Devoluciones: días hacia atrás en que se aceptan devoluciones de lo vendido
+    RETURN_WINDOW_DAYS = int(os.environ.get('RETURN_WINDOW_DAYS', 30))
+
+    # Tendencias: días de historia de la matriz día x lugar y archivo donde se guarda
+    ANALYTICS_HISTORY_DAYS = int(os.environ.get('ANALYTICS_HISTORY_DAYS', 732))
+    ANALYTICS_PATH = os.path.join(METRICS_DIR, 'trends.npz')
+    ANALYTICS_MAX_DAYS = 731
+
+    # Control de admisión (por worker): reportes/exportaciones a la vez, en espera y segundos de espera;
+    # con GUNICORN_THREADS hilos, los que no usan los reportes quedan para registrar ventas
+    GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', 8))
+    ADMISSION_HEAVY_LIMIT = int(os.environ.get('ADMISSION_HEAVY_LIMIT', 2))
+    ADMISSION_HEAVY_QUEUE = int(os.environ.get('ADMISSION_HEAVY_QUEUE', 2))
+    ADMISSION_HEAVY_TIMEOUT = float(os.environ.get('ADMISSION_HEAVY_TIMEOUT', 15))
+    ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 10))
+
+    # Perfiles de peticiones (cProfile/tracemalloc armados a pedido desde /api/admin/profiling)
+    PROFILES_DIR = os.path.join(METRICS_DIR, 'profiles')
+    PROFILE_MAX_REQUESTS = 50
+
+    # Snapshots incrementales de data/, sales_data/, sales_archive/ y comments/ (conviene otro disco)
+    SNAPSHOTS_DIR = os.environ.get('SNAPSHOTS_DIR') or os.path.join(DATA_ROOT, 'snapshots')
+
+    # Catálogo compilado (compartido por los workers con mmap); se regenera si cambia productos.csv
+    CATALOG_COMPILED_PATH = os.path.join(DATA_DIR, 'productos.catalog')
+
+    # Snapshots HTML de las páginas públicas (ej: static/paginas); vacío = solo caché en memoria
+    PAGE_SNAPSHOT_DIR = os.environ.get('PAGE_SNAPSHOT_DIR', '')
+
     # Configuración de códigos
     SALES_CODE_PREFIX = 'BI'
     SALES_CODE_LENGTH = 8  # BINNNNCC
@@ -67,7 +116,10 @@ def ensure_directories(config_obj):
     directories = [
         config_obj.DATA_DIR,
         config_obj.SALES_DIR,
+        config_obj.SALES_ARCHIVE_DIR,
         config_obj.COMMENTS_DIR,
+        config_obj.METRICS_DIR,
+        config_obj.UPLOADS_DIR,
         config_obj.PHOTOS_DIR,
         config_obj.TUTORIALS_DIR
     ]
@@ -97,4 +149,19 @@ def validate_sales_code(code, config_obj):
 
 def validate_factory_code(code, config_obj):
     """Validar formato de código de fábrica"""
-    return 3 <= len(code) <= 8 and code.isalnum()
\ No newline at end of file
+    return 3 <= len(code) <= 8 and code.isalnum()
+
+def parse_amount(value):
+    """Convertir un precio de CSV ('$45.000', '-45000', '-45000.0') a entero, o None si no es válido"""
+    # Los reportes suman los montos con esta función (antes cada uno quitaba los puntos):
+    # '-45000.0' cuenta como -45000 y no -450000, y una venta con precio negativo se suma
+    text = str(value if value is not None else '').replace('$', '').replace(' ', '').strip()
+    if not text:
+        return None
+    # Un punto seguido de 1-2 dígitos es decimal (ej: '-45000.0'); en otro caso es separador de miles
+    if re.match(r'^-?\d+\.\d{1,2}$', text):
+        return int(float(text))
+    text = text.replace('.', '')
+    if text.lstrip('-').isdigit():
+        return int(text)
+    return None
@@ -0,0 +1,182 @@
+"""
+Dimensiones de lugar: tienda, vendedor, comuna y tipo con claves enteras.
+
+Los lugares de las ventas son textos libres que mezclan código de tienda, nombre
+y vendedor ('A01-Vivo Los Trapenses-Gina', 'CM4 Mario', 'Bazar Cenco La Dhesa').
+`LocationDimensions` interpreta cada texto una sola vez y lo asigna a claves
+enteras de tienda y vendedor; la comuna y el tipo salen de la tienda reconocida
+en puntosventa.csv o bazares.csv (con tolerancia a errores de tipeo, ej: 'Dhesa'
+-> 'Dehesa'), y el vendedor de telefonos.csv cuando el lugar está registrado ahí.
+
+Los reportes agrupan con `group_counters`: cada lugar distinto del rango se
+traduce a su clave una vez y los contadores se suman por clave entera.
+"""
+import difflib
+import re
+import threading
+import unicodedata
+
+from storage import clean_location
+
+DIMENSIONS = ('store', 'seller', 'comuna', 'tipo')
+STORE_TABLES = ('puntosventa.csv', 'bazares.csv')
+SELLERS_TABLE = 'telefonos.csv'
+DIRECT_STORE = 'Venta directa'
+UNKNOWN = {'seller': 'Sin vendedor', 'comuna': 'Sin comuna', 'tipo': 'Sin tipo'}
+MATCH_CUTOFF = 0.85
+
+# 'A01-Vivo Los Trapenses-Gina' -> código A01; 'B04-Vende Mario' / 'CM4 Mario' -> vendedor directo
+_CODE_PREFIX = re.compile(r'^[A-Z]\d{2}-\s*')
+_DIRECT_SELLER = re.compile(r'^(?:Vende|CM\s*\d*)\s+(.+)$', re.IGNORECASE)
+_BAZAR_PREFIX = re.compile(r'^bazar\s+', re.IGNORECASE)
+
+
+def normalize_name(text):
+    """Clave de comparación: sin tildes, en minúsculas y solo letras y dígitos"""
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in text if c.isalnum() and not unicodedata.combining(c)).lower()
+
+
+class _Dimension:
+    """Valores de una dimensión con clave entera (0, 1, 2, ... en orden de aparición)"""
+
+    def __init__(self):
+        self.names = []
+        self._keys = {}
+
+    def key(self, name, match_key=None):
+        match_key = match_key or normalize_name(name)
+        key = self._keys.get(match_key)
+        if key is None:
+            key = self._keys[match_key] = len(self.names)
+            self.names.append(name)
+        return key
+
+
+class LocationDimensions:
+    """Lugar (texto de las ventas) -> claves de tienda, vendedor, comuna y tipo"""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._lock = threading.RLock()
+        self._version = None
+
+    def _tables_version(self):
+        return tuple(self.storage.table_version(name) for name in STORE_TABLES + (SELLERS_TABLE,))
+
+    def _reload(self):
+        """Rearmar las dimensiones si cambió alguna tabla (las claves se reasignan)"""
+        version = self._tables_version()
+        if version == self._version:
+            return
+        self.dimensions = {name: _Dimension() for name in DIMENSIONS}
+        self._stores = {}   # nombre normalizado -> (nombre, comuna, tipo)
+        for table in STORE_TABLES:
+            for row in self.storage.load_table(table):
+                name = (row.get('nombrepunto') or '').strip()
+                if name and normalize_name(name) not in self._stores:
+                    self._stores[normalize_name(name)] = (name, (row.get('comuna') or '').strip(),
+                                                          (row.get('tipo') or '').strip().capitalize())
+        self._sellers = {}  # lugar -> (vendedor, tipo)
+        for row in self.storage.load_table(SELLERS_TABLE):
+            lugar = clean_location(row.get('lugar') or '')
+            if lugar:
+                self._sellers[lugar] = ((row.get('nombre') or '').strip(), (row.get('tipo') or '').strip().capitalize())
+        self._seller_tipos = {normalize_name(name): tipo for name, tipo in self._sellers.values() if name}
+        self._rows = {}     # lugar -> (tienda, vendedor, comuna, tipo)
+        self._version = version
+
+    def _match_store(self, text):
+        """(nombre, comuna, tipo) de la tienda conocida más parecida, o None"""
+        match_key = normalize_name(_BAZAR_PREFIX.sub('', text.strip()))
+        if not match_key:
+            return None
+        if match_key in self._stores:
+            return self._stores[match_key]
+        close = difflib.get_close_matches(match_key, list(self._stores), n=1, cutoff=MATCH_CUTOFF)
+        return self._stores[close[0]] if close else None
+
+    def _seller_name(self, name):
+        # 'Gina2' o 'Ale1' son otras cuentas de 'Gina' y 'Ale' (si ese nombre existe)
+        base = re.sub(r'\d+$', '', name).strip()
+        if base != name and normalize_name(base) in self._seller_tipos:
+            return base
+        return name
+
+    def _parse(self, lugar):
+        lugar = clean_location(lugar or '')
+        seller, seller_tipo = self._sellers.get(lugar, ('', ''))
+        rest = _CODE_PREFIX.sub('', lugar)
+
+        store = None
+        direct = _DIRECT_SELLER.match(rest)
+        if direct:
+            seller = seller or direct.group(1).strip()
+            store = (DIRECT_STORE, '', seller_tipo or self._seller_tipos.get(normalize_name(seller), ''))
+        else:
+            store = self._match_store(rest)
+            if store is None:
+                # 'Tienda-Vendedor' o 'Tienda_Vendedor': la última parte es el vendedor
+                parts = re.split(r'[-_](?=[^-_]*$)', rest, maxsplit=1)
+                if len(parts) == 2 and parts[0].strip():
+                    seller = seller or parts[1].strip()
+                    store = self._match_store(parts[0]) or (_BAZAR_PREFIX.sub('', parts[0]).strip(), '', seller_tipo)
+                else:
+                    store = (_BAZAR_PREFIX.sub('', rest).strip() or lugar, '', seller_tipo)
+
+        name, comuna, tipo = store
+        seller = self._seller_name(seller) if seller else ''
+        dims = self.dimensions
+        return (dims['store'].key(name),
+                dims['seller'].key(seller or UNKNOWN['seller']),
+                dims['comuna'].key(comuna or UNKNOWN['comuna']),
+                dims['tipo'].key(tipo or seller_tipo or UNKNOWN['tipo']))
+
+    def keys(self, lugar):
+        """Claves (tienda, vendedor, comuna, tipo) de un lugar"""
+        with self._lock:
+            self._reload()
+            row = self._rows.get(lugar)
+            if row is None:
+                row = self._rows[lugar] = self._parse(lugar)
+            return row
+
+    def describe(self, lugar):
+        """Nombres de las dimensiones de un lugar: {'store': ..., 'seller': ..., ...}"""
+        with self._lock:
+            keys = self.keys(lugar)
+            return {name: self.dimensions[name].names[key] for name, key in zip(DIMENSIONS, keys)}
+
+    def group_counters(self, counters_by_location, dimension):
+        """
+        Sumar contadores [ventas, devoluciones, monto] por lugar en la dimensión pedida.
+        Retorna [{key, name, sales_count, returns_count, net_count, amount, locations}] por monto.
+        """
+        index = DIMENSIONS.index(dimension)
+        totals = {}
+        members = {}
+        with self._lock:
+            for lugar, (sales_count, returns_count, amount) in counters_by_location.items():
+                if not lugar:
+                    continue
+                key = self.keys(lugar)[index]
+                current = totals.get(key)
+                if current is None:
+                    current = totals[key] = [0, 0, 0]
+                    members[key] = []
+                current[0] += sales_count
+                current[1] += returns_count
+                current[2] += amount
+                members[key].append(lugar)
+            names = self.dimensions[dimension].names
+        groups = [{
+            'key': key,
+            'name': names[key],
+            'sales_count': sales_count,
+            'returns_count': returns_count,
+            'net_count': sales_count - returns_count,
+            'amount': amount,
+            'locations': sorted(members[key])
+        } for key, (sales_count, returns_count, amount) in totals.items()]
+        groups.sort(key=lambda group: group['amount'], reverse=True)
+        return groups
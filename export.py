@@ -0,0 +1,161 @@
+"""
+Exportación de ventas y devoluciones por rango de fechas (CSV o XLSX).
+
+Las filas se generan en orden de timestamp mezclando (k-way merge con heapq) los
+archivos de cada día, sin cargar el rango completo en memoria. El XLSX se arma
+como un zip en streaming: cada trozo comprimido se entrega apenas se produce.
+"""
+import csv
+import heapq
+import io
+import re
+import zipfile
+from datetime import timedelta
+from xml.sax.saxutils import escape
+
+from config import parse_amount
+
+EXPORT_FIELDS = ['timestamp', 'tipo', 'lugar', 'cod_fabrica', 'cod_venta', 'descripcion', 'monto', 'motivo']
+
+# Caracteres de control no permitidos en XML
+_XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _normalized_rows(source, delimiter):
+    """Filas de un archivo diario con el formato de exportación"""
+    tipo = 'devolucion' if source.kind == 'returns' else 'venta'
+    for row in source.rows(delimiter):
+        amount = parse_amount(row.get('precio', '0'))
+        yield {
+            'timestamp': row.get('timestamp', '') or '',
+            'tipo': tipo,
+            'lugar': row.get('lugar') or source.location,
+            'cod_fabrica': row.get('cod_fabrica', '') or '',
+            'cod_venta': row.get('cod_venta', '') or '',
+            'descripcion': row.get('descripcion', '') or '',
+            'monto': amount if amount is not None else 0,
+            'motivo': row.get('motivo', '') or ''
+        }
+
+
+def iter_export_rows(storage, start_date, end_date, delimiter=';'):
+    """
+    Iterar ventas y devoluciones del rango en orden de timestamp.
+    Cada día se resuelve con un merge de los archivos de ese día, así solo quedan
+    abiertos los archivos de un día a la vez.
+    """
+    sources_by_date = storage.range_sources(start_date, end_date)
+    current = start_date
+    while current <= end_date:
+        sources = sources_by_date.get(current.strftime('%Y-%m-%d'), [])
+        streams = [_normalized_rows(source, delimiter) for source in sources]
+        for row in heapq.merge(*streams, key=lambda r: r['timestamp']):
+            yield row
+        current += timedelta(days=1)
+
+
+def stream_csv(rows, delimiter=';'):
+    """Generar el CSV línea a línea (con BOM para que Excel reconozca UTF-8)"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, delimiter=delimiter)
+    buffer.write('\ufeff')
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    remaining = buffer.getvalue()
+    if remaining:
+        yield remaining.encode('utf-8')
+
+
+class _ChunkBuffer:
+    """Destino no posicionable para zipfile: acumula bytes hasta que se drenan"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Movimientos" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+
+def _xlsx_cell(value):
+    if isinstance(value, int):
+        return f'<c><v>{value}</v></c>'
+    text = escape(_XML_INVALID.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return ('<row>' + ''.join(_xlsx_cell(v) for v in values) + '</row>').encode('utf-8')
+
+
+def stream_xlsx(rows, flush_every=500):
+    """Generar un XLSX mínimo (una hoja, celdas inline) sin armarlo completo en memoria"""
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        zf.writestr('_rels/.rels', _ROOT_RELS)
+        zf.writestr('xl/workbook.xml', _WORKBOOK)
+        zf.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        yield buffer.drain()
+
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                        b'<sheetData>')
+            sheet.write(_xlsx_row(EXPORT_FIELDS))
+            for count, row in enumerate(rows, start=1):
+                sheet.write(_xlsx_row([row[field] for field in EXPORT_FIELDS]))
+                if count % flush_every == 0:
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            sheet.write(b'</sheetData></worksheet>')
+    yield buffer.drain()
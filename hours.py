@@ -0,0 +1,188 @@
+"""
+Índice de horarios de puntos de venta y bazares.
+
+Los horarios de puntosventa.csv ("10:00 - 20:00", "10:00 a 20:00", "Cerrado") y
+las fechas/horarios de bazares.csv se parsean una sola vez a intervalos y se
+guardan en índices de segmentos elementales: una consulta "¿qué está abierto en
+este instante?" o "¿qué bazares hay en este rango?" es una búsqueda binaria.
+Las tablas se vuelven a parsear solo cuando cambia su versión en el almacenamiento.
+"""
+import bisect
+import re
+import threading
+from datetime import date, datetime
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+POINT_DAY_COLUMNS = ['lunes', 'martes', 'miercoles', 'jueves', 'viernes', 'sabado', 'domingo']
+# Columnas de bazares.csv por día de semana (lunes a jueves usan hora_sem)
+BAZAR_DAY_COLUMNS = ['hora_sem', 'hora_sem', 'hora_sem', 'hora_sem', 'hora_vie', 'hora_sab', 'hora_dom']
+
+_HOURS_RE = re.compile(r'(\d{1,2})[:.](\d{2})\s*(?:-|–|a|al|hasta)\s*(\d{1,2})[:.](\d{2})', re.IGNORECASE)
+
+
+def parse_hours(text):
+    """Convertir un horario en texto a lista de (inicio, fin) en minutos del día; [] si está cerrado"""
+    intervals = []
+    for h1, m1, h2, m2 in _HOURS_RE.findall(text or ''):
+        start = int(h1) * 60 + int(m1)
+        end = int(h2) * 60 + int(m2)
+        if end <= start:
+            end += MINUTES_PER_DAY  # cierra después de medianoche
+        intervals.append((start, end))
+    return intervals
+
+
+def parse_event_date(text):
+    """Fecha de bazar en formato dd-mm-yy (o dd-mm-yyyy); None si no se puede leer"""
+    for fmt in ('%d-%m-%y', '%d-%m-%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime((text or '').strip(), fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+class IntervalIndex:
+    """
+    Índice estático de intervalos semiabiertos [inicio, fin) sobre enteros.
+    Se precalcula el conjunto de valores activos en cada segmento elemental entre
+    bordes consecutivos, así una consulta puntual es un bisect.
+    """
+
+    def __init__(self, intervals):
+        bounds = sorted({b for start, end, _ in intervals for b in (start, end)})
+        self.bounds = bounds
+        self.segments = [[] for _ in bounds]
+        for start, end, value in intervals:
+            first = bisect.bisect_left(bounds, start)
+            last = bisect.bisect_left(bounds, end)
+            for i in range(first, last):
+                self.segments[i].append(value)
+
+    def stab(self, point):
+        """Valores cuyo intervalo contiene el punto"""
+        i = bisect.bisect_right(self.bounds, point) - 1
+        if i < 0 or i >= len(self.segments):
+            return []
+        return self.segments[i]
+
+    def overlapping(self, low, high):
+        """Valores cuyo intervalo se cruza con [low, high]"""
+        first = max(0, bisect.bisect_right(self.bounds, low) - 1)
+        last = bisect.bisect_right(self.bounds, high)
+        seen = []
+        found = set()
+        for segment in self.segments[first:last]:
+            for value in segment:
+                if value not in found:
+                    found.add(value)
+                    seen.append(value)
+        return seen
+
+
+class HoursIndex:
+    """Horarios de puntos de venta y bazares, recargados solo cuando cambian las tablas"""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._lock = threading.Lock()
+        self._signature = None
+        # (puntos, bazares, índice de puntos, horarios de bazares, índice de bazares): se
+        # reemplaza completo al recargar y cada consulta usa una sola referencia
+        self._state = ([], [], IntervalIndex([]), [], IntervalIndex([]))
+
+    @property
+    def puntos(self):
+        return self._state[0]
+
+    @property
+    def bazares(self):
+        return self._state[1]
+
+    def _file_signature(self):
+        return tuple(self.storage.table_version(name) for name in ('puntosventa.csv', 'bazares.csv'))
+
+    def _ensure_loaded(self):
+        """Estado vigente (recargado si cambiaron las tablas)"""
+        signature = self._file_signature()
+        if signature == self._signature:
+            return self._state
+        with self._lock:
+            if signature != self._signature:
+                self._state = self._build()
+                self._signature = signature
+            return self._state
+
+    def _build(self):
+        puntos = self.storage.load_table('puntosventa.csv')
+        bazares = self.storage.load_table('bazares.csv')
+
+        # Puntos de venta: intervalos semanales en minutos desde el lunes 00:00
+        weekly = []
+        for i, punto in enumerate(puntos):
+            for weekday, column in enumerate(POINT_DAY_COLUMNS):
+                for start, end in parse_hours(punto.get(column, '')):
+                    base = weekday * MINUTES_PER_DAY
+                    start, end = base + start, base + end
+                    if end > MINUTES_PER_WEEK:
+                        # Domingo después de medianoche continúa el lunes
+                        weekly.append((start, MINUTES_PER_WEEK, i))
+                        weekly.append((0, end - MINUTES_PER_WEEK, i))
+                    else:
+                        weekly.append((start, end, i))
+        points_index = IntervalIndex(weekly)
+
+        # Bazares: rango de fechas (días ordinales, fin inclusive) y horario por día de semana
+        spans = []
+        bazar_hours = []
+        for i, bazar in enumerate(bazares):
+            bazar_hours.append([parse_hours(bazar.get(column, '')) for column in BAZAR_DAY_COLUMNS])
+            if not bazar.get('fech_termino', ''):
+                continue  # sin fecha de término no se muestra
+            start = parse_event_date(bazar.get('fech_inicio', ''))
+            end = parse_event_date(bazar.get('fech_termino', ''))
+            if end is None:
+                # Sin fecha de término legible se mantiene visible (mismo criterio que antes)
+                print(f"Fecha de término inválida para bazar {bazar.get('nombrepunto', '')}: {bazar.get('fech_termino', '')}")
+                end = date.max
+            if start is None:
+                start = date.min
+            spans.append((start.toordinal(), end.toordinal() + 1, i))
+        return puntos, bazares, points_index, bazar_hours, IntervalIndex(spans)
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+    def open_points(self, at):
+        """Puntos de venta abiertos en un instante"""
+        puntos, _, points_index, _, _ = self._ensure_loaded()
+        minute = at.weekday() * MINUTES_PER_DAY + at.hour * 60 + at.minute
+        return [puntos[i] for i in sorted(points_index.stab(minute))]
+
+    @staticmethod
+    def _bazar_open(hours, at):
+        minute = at.hour * 60 + at.minute
+        for start, end in hours[at.weekday()]:
+            if start <= minute < end:
+                return True
+        # Horario del día anterior que se extiende después de medianoche
+        previous = hours[(at.weekday() - 1) % 7]
+        return any(end > MINUTES_PER_DAY and minute < end - MINUTES_PER_DAY for start, end in previous)
+
+    def open_bazares(self, at):
+        """Bazares en curso y dentro de su horario en un instante"""
+        _, bazares, _, bazar_hours, bazares_index = self._ensure_loaded()
+        candidates = bazares_index.stab(at.date().toordinal())
+        return [bazares[i] for i in sorted(candidates) if self._bazar_open(bazar_hours[i], at)]
+
+    def bazares_between(self, start_date, end_date):
+        """Bazares cuyo período se cruza con [start_date, end_date]"""
+        _, bazares, _, _, bazares_index = self._ensure_loaded()
+        found = bazares_index.overlapping(start_date.toordinal(), end_date.toordinal())
+        return [bazares[i] for i in sorted(found)]
+
+    def active_bazares(self, today):
+        """Bazares que no han terminado (fecha de término >= hoy)"""
+        return self.bazares_between(today, date.max)
@@ -0,0 +1,336 @@
+"""
+Prueba de carga del punto de venta: muchos vendedores escaneando a la vez.
+
+Arma un directorio de datos sintético (catálogo, lugares e historial de ventas),
+levanta la app con gunicorn apuntando a ese directorio (DATA_ROOT) y simula:
+
+- N vendedores con el flujo real de sales.html: vista previa por cada tecla desde
+  el tercer carácter (/api/search_product), búsqueda al enviar, /api/record_sale y
+  recarga del resumen del día (con If-None-Match, como el navegador);
+- M administradores cargando /api/reports con distintos períodos.
+
+Al terminar informa por endpoint: cantidad, throughput, percentiles de latencia y
+errores; y revisa los archivos de ventas de hoy: filas perdidas, duplicadas (más
+filas que ventas confirmadas) o mal formadas (escrituras intercaladas).
+
+Uso:  python loadtest.py --sellers 40 --admins 3 --duration 60 --workers 4
+"""
+import argparse
+import csv
+import http.client
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from storage import SALES_FIELDNAMES, sales_key
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+COPIED_TABLES = ['puntosventa.csv', 'bazares.csv', 'solicitudes.csv', 'tutoriales.csv', 'telefonos.csv']
+REPORT_PERIODS = ['today', 'week', 'month', 'year']
+
+
+# ----------------------------------------------------------------------
+# Datos sintéticos
+# ----------------------------------------------------------------------
+def build_synthetic_data(root, products, locations, history_days, rows_per_day, seed=1):
+    """Crear data/, sales_data/ y demás directorios bajo `root`; retorna (códigos, lugares)"""
+    rng = random.Random(seed)
+    data_dir = os.path.join(root, 'data')
+    sales_dir = os.path.join(root, 'sales_data')
+    for directory in (data_dir, sales_dir):
+        os.makedirs(directory, exist_ok=True)
+
+    for name in COPIED_TABLES:
+        source = os.path.join(BASE_DIR, 'data', name)
+        if os.path.exists(source):
+            shutil.copy(source, os.path.join(data_dir, name))
+
+    # Códigos BI6NNNCC: se pueden escanear con los últimos 5 caracteres, como en la tienda
+    codes = set()
+    while len(codes) < products:
+        codes.add(f"BI6{rng.randint(0, 999):03d}{rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ')}{rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ')}")
+    codes = sorted(codes)
+    catalog = []
+    with open(os.path.join(data_dir, 'productos.csv'), 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['cod_fabrica', 'cod_venta', 'descripcion', 'precio'])
+        for i, code in enumerate(codes):
+            product = [f"F{i:05d}", code, f"Producto sintético {i}", str(rng.randint(5, 90) * 1000)]
+            catalog.append(product)
+            writer.writerow(product)
+
+    lugares = [f"Tienda {i:02d}" for i in range(1, locations + 1)]
+    today = datetime.now().date()
+    for days_ago in range(1, history_days + 1):
+        fecha = (today - timedelta(days=days_ago)).strftime('%Y-%m-%d')
+        for lugar in lugares:
+            with open(os.path.join(sales_dir, sales_key(lugar, fecha)), 'w', newline='', encoding='utf-8') as file:
+                writer = csv.DictWriter(file, fieldnames=SALES_FIELDNAMES, delimiter=';')
+                writer.writeheader()
+                for _ in range(rows_per_day):
+                    cod_fabrica, cod_venta, descripcion, precio = rng.choice(catalog)
+                    writer.writerow({
+                        'timestamp': f"{fecha} {rng.randint(10, 21):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}",
+                        'lugar': lugar,
+                        'cod_fabrica': cod_fabrica,
+                        'cod_venta': cod_venta,
+                        'descripcion': descripcion,
+                        'precio': precio
+                    })
+    return codes, lugares
+
+
+# ----------------------------------------------------------------------
+# Servidor
+# ----------------------------------------------------------------------
+def start_server(root, port, workers, threads, backend):
+    """Levantar gunicorn con DATA_ROOT=root y esperar a que responda"""
+    env = dict(os.environ, DATA_ROOT=root, STORAGE_BACKEND=backend, FLASK_ENV='production',
+               GUNICORN_THREADS=str(threads))
+    command = [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+               '--workers', str(workers), '--threads', str(threads), '--log-level', 'warning', 'app:app']
+    log = open(os.path.join(root, 'gunicorn.log'), 'w')
+    process = subprocess.Popen(command, cwd=BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn terminó al iniciar (ver {log.name})")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            return process
+        except OSError:
+            time.sleep(0.3)
+    process.terminate()
+    raise RuntimeError('gunicorn no respondió a tiempo')
+
+
+# ----------------------------------------------------------------------
+# Clientes
+# ----------------------------------------------------------------------
+class Stats:
+    """Latencias y errores por endpoint (compartido entre hilos)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}   # endpoint -> {status (o 'conexión'): cantidad}
+
+    def add(self, endpoint, elapsed, ok, status=None):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(elapsed)
+            if not ok:
+                counts = self.errors.setdefault(endpoint, {})
+                counts[status or 'conexión'] = counts.get(status or 'conexión', 0) + 1
+
+
+class Client:
+    """Conexión keep-alive con cookie de sesión, como un navegador"""
+
+    def __init__(self, port, stats):
+        self.port = port
+        self.stats = stats
+        self.cookie = None
+        self.conn = None
+
+    def request(self, endpoint, method, path, body=None, headers=None, check_success=True):
+        """
+        (status, json o None, respuesta); registra latencia y error en `endpoint`.
+        Con check_success=False un {'success': false} no cuenta como error (vista previa parcial).
+        """
+        headers = dict(headers or {})
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        start = time.perf_counter()
+        for attempt in range(2):
+            reused = self.conn is not None
+            try:
+                if self.conn is None:
+                    self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                break
+            except (OSError, http.client.HTTPException):
+                self.conn = None
+                # El servidor cerró la conexión keep-alive inactiva: se reintenta una vez, como el navegador
+                if not reused:
+                    self.stats.add(endpoint, time.perf_counter() - start, False)
+                    return None, None, None
+        elapsed = time.perf_counter() - start
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        payload = None
+        if data and response.getheader('Content-Type', '').startswith('application/json'):
+            payload = json.loads(data)
+        ok = response.status in (200, 304) and not (
+            check_success and isinstance(payload, dict) and payload.get('success') is False)
+        self.stats.add(endpoint, elapsed, ok, response.status)
+        return response.status, payload, response
+
+
+def seller(port, stats, lugar, codes, deadline, keystroke_delay, think, confirmed, lock, rng):
+    client = Client(port, stats)
+    summary_path = f"/api/get_daily_transactions_with_returns/{lugar.replace(' ', '%20')}"
+    etag = None
+    while time.time() < deadline:
+        code = rng.choice(codes)
+        typed = code[-5:]
+        # Vista previa desde el tercer carácter (el navegador normaliza 5 caracteres a BI6 + código)
+        for length in range(3, 6):
+            partial = typed[:length]
+            client.request('search_product (preview)', 'POST', '/api/search_product',
+                           {'code': 'BI6' + partial if length == 5 else partial}, check_success=False)
+            time.sleep(keystroke_delay)
+        client.request('search_product', 'POST', '/api/search_product', {'code': code})
+        status, payload, _ = client.request('record_sale', 'POST', '/api/record_sale', {'lugar': lugar, 'codigo': code})
+        if status == 200 and payload and payload.get('success'):
+            with lock:
+                confirmed[lugar] = confirmed.get(lugar, 0) + 1
+        status, _, response = client.request('daily_summary', 'GET', summary_path,
+                                             headers={'If-None-Match': etag} if etag else None)
+        if status == 200:
+            etag = response.getheader('ETag')
+        time.sleep(think * rng.uniform(0.5, 1.5))
+
+
+def admin(port, stats, deadline, think, password, rng):
+    client = Client(port, stats)
+    client.request('authorize', 'POST', '/api/authorize', {'password': password})
+    etags = {}
+    while time.time() < deadline:
+        period = rng.choice(REPORT_PERIODS)
+        status, _, response = client.request('reports', 'GET', f'/api/reports?period={period}',
+                                             headers={'If-None-Match': etags[period]} if period in etags else None)
+        if status == 200:
+            etags[period] = response.getheader('ETag')
+        time.sleep(think * rng.uniform(0.5, 1.5))
+
+
+# ----------------------------------------------------------------------
+# Resultados
+# ----------------------------------------------------------------------
+def percentile(values, fraction):
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def print_report(stats, duration):
+    print(f"\n{'endpoint':26} {'n':>7} {'req/s':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errores':>8}")
+    for endpoint in sorted(stats.latencies):
+        values = sorted(stats.latencies[endpoint])
+        print(f"{endpoint:26} {len(values):7d} {len(values) / duration:8.1f} "
+              f"{percentile(values, 0.5) * 1000:8.1f} {percentile(values, 0.9) * 1000:8.1f} "
+              f"{percentile(values, 0.99) * 1000:8.1f} {values[-1] * 1000:8.1f} {sum(stats.errors.get(endpoint, {}).values()):8d}")
+    for endpoint, counts in sorted(stats.errors.items()):
+        print(f"  errores {endpoint}: " + ', '.join(f"{status}: {count}" for status, count in counts.items()))
+
+
+def count_today_rows(root, backend, lugar, today):
+    """(filas, mal formadas) de las ventas de hoy de un lugar"""
+    if backend == 'sqlite':
+        from storage import SQLiteStorage
+        storage = SQLiteStorage(os.path.join(root, 'shared', 'progesven.db'), os.path.join(root, 'data'))
+        return len(storage.sales_rows(lugar, today)), 0
+    path = os.path.join(root, 'sales_data', sales_key(lugar, today))
+    rows = malformed = 0
+    if os.path.exists(path):
+        with open(path, newline='', encoding='utf-8') as file:
+            reader = csv.reader(file, delimiter=';')
+            next(reader, None)
+            for row in reader:
+                rows += 1
+                if len(row) != len(SALES_FIELDNAMES) or not row[0].startswith(today):
+                    malformed += 1
+    return rows, malformed
+
+
+def check_sales_files(root, backend, lugares, confirmed):
+    """Comparar filas escritas hoy con ventas confirmadas; contar filas mal formadas"""
+    today = datetime.now().strftime('%Y-%m-%d')
+    lost = duplicated = malformed = 0
+    for lugar in lugares:
+        rows, bad = count_today_rows(root, backend, lugar, today)
+        expected = confirmed.get(lugar, 0)
+        lost += max(0, expected - rows)
+        duplicated += max(0, rows - expected)
+        malformed += bad
+    print(f"\nVentas confirmadas: {sum(confirmed.values())}; filas perdidas: {lost}, "
+          f"duplicadas: {duplicated}, mal formadas: {malformed}")
+    return lost + duplicated + malformed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de carga del punto de venta con gunicorn')
+    parser.add_argument('--sellers', type=int, default=20, help='Vendedores simultáneos')
+    parser.add_argument('--admins', type=int, default=2, help='Administradores cargando reportes')
+    parser.add_argument('--duration', type=float, default=30, help='Segundos de carga')
+    parser.add_argument('--workers', type=int, default=2, help='Workers de gunicorn')
+    parser.add_argument('--threads', type=int, default=4, help='Hilos por worker de gunicorn')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--backend', choices=['filesystem', 'sqlite'], default='filesystem')
+    parser.add_argument('--products', type=int, default=5000, help='Productos del catálogo sintético')
+    parser.add_argument('--locations', type=int, default=10, help='Lugares (los vendedores se reparten entre ellos)')
+    parser.add_argument('--history-days', type=int, default=60, help='Días de historial de ventas')
+    parser.add_argument('--rows-per-day', type=int, default=50, help='Ventas por lugar y día en el historial')
+    parser.add_argument('--keystroke-ms', type=float, default=80, help='Pausa entre teclas')
+    parser.add_argument('--think', type=float, default=1.0, help='Pausa media entre ventas (s)')
+    parser.add_argument('--admin-think', type=float, default=5.0, help='Pausa media entre reportes (s)')
+    parser.add_argument('--keep', action='store_true', help='No borrar el directorio sintético')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='progesven-load-')
+    print(f"Datos sintéticos en {root}")
+    codes, lugares = build_synthetic_data(root, args.products, args.locations, args.history_days, args.rows_per_day)
+    from config import get_config
+    password = get_config().INFO_PASSWORD
+    server = start_server(root, args.port, args.workers, args.threads, args.backend)
+    print(f"gunicorn: {args.workers} workers x {args.threads} hilos; "
+          f"{args.sellers} vendedores y {args.admins} administradores durante {args.duration:.0f}s")
+
+    stats = Stats()
+    confirmed = {}
+    lock = threading.Lock()
+    deadline = time.time() + args.duration
+    threads = []
+    for i in range(args.sellers):
+        threads.append(threading.Thread(target=seller, args=(
+            args.port, stats, lugares[i % len(lugares)], codes, deadline,
+            args.keystroke_ms / 1000, args.think, confirmed, lock, random.Random(i))))
+    for i in range(args.admins):
+        threads.append(threading.Thread(target=admin, args=(
+            args.port, stats, deadline, args.admin_think, password, random.Random(1000 + i))))
+    started = time.time()
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.terminate()
+        server.wait()
+    elapsed = time.time() - started
+
+    print_report(stats, elapsed)
+    problems = check_sales_files(root, args.backend, lugares, confirmed)
+    if args.keep:
+        print(f"Directorio conservado: {root}")
+    else:
+        shutil.rmtree(root, ignore_errors=True)
+    raise SystemExit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""
+Archivos grandes de tutoriales: entrega con Range (206) y subida por partes reanudable.
+
+`send_media` responde un archivo local con ETag, Last-Modified y soporte de Range:
+el navegador de un celular pide solo el tramo que necesita para empezar a
+reproducir o para saltar a un minuto, sin bajar el video completo. El cuerpo es un
+`wsgi.file_wrapper` sobre el archivo (posicionado al inicio del tramo y limitado a
+su largo), así gunicorn lo envía con sendfile sin pasar los bytes por Python.
+
+`ChunkedUploads` recibe un archivo en varias peticiones: se inicia con el nombre,
+el tamaño y el sha256 esperados; cada parte se escribe directo en uploads/<id>.part
+desde el stream de la petición, en bloques, y debe empezar donde terminó la
+anterior (si se corta la conexión, el cliente consulta el offset y sigue desde
+ahí). Con el último byte se verifica el sha256 y el archivo se mueve a su destino.
+"""
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import time
+import uuid
+
+from flask import Response, request
+from werkzeug.utils import secure_filename
+from werkzeug.wsgi import wrap_file
+
+from conditional import not_modified
+
+BLOCK_SIZE = 64 * 1024
+MEDIA_MAX_AGE = 24 * 3600
+_UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadError(Exception):
+    """Subida inválida; `status` es el código HTTP con que se responde"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class _RangeFile:
+    """Archivo abierto y posicionado en `start` que no entrega más de `length` bytes"""
+
+    def __init__(self, file, start, length):
+        self._file = file
+        self._remaining = length
+        file.seek(start)
+
+    def read(self, size=BLOCK_SIZE):
+        if self._remaining <= 0:
+            return b''
+        data = self._file.read(min(size, self._remaining))
+        self._remaining -= len(data)
+        return data
+
+    def fileno(self):
+        # gunicorn usa sendfile desde la posición actual y por Content-Length bytes
+        return self._file.fileno()
+
+    def close(self):
+        self._file.close()
+
+
+def send_media(path, mimetype=None):
+    """Respuesta para un archivo local con validadores y Range (200, 206, 304 o 416)"""
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = f"{stat.st_mtime_ns:x}-{size:x}"
+    last_modified = stat.st_mtime
+    cached = not_modified(request, etag, last_modified)
+    if cached is not None:
+        return cached
+
+    mimetype = mimetype or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    start, length, status = 0, size, 200
+    # If-Range: el tramo solo vale si el archivo es el mismo que el cliente ya tiene
+    if_range = request.if_range
+    if if_range.etag:
+        same_file = if_range.etag == etag
+    else:
+        same_file = if_range.date is None or int(if_range.date.timestamp()) >= int(last_modified)
+    if request.range and same_file:
+        byte_range = request.range.range_for_length(size)
+        if byte_range is None:
+            response = Response(status=416)
+            response.headers['Content-Range'] = f"bytes */{size}"
+            response.headers['Accept-Ranges'] = 'bytes'
+            return response
+        start, stop = byte_range
+        length, status = stop - start, 206
+
+    file = open(path, 'rb')
+    response = Response(wrap_file(request.environ, _RangeFile(file, start, length), BLOCK_SIZE),
+                        status=status, mimetype=mimetype, direct_passthrough=True)
+    response.content_length = length
+    if status == 206:
+        response.headers['Content-Range'] = f"bytes {start}-{start + length - 1}/{size}"
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = MEDIA_MAX_AGE
+    return response
+
+
+class ChunkedUploads:
+    """Subidas por partes a `target_dir`; el estado de cada una vive en `upload_dir`"""
+
+    def __init__(self, upload_dir, target_dir, max_size, max_chunk_size, allowed_extensions):
+        self.upload_dir = upload_dir
+        self.target_dir = target_dir
+        self.max_size = max_size
+        self.max_chunk_size = max_chunk_size
+        self.allowed_extensions = allowed_extensions
+        os.makedirs(upload_dir, exist_ok=True)
+
+    def _paths(self, upload_id):
+        if not _UPLOAD_ID.match(upload_id or ''):
+            raise UploadError('Subida no encontrada', 404)
+        base = os.path.join(self.upload_dir, upload_id)
+        return f"{base}.json", f"{base}.part"
+
+    def _meta(self, upload_id):
+        meta_path, part_path = self._paths(upload_id)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as file:
+                meta = json.load(file)
+        except FileNotFoundError:
+            raise UploadError('Subida no encontrada', 404)
+        return meta, part_path
+
+    def start(self, filename, size, sha256):
+        """Registrar una subida nueva; retorna su estado (id, offset 0, tamaño de parte)"""
+        filename = secure_filename(filename or '')
+        extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+        if extension not in self.allowed_extensions:
+            raise UploadError('Tipo de archivo no permitido')
+        if not isinstance(size, int) or size <= 0 or size > self.max_size:
+            raise UploadError(f'Tamaño inválido (máximo {self.max_size} bytes)')
+        sha256 = str(sha256 or '').lower()
+        if not re.match(r'^[0-9a-f]{64}$', sha256):
+            raise UploadError('sha256 inválido (64 caracteres hexadecimales)')
+        if os.path.exists(os.path.join(self.target_dir, filename)):
+            raise UploadError(f'Ya existe {filename}', 409)
+
+        upload_id = uuid.uuid4().hex
+        meta_path, part_path = self._paths(upload_id)
+        open(part_path, 'wb').close()
+        with open(meta_path, 'w', encoding='utf-8') as file:
+            json.dump({'filename': filename, 'size': size, 'sha256': sha256,
+                       'created': time.strftime('%Y-%m-%d %H:%M:%S')}, file)
+        return self.status(upload_id)
+
+    def status(self, upload_id):
+        """Estado de una subida: el offset es lo ya escrito (desde donde sigue la próxima parte)"""
+        meta, part_path = self._meta(upload_id)
+        return {'upload_id': upload_id, 'filename': meta['filename'], 'size': meta['size'],
+                'offset': os.path.getsize(part_path), 'chunk_size': self.max_chunk_size, 'complete': False}
+
+    def write(self, upload_id, offset, stream, length):
+        """
+        Escribir una parte de `length` bytes leída de `stream` en bloques. Debe empezar en
+        el offset actual; al completar el tamaño se verifica el sha256 y se publica.
+        """
+        meta, part_path = self._meta(upload_id)
+        current = os.path.getsize(part_path)
+        if offset != current:
+            raise UploadError(f'La parte debe empezar en {current}', 409)
+        if length is None or length <= 0 or length > self.max_chunk_size:
+            raise UploadError(f'Parte inválida (máximo {self.max_chunk_size} bytes, con Content-Length)')
+        if offset + length > meta['size']:
+            raise UploadError('La parte supera el tamaño declarado')
+
+        written = 0
+        with open(part_path, 'r+b') as file:
+            file.seek(offset)
+            while written < length:
+                block = stream.read(min(BLOCK_SIZE, length - written))
+                if not block:
+                    break
+                file.write(block)
+                written += len(block)
+        # Si la conexión se cortó, lo recibido queda escrito: el cliente sigue desde el nuevo offset
+        if written < length:
+            raise UploadError(f'Parte incompleta, continuar desde {offset + written}', 409)
+
+        if offset + length < meta['size']:
+            return self.status(upload_id)
+        return self._finish(upload_id, meta, part_path)
+
+    def _finish(self, upload_id, meta, part_path):
+        digest = hashlib.sha256()
+        with open(part_path, 'rb') as file:
+            for block in iter(lambda: file.read(BLOCK_SIZE), b''):
+                digest.update(block)
+        meta_path, _ = self._paths(upload_id)
+        if digest.hexdigest() != meta['sha256']:
+            os.remove(part_path)
+            os.remove(meta_path)
+            raise UploadError('El sha256 no coincide; la subida se descartó', 422)
+
+        # shutil.move: rename si uploads/ está en el mismo disco, copia si es otro volumen
+        shutil.move(part_path, os.path.join(self.target_dir, meta['filename']))
+        os.remove(meta_path)
+        return {'upload_id': upload_id, 'filename': meta['filename'], 'size': meta['size'],
+                'offset': meta['size'], 'complete': True}
@@ -0,0 +1,227 @@
+"""
+Métricas de rendimiento por hora, día de la semana y lugar.
+
+Cada día se resume en un histograma lugar -> hora -> [ventas, devoluciones, monto].
+El día en curso se mantiene en memoria y se actualiza leyendo solo los bytes nuevos
+de cada archivo diario (después de cada venta y al consultar), de modo que no se
+vuelve a parsear todo el archivo. Con un almacenamiento sin archivos (SQLite) el día
+en curso se recalcula desde la base cuando hubo escrituras o cada
+TODAY_REFRESH_SECONDS. Los días cerrados se guardan en metrics/YYYY-MM-DD.json y
+las métricas se calculan sumando esos contadores.
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from archive import parse_sales_filename, read_new_rows
+from config import parse_amount
+
+WEEKDAYS = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+TODAY_REFRESH_SECONDS = 30
+
+
+def _add_row(histogram, location, timestamp, amount, is_return):
+    """Sumar una fila al histograma del día"""
+    hour = timestamp[11:13] if len(timestamp) >= 13 else ''
+    if not hour.isdigit() or not location:
+        return
+    counters = histogram.setdefault(location, {}).setdefault(str(int(hour)), [0, 0, 0])
+    counters[1 if is_return else 0] += 1
+    counters[2] += amount
+
+
+def _copy_histogram(histogram):
+    """Copia del histograma (lugar -> hora -> contadores) para leerla sin el lock"""
+    return {location: {hour: list(counters) for hour, counters in hours.items()}
+            for location, hours in histogram.items()}
+
+
+class SalesMetrics:
+    """Histogramas diarios persistidos y contadores incrementales del día en curso"""
+
+    def __init__(self, storage, metrics_dir, encoding='utf-8', delimiter=';'):
+        self.storage = storage
+        self.metrics_dir = metrics_dir
+        self.encoding = encoding
+        self.delimiter = delimiter
+        self._lock = threading.RLock()
+        self._closed_days = {}   # fecha -> histograma (caché de días cerrados)
+        self._today = None
+        self._today_histogram = {}
+        self._offsets = {}       # archivo del día -> (bytes leídos, encabezado)
+        self._today_dirty = True
+        self._today_built_at = 0
+
+    # ------------------------------------------------------------------
+    # Día en curso
+    # ------------------------------------------------------------------
+    def _roll_day(self, today):
+        if self._today == today:
+            return
+        if self._today is not None and self._today < today:
+            # El día anterior quedó cerrado: se recalcula completo desde sus archivos y se persiste
+            self._save_day(self._today, self._build_day(self._today))
+        self._today = today
+        self._today_histogram = {}
+        self._offsets = {}
+        self._today_dirty = True
+
+    def observe_write(self, key):
+        """Registrar una escritura recién hecha en el archivo diario `key`"""
+        path = self.storage.local_path(key)
+        if path:
+            self.observe_file(path)
+        else:
+            with self._lock:
+                self._today_dirty = True
+
+    def observe_file(self, filepath):
+        """Contar las filas agregadas a un archivo del día desde la última lectura"""
+        filename = os.path.basename(filepath)
+        parsed = parse_sales_filename(filename)
+        if not parsed:
+            return
+        location, date_str, kind = parsed
+        with self._lock:
+            self._roll_day(datetime.now().strftime('%Y-%m-%d'))
+            if date_str != self._today:
+                return
+            offset, header = self._offsets.get(filename, (0, None))
+            rows, offset, header = read_new_rows(filepath, offset, header, self.encoding, self.delimiter)
+            for row in rows:
+                _add_row(self._today_histogram,
+                         row.get('lugar', '') if kind == 'returns' else location,
+                         row.get('timestamp') or '',
+                         parse_amount(row.get('precio', '0')) or 0,
+                         kind == 'returns')
+            self._offsets[filename] = (offset, header)
+
+    def observe_day_files(self):
+        """Leer lo nuevo de todos los archivos del día (ventas de otros procesos incluidas)"""
+        today = self._today or datetime.now().strftime('%Y-%m-%d')
+        for source in self.storage.day_sources(today):
+            if source.path and not source.archived:
+                self.observe_file(source.path)
+
+    def today_histogram(self):
+        if self.storage.has_local_files:
+            self.observe_day_files()
+            with self._lock:
+                return _copy_histogram(self._today_histogram)
+        # Sin archivos locales: recalcular el día desde el almacenamiento (acotado en frecuencia)
+        with self._lock:
+            self._roll_day(datetime.now().strftime('%Y-%m-%d'))
+            if self._today_dirty or time.time() - self._today_built_at > TODAY_REFRESH_SECONDS:
+                self._today_histogram = self._build_day(self._today)
+                self._today_dirty = False
+                self._today_built_at = time.time()
+            return _copy_histogram(self._today_histogram)
+
+    # ------------------------------------------------------------------
+    # Días cerrados
+    # ------------------------------------------------------------------
+    def _day_path(self, date_str):
+        return os.path.join(self.metrics_dir, f"{date_str}.json")
+
+    def _save_day(self, date_str, histogram):
+        path = self._day_path(date_str)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(histogram, file, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Error guardando métricas de {date_str}: {e}")
+        self._closed_days[date_str] = histogram
+
+    def _build_day(self, date_str):
+        """Calcular el histograma de un día desde sus archivos (vivos o archivados)"""
+        histogram = {}
+        for source in self.storage.day_sources(date_str):
+            is_return = source.kind == 'returns'
+            try:
+                for row in source.rows(self.delimiter):
+                    _add_row(histogram,
+                             row.get('lugar', '') if is_return else source.location,
+                             row.get('timestamp') or '',
+                             parse_amount(row.get('precio', '0')) or 0,
+                             is_return)
+            except Exception as e:
+                print(f"Error procesando {source.filename}: {e}")
+        return histogram
+
+    def day_histogram(self, date_str):
+        """Histograma de un día: en memoria para hoy, persistido para días cerrados"""
+        today = datetime.now().strftime('%Y-%m-%d')
+        if date_str >= today:
+            with self._lock:
+                self._roll_day(today)
+            return self.today_histogram() if date_str == today else {}
+
+        histogram = self._closed_days.get(date_str)
+        if histogram is not None:
+            return histogram
+        path = self._day_path(date_str)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as file:
+                    histogram = json.load(file)
+                self._closed_days[date_str] = histogram
+                return histogram
+            except Exception as e:
+                print(f"Error leyendo métricas de {date_str}: {e}")
+        # Día cerrado sin resumen: se calcula una vez y se guarda
+        histogram = self._build_day(date_str)
+        self._save_day(date_str, histogram)
+        return histogram
+
+    # ------------------------------------------------------------------
+    # Métricas
+    # ------------------------------------------------------------------
+    def performance(self, days=31, location=None):
+        """Hora peak, día peak, promedio diario y tendencia a partir de los histogramas"""
+        today = datetime.now().date()
+        heatmap = [[0] * 24 for _ in range(7)]   # día de semana x hora -> ventas
+        daily_amounts = []                         # monto neto por día, del más antiguo al más reciente
+
+        for offset in range(days - 1, -1, -1):
+            day = today - timedelta(days=offset)
+            histogram = self.day_histogram(day.strftime('%Y-%m-%d'))
+            weekday = day.weekday()
+            amount = 0
+            for loc, hours in histogram.items():
+                if location and loc != location:
+                    continue
+                for hour, (sales, returns, hour_amount) in hours.items():
+                    heatmap[weekday][int(hour)] += sales
+                    amount += hour_amount
+            daily_amounts.append(amount)
+
+        hour_totals = [sum(heatmap[d][h] for d in range(7)) for h in range(24)]
+        weekday_totals = [sum(row) for row in heatmap]
+        peak_hour = max(range(24), key=lambda h: hour_totals[h]) if any(hour_totals) else None
+        peak_weekday = max(range(7), key=lambda d: weekday_totals[d]) if any(weekday_totals) else None
+
+        # Promedios sobre días cerrados (hoy todavía está en curso)
+        closed = daily_amounts[:-1]
+        last_7 = closed[-7:]
+        previous_7 = closed[-14:-7]
+        avg_7 = sum(last_7) // len(last_7) if last_7 else 0
+        avg_prev_7 = sum(previous_7) // len(previous_7) if previous_7 else 0
+        avg_30 = sum(closed[-30:]) // len(closed[-30:]) if closed else 0
+        trend = round((avg_7 - avg_prev_7) * 100 / avg_prev_7, 1) if avg_prev_7 else None
+
+        return {
+            'avg_daily_sales': avg_7,
+            'avg_daily_sales_30d': avg_30,
+            'trend_7d_pct': trend,
+            'peak_hour': f"{peak_hour:02d}:00-{peak_hour + 1:02d}:00" if peak_hour is not None else None,
+            'peak_weekday': WEEKDAYS[peak_weekday] if peak_weekday is not None else None,
+            'sales_by_hour': hour_totals,
+            'sales_by_weekday': dict(zip(WEEKDAYS, weekday_totals)),
+            'heatmap': heatmap,
+            'window_days': days,
+            'location': location
+        }
@@ -0,0 +1,95 @@
+"""
+Caché de páginas renderizadas (inicio, eventos, puntos de venta, tutoriales).
+
+Cada página se guarda ya renderizada junto con su firma: versiones de las tablas
+de las que sale (puntosventa.csv, bazares.csv, tutoriales.csv, ...) más los datos
+variables que usa (la fecha de hoy, el contador de solicitudes). Mientras la firma
+no cambie se responde el HTML guardado sin leer CSV ni ejecutar Jinja; si cambia
+una tabla, la página se vuelve a renderizar en la siguiente visita.
+
+Con PAGE_SNAPSHOT_DIR configurado, cada página regenerada también se escribe como
+HTML estático (ej: static/paginas/points.html) para que el servidor web la entregue
+sin pasar por Python. `python pagecache.py build` regenera todos los snapshots
+(útil después de cambiar un CSV o, para eventos, una vez al día).
+"""
+import os
+import threading
+
+from flask import render_template
+
+from conditional import make_etag
+
+# Páginas que se pueden exportar como snapshot: ruta -> archivo
+SNAPSHOT_PAGES = {
+    '/events': 'events.html',
+    '/points': 'points.html',
+    '/tutorials': 'tutorials.html'
+}
+
+
+class PageCache:
+    """HTML renderizado por plantilla, válido mientras no cambie su firma"""
+
+    def __init__(self, app, storage, snapshot_dir=None):
+        self.app = app
+        self.storage = storage
+        self.snapshot_dir = snapshot_dir
+        self._lock = threading.Lock()
+        self._pages = {}   # plantilla -> (firma, etag, html)
+        if snapshot_dir:
+            os.makedirs(snapshot_dir, exist_ok=True)
+
+    def _templates_version(self):
+        # Solo en desarrollo (auto_reload) se revisan las plantillas; en producción no cambian sin reiniciar
+        if not self.app.jinja_env.auto_reload:
+            return None
+        folder = os.path.join(self.app.root_path, self.app.template_folder)
+        return max((entry.stat().st_mtime_ns for entry in os.scandir(folder)), default=0)
+
+    def render(self, template, tables=(), extra=(), context=None, snapshot=None):
+        """
+        (etag, html) de la plantilla. `tables` son las tablas de las que sale la página,
+        `extra` los demás valores que cambian el resultado y `context` una función que
+        arma las variables de la plantilla (se llama solo al regenerar).
+        """
+        signature = (self._templates_version(),
+                     tuple(self.storage.table_version(name) for name in tables),
+                     tuple(extra))
+        cached = self._pages.get(template)
+        if cached and cached[0] == signature:
+            return cached[1], cached[2]
+
+        with self._lock:
+            cached = self._pages.get(template)
+            if cached and cached[0] == signature:
+                return cached[1], cached[2]
+            html = render_template(template, **(context() if context else {}))
+            etag = make_etag(template, signature)
+            self._pages[template] = (signature, etag, html)
+            if snapshot and self.snapshot_dir:
+                self._write_snapshot(snapshot, html)
+        return etag, html
+
+    def _write_snapshot(self, filename, html):
+        path = os.path.join(self.snapshot_dir, filename)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                file.write(html)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Error escribiendo snapshot {filename}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+if __name__ == '__main__':
+    from app import app, app_config
+
+    if not app_config.PAGE_SNAPSHOT_DIR:
+        print("PAGE_SNAPSHOT_DIR no está configurado; no se escriben snapshots")
+        raise SystemExit(1)
+    with app.test_client() as client:
+        for path, filename in SNAPSHOT_PAGES.items():
+            response = client.get(path)
+            print(f"{path} -> {os.path.join(app_config.PAGE_SNAPSHOT_DIR, filename)} ({response.status_code})")
@@ -0,0 +1,51 @@
+"""
+Paginación por cursor para listados ordenados del más reciente al más antiguo.
+
+El cursor es la clave (por ejemplo timestamp e id) del último elemento de la página
+anterior, unida con '|'. A diferencia de un offset, no se corre si entre una página
+y otra se agregan elementos nuevos.
+"""
+
+CURSOR_SEPARATOR = '|'
+
+
+def encode_cursor(key):
+    return CURSOR_SEPARATOR.join(str(part) for part in key)
+
+
+def decode_cursor(cursor, types=None):
+    """Cursor a tupla (convirtiendo cada parte con `types`); None si viene vacío o no se puede leer"""
+    if not cursor:
+        return None
+    parts = cursor.split(CURSOR_SEPARATOR)
+    if types:
+        if len(parts) != len(types):
+            return None
+        try:
+            parts = [kind(part) for kind, part in zip(types, parts)]
+        except ValueError:
+            return None
+    return tuple(parts)
+
+
+def parse_limit(value, default, maximum=200):
+    """Tamaño de página pedido, acotado a [1, maximum]"""
+    try:
+        return min(maximum, max(1, int(value)))
+    except (TypeError, ValueError):
+        return default
+
+
+def page_desc(items, key, cursor=None, limit=20):
+    """
+    Página de `items` (ya ordenados de mayor a menor según `key`) con claves menores
+    al cursor. Retorna (página, siguiente_cursor o None).
+    """
+    page = []
+    for item in items:
+        if cursor is not None and key(item) >= cursor:
+            continue
+        if len(page) == limit:
+            return page, encode_cursor(key(page[-1]))
+        page.append(item)
+    return page, None
@@ -0,0 +1,300 @@
+"""
+Fotos de productos (static/fotos): búsqueda por cod_fabrica e ingesta masiva.
+
+Las fotos se copiaban a mano con nombres variados (' 13100.jpeg', '10028.jpg' y
+'10028.jpeg'), y la búsqueda por nombre exacto no encontraba las que tenían
+espacios. `PhotoLibrary` indexa la carpeta por código normalizado (sin espacios,
+en mayúsculas, sin extensión) y se reindexa cuando cambia la carpeta.
+
+La ingesta recibe un zip o varias imágenes: cada archivo se escribe en bloques a
+un temporal calculando su sha256, se descarta si ya hay una foto con el mismo
+contenido, y si el nombre corresponde a un producto (cod_fabrica o cod_venta) se
+publica como <cod_fabrica>.jpg / .png reemplazando las variantes anteriores.
+Los nombres que no están en el catálogo se informan y no se guardan. La copia y el
+hash se hacen fuera del lock del índice: las búsquedas de fotos siguen respondiendo
+mientras se ingiere un zip grande.
+
+CLI:  python photos.py ingest fotos.zip|carpeta|foto.jpg ...
+      python photos.py normalize [--dry-run]   (renombra y deduplica lo existente)
+"""
+import hashlib
+import os
+import threading
+import zipfile
+from urllib.parse import quote
+
+BLOCK_SIZE = 64 * 1024
+EXTENSIONS = ('.jpg', '.jpeg', '.png')
+# Extensión canónica según los primeros bytes del archivo
+_SIGNATURES = ((b'\xff\xd8\xff', '.jpg'), (b'\x89PNG\r\n\x1a\n', '.png'))
+
+
+def photo_code(name):
+    """Código de una foto a partir del nombre de archivo (' 13100.jpeg' -> '13100'), o None"""
+    base = os.path.basename(name.replace('\\', '/'))
+    stem, extension = os.path.splitext(base)
+    if extension.lower() not in EXTENSIONS:
+        return None
+    return stem.strip().upper() or None
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PhotoLibrary:
+    """Fotos por código y por contenido (sha256), reindexadas cuando cambia la carpeta"""
+
+    def __init__(self, photos_dir, max_size):
+        self.photos_dir = photos_dir
+        self.max_size = max_size
+        self._lock = threading.Lock()          # índice por código (_by_code, _version)
+        self._ingest_lock = threading.Lock()   # una ingesta o normalización a la vez
+        self._version = None
+        self._by_code = {}    # código -> [archivos], el preferido primero
+        self._hashes = {}     # archivo -> (tamaño, mtime_ns, sha256)
+
+    def _scan(self):
+        try:
+            version = os.stat(self.photos_dir).st_mtime_ns
+        except FileNotFoundError:
+            version = None
+        if version == self._version:
+            return
+        by_code = {}
+        for entry in os.scandir(self.photos_dir) if version is not None else ():
+            code = photo_code(entry.name) if entry.is_file() else None
+            if code:
+                by_code.setdefault(code, []).append(entry.name)
+        # Preferido: nombre exacto en el orden .jpg, .jpeg, .png (el de siempre); luego el resto
+        for code, names in by_code.items():
+            exact = [code + extension for extension in EXTENSIONS]
+            names.sort(key=lambda name: (exact.index(name) if name in exact else len(exact), name))
+        self._by_code = by_code
+        self._version = version
+
+    def version(self):
+        """Versión de la carpeta de fotos (cambia al agregar, renombrar o borrar fotos)"""
+        with self._lock:
+            self._scan()
+            return self._version
+
+    def photo_name(self, cod_fabrica):
+        """Nombre del archivo de la foto de un producto, o None"""
+        code = (cod_fabrica or '').strip().upper()
+        if not code:
+            return None
+        with self._lock:
+            self._scan()
+            names = self._by_code.get(code)
+        return names[0] if names else None
+
+    def image_url(self, cod_fabrica):
+        """URL de la foto de un producto, o None"""
+        name = self.photo_name(cod_fabrica)
+        return f"/static/fotos/{quote(name)}" if name else None
+
+    def _content_index(self, by_code):
+        """sha256 -> archivo de todas las fotos (solo se calcula el hash de las nuevas o modificadas)"""
+        index = {}
+        hashes = {}
+        for names in by_code.values():
+            for name in names:
+                stat = os.stat(os.path.join(self.photos_dir, name))
+                cached = self._hashes.get(name)
+                if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+                    digest = cached[2]
+                else:
+                    digest = _file_hash(os.path.join(self.photos_dir, name))
+                hashes[name] = (stat.st_size, stat.st_mtime_ns, digest)
+                index.setdefault(digest, name)
+        self._hashes = hashes
+        return index
+
+    def _receive(self, stream, tmp_path):
+        """Copiar el stream a un temporal en bloques; retorna (sha256, extensión) o un error"""
+        digest = hashlib.sha256()
+        size = 0
+        extension = None
+        with open(tmp_path, 'wb') as file:
+            for block in iter(lambda: stream.read(BLOCK_SIZE), b''):
+                if extension is None:
+                    extension = next((ext for signature, ext in _SIGNATURES if block.startswith(signature)), '')
+                    if not extension:
+                        return None, 'No es una imagen JPEG ni PNG'
+                size += len(block)
+                if size > self.max_size:
+                    return None, f'Supera el máximo de {self.max_size} bytes'
+                digest.update(block)
+                file.write(block)
+        if not size:
+            return None, 'Archivo vacío'
+        return (digest.hexdigest(), extension), None
+
+    def ingest(self, items, catalog, dry_run=False):
+        """
+        Ingerir fotos desde (nombre, stream) y retornar el resumen: agregadas,
+        reemplazadas, duplicadas, sin producto en el catálogo e inválidas, con el
+        detalle por archivo.
+        """
+        summary = {'added': 0, 'replaced': 0, 'duplicate': 0, 'missing': 0, 'invalid': 0, 'files': []}
+        with self._ingest_lock:
+            with self._lock:
+                self._scan()
+                by_code = dict(self._by_code)
+            by_content = self._content_index(by_code)
+            for name, stream in items:
+                result = self._ingest_one(name, stream, catalog, by_content, dry_run)
+                summary[result['status']] += 1
+                summary['files'].append(result)
+            with self._lock:
+                self._version = None
+        summary['dry_run'] = dry_run
+        return summary
+
+    def _ingest_one(self, name, stream, catalog, by_content, dry_run):
+        code = photo_code(name)
+        result = {'file': name, 'status': 'invalid', 'code': code}
+        if not code:
+            result['message'] = 'Extensión no soportada (jpg, jpeg o png)'
+            return result
+        # El nombre puede ser cod_fabrica o cod_venta; se publica con el cod_fabrica
+        product = catalog.find(code)
+        if not product or not product.get('cod_fabrica'):
+            result['status'] = 'missing'
+            result['message'] = 'El código no está en el catálogo'
+            return result
+        cod_fabrica = product['cod_fabrica'].strip().upper()
+        result['code'] = cod_fabrica
+
+        tmp_path = os.path.join(self.photos_dir, f".ingesta.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            # Copia y hash sin el lock: photo_name sigue respondiendo mientras tanto
+            received, error = self._receive(stream, tmp_path)
+            if error:
+                result['message'] = error
+                return result
+            digest, extension = received
+            if digest in by_content:
+                result['status'] = 'duplicate'
+                result['duplicate_of'] = by_content[digest]
+                return result
+
+            target = cod_fabrica + extension
+            with self._lock:
+                previous = self._by_code.get(cod_fabrica, [])
+                result['status'] = 'replaced' if previous else 'added'
+                result['photo'] = target
+                if dry_run:
+                    by_content[digest] = target
+                    return result
+                os.replace(tmp_path, os.path.join(self.photos_dir, target))
+                # Las variantes anteriores (' 13100.jpeg', '13100.jpeg') dejan de usarse
+                for old in previous:
+                    if old != target:
+                        os.remove(os.path.join(self.photos_dir, old))
+                        for key in [key for key, value in by_content.items() if value == old]:
+                            del by_content[key]
+                self._by_code[cod_fabrica] = [target]
+            by_content[digest] = target
+            return result
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def normalize(self, catalog, dry_run=False):
+        """
+        Renombrar las fotos existentes a <cod_fabrica>.<ext> y borrar las de contenido
+        repetido. Retorna [(archivo, acción, detalle)]; las sin producto no se tocan.
+        """
+        actions = []
+        with self._ingest_lock, self._lock:
+            self._scan()
+            by_content = {}
+            for code, names in sorted(self._by_code.items()):
+                product = catalog.find(code)
+                cod_fabrica = product['cod_fabrica'].strip().upper() if product and product.get('cod_fabrica') else None
+                for name in names:
+                    path = os.path.join(self.photos_dir, name)
+                    digest = _file_hash(path)
+                    if digest in by_content:
+                        actions.append((name, 'duplicate', by_content[digest]))
+                        if not dry_run:
+                            os.remove(path)
+                        continue
+                    by_content[digest] = name
+                    if not cod_fabrica:
+                        actions.append((name, 'missing', code))
+                        continue
+                    with open(path, 'rb') as file:
+                        head = file.read(8)
+                    extension = next((ext for signature, ext in _SIGNATURES if head.startswith(signature)), None)
+                    target = cod_fabrica + extension if extension else None
+                    if target and target != name and not os.path.exists(os.path.join(self.photos_dir, target)):
+                        actions.append((name, 'renamed', target))
+                        by_content[digest] = target
+                        if not dry_run:
+                            os.replace(path, os.path.join(self.photos_dir, target))
+            self._version = None
+        return actions
+
+
+def iter_zip(fileobj):
+    """(nombre, stream) de las imágenes de un zip, leídas sin descomprimir todo en memoria"""
+    with zipfile.ZipFile(fileobj) as archive:
+        for member in archive.infolist():
+            base = os.path.basename(member.filename)
+            if member.is_dir() or member.filename.startswith('__MACOSX/') or base.startswith('.'):
+                continue
+            with archive.open(member) as stream:
+                yield base, stream
+
+
+def iter_paths(paths):
+    """(nombre, stream) de archivos, carpetas o zips de la línea de comandos"""
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if os.path.isfile(os.path.join(path, name)):
+                    yield from iter_paths([os.path.join(path, name)])
+        elif zipfile.is_zipfile(path):
+            with open(path, 'rb') as file:
+                yield from iter_zip(file)
+        else:
+            with open(path, 'rb') as file:
+                yield os.path.basename(path), file
+
+
+if __name__ == '__main__':
+    import argparse
+    from catalog import Catalog
+    from config import get_config
+    from storage import create_storage
+
+    parser = argparse.ArgumentParser(description='Ingerir y normalizar fotos de productos')
+    parser.add_argument('command', choices=['ingest', 'normalize'],
+                        help='ingest: agregar fotos; normalize: renombrar y deduplicar static/fotos')
+    parser.add_argument('paths', nargs='*', help='Zips, carpetas o imágenes (para ingest)')
+    parser.add_argument('--dry-run', action='store_true', help='Solo mostrar lo que se haría')
+    args = parser.parse_args()
+
+    app_config = get_config()
+    catalog = Catalog(create_storage(app_config), app_config)
+    library = PhotoLibrary(app_config.PHOTOS_DIR, app_config.MAX_FILE_SIZE)
+    if args.command == 'normalize':
+        actions = library.normalize(catalog, dry_run=args.dry_run)
+        for name, action, detail in actions:
+            print(f"{action:10} '{name}' -> {detail}")
+        print(f"{len(actions)} acciones{' (simulación)' if args.dry_run else ''}")
+    else:
+        if not args.paths:
+            parser.error('Indique al menos un zip, carpeta o imagen')
+        result = library.ingest(iter_paths(args.paths), catalog, dry_run=args.dry_run)
+        for item in result['files']:
+            print(f"{item['status']:10} {item['file']} {item.get('photo') or item.get('duplicate_of') or item.get('message', '')}")
+        print(f"Agregadas: {result['added']}, reemplazadas: {result['replaced']}, duplicadas: {result['duplicate']}, "
+              f"sin producto: {result['missing']}, inválidas: {result['invalid']}")
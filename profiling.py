@@ -0,0 +1,232 @@
+"""
+Perfilado a pedido de peticiones en producción.
+
+Un administrador arma el perfilador con un patrón de ruta (ej: '/api/reports*' o
+'/api/get_daily_transactions_with_returns/Tienda*') y una cantidad N: las próximas
+N peticiones que coincidan se ejecutan bajo cProfile (y opcionalmente tracemalloc)
+y cada una deja en metrics/profiles/ un .prof (para pstats o snakeviz) y un .txt
+con las funciones más costosas y, con tracemalloc, las líneas que más memoria
+asignaron durante la petición.
+
+El estado armado vive en profiles/armed.json para que lo vean todos los workers;
+cada worker lo revisa como máximo una vez por segundo. Desarmado, el costo por
+petición es una comparación de tiempo: no hay hooks de Flask ni stat por petición.
+"""
+import cProfile
+import fcntl
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from fnmatch import fnmatch
+
+ARMED_FILE = 'armed.json'
+CHECK_SECONDS = 1.0
+MAX_ARMED_SECONDS = 3600
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+
+class RequestProfiler:
+    """Middleware WSGI que perfila las próximas N peticiones que coinciden con un patrón"""
+
+    def __init__(self, wsgi_app, profile_dir):
+        self.wsgi_app = wsgi_app
+        self.profile_dir = profile_dir
+        self._armed_path = os.path.join(profile_dir, ARMED_FILE)
+        self._next_check = 0.0
+        self._armed = None   # estado leído de armed.json (o None)
+        # tracemalloc es de todo el proceso: se detiene cuando termina la última petición que lo usa
+        self._tracing_lock = threading.Lock()
+        self._tracing_requests = 0
+        self._owns_tracing = False
+        os.makedirs(profile_dir, exist_ok=True)
+
+    def __call__(self, environ, start_response):
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + CHECK_SECONDS
+            self._armed = self._read_state()
+        if self._armed is None:
+            return self.wsgi_app(environ, start_response)
+
+        path = environ.get('PATH_INFO', '')
+        query = environ.get('QUERY_STRING', '')
+        target = f"{path}?{query}" if query else path
+        pattern = self._armed['pattern']
+        if not (fnmatch(path, pattern) or fnmatch(target, pattern)):
+            return self.wsgi_app(environ, start_response)
+        claimed = self._claim()
+        if claimed is None:
+            return self.wsgi_app(environ, start_response)
+        return self._profile(environ, start_response, target, claimed)
+
+    # ------------------------------------------------------------------
+    # Estado compartido entre workers
+    # ------------------------------------------------------------------
+    def _read_state(self):
+        try:
+            with open(self._armed_path, 'r', encoding='utf-8') as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if state.get('remaining', 0) <= 0 or state.get('expires', 0) < time.time():
+            return None
+        return state
+
+    def _claim(self):
+        """Descontar una petición del estado armado (con lock entre procesos); retorna el estado o None"""
+        try:
+            with open(self._armed_path, 'r+', encoding='utf-8') as file:
+                fcntl.flock(file, fcntl.LOCK_EX)
+                try:
+                    state = json.load(file)
+                    if state.get('remaining', 0) <= 0 or state.get('expires', 0) < time.time():
+                        return None
+                    state['remaining'] -= 1
+                    file.seek(0)
+                    file.truncate()
+                    json.dump(state, file)
+                    file.flush()
+                finally:
+                    fcntl.flock(file, fcntl.LOCK_UN)
+        except (OSError, ValueError):
+            return None
+        self._armed = state if state['remaining'] > 0 else None
+        return state
+
+    def arm(self, pattern, count, trace_memory=False, seconds=MAX_ARMED_SECONDS):
+        """Armar el perfilador para las próximas `count` peticiones que coincidan con `pattern`"""
+        state = {
+            'pattern': pattern,
+            'remaining': count,
+            'tracemalloc': trace_memory,
+            'armed_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'expires': time.time() + min(seconds, MAX_ARMED_SECONDS)
+        }
+        tmp_path = f"{self._armed_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(state, file)
+        os.replace(tmp_path, self._armed_path)
+        self._next_check = 0.0
+        return state
+
+    def disarm(self):
+        if os.path.exists(self._armed_path):
+            os.remove(self._armed_path)
+        self._armed = None
+
+    def state(self):
+        """Estado armado vigente (patrón, peticiones restantes, vencimiento) o None"""
+        return self._read_state()
+
+    # ------------------------------------------------------------------
+    # Perfilado
+    # ------------------------------------------------------------------
+    def _profile(self, environ, start_response, target, state):
+        status_holder = []
+
+        def capture_status(status, headers, exc_info=None):
+            status_holder.append(status)
+            return start_response(status, headers, exc_info)
+
+        trace_memory = bool(state.get('tracemalloc'))
+        if trace_memory:
+            self._start_tracing()
+        before = self._take_snapshot() if trace_memory else None
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        body = None
+        profiler.enable()
+        try:
+            body = self.wsgi_app(environ, capture_status)
+            # El cuerpo se genera dentro del perfil (las exportaciones en streaming se arman al iterar)
+            chunks = list(body)
+        finally:
+            profiler.disable()
+            if hasattr(body, 'close'):
+                body.close()
+            elapsed = time.perf_counter() - started
+            after = self._take_snapshot() if trace_memory else None
+            if trace_memory:
+                self._stop_tracing()
+            try:
+                self._save(environ.get('REQUEST_METHOD', 'GET'), target,
+                           status_holder[0] if status_holder else '500', elapsed, profiler, before, after)
+            except Exception as e:
+                print(f"Error guardando perfil de {target}: {e}")
+        return chunks
+
+    def _start_tracing(self):
+        with self._tracing_lock:
+            if self._tracing_requests == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._owns_tracing = True
+            self._tracing_requests += 1
+
+    def _stop_tracing(self):
+        with self._tracing_lock:
+            self._tracing_requests -= 1
+            if self._tracing_requests == 0 and self._owns_tracing:
+                tracemalloc.stop()
+                self._owns_tracing = False
+
+    @staticmethod
+    def _take_snapshot():
+        # Con peticiones trazadas en paralelo el diff incluye también lo que asignaron las otras
+        try:
+            return tracemalloc.take_snapshot()
+        except Exception as e:
+            print(f"Error tomando snapshot de tracemalloc: {e}")
+            return None
+
+    def _save(self, method, target, status, elapsed, profiler, before, after):
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', target.split('?', 1)[0]).strip('_')[:60] or 'root'
+        name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{os.getpid()}-{slug}"
+        profiler.dump_stats(os.path.join(self.profile_dir, f"{name}.prof"))
+
+        out = io.StringIO()
+        out.write(f"{method} {target}\nEstado: {status}\nDuración: {elapsed * 1000:.1f} ms\n\n")
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        if before is not None and after is not None:
+            out.write(f"\nAsignaciones de memoria durante la petición (top {TOP_ALLOCATIONS}):\n")
+            for stat in after.compare_to(before, 'lineno')[:TOP_ALLOCATIONS]:
+                out.write(f"{stat}\n")
+        with open(os.path.join(self.profile_dir, f"{name}.txt"), 'w', encoding='utf-8') as file:
+            file.write(out.getvalue())
+        print(f"Perfil guardado: {name} ({elapsed * 1000:.1f} ms)")
+
+    def list_profiles(self):
+        """Perfiles guardados, del más reciente al más antiguo"""
+        profiles = []
+        for entry in os.scandir(self.profile_dir):
+            if entry.name.endswith('.txt'):
+                name = entry.name[:-4]
+                with open(entry.path, 'r', encoding='utf-8') as file:
+                    request_line = file.readline().strip()
+                    status = file.readline().split(':', 1)[-1].strip()
+                    duration = file.readline().split(':', 1)[-1].strip()
+                profiles.append({
+                    'name': name,
+                    'request': request_line,
+                    'status': status,
+                    'duration': duration,
+                    'created': datetime.fromtimestamp(entry.stat().st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
+                    'files': [f"{name}.txt"] + ([f"{name}.prof"] if os.path.exists(
+                        os.path.join(self.profile_dir, f"{name}.prof")) else [])
+                })
+        profiles.sort(key=lambda item: item['name'], reverse=True)
+        return profiles
+
+    def profile_path(self, filename):
+        """Ruta de un archivo de perfil (.prof o .txt) o None si el nombre no es válido"""
+        if not re.match(r'^[\w.-]+\.(prof|txt)$', filename or ''):
+            return None
+        path = os.path.join(self.profile_dir, filename)
+        return path if os.path.isfile(path) else None
@@ -0,0 +1,322 @@
+"""
+Agregación de ventas por rango de fechas.
+
+El rango se divide en fragmentos (por mes o por grupos de días) que se agregan
+de forma independiente, en paralelo con un ProcessPoolExecutor cuando el rango es
+largo, y luego se combinan con `combine_partials`, que es asociativa: el resultado
+no depende de cómo se haya partido el rango. El pool se crea una sola vez y sus
+procesos salen de un forkserver, no de un fork del worker de gunicorn (que tiene
+otros hilos con locks tomados).
+
+En modo aproximado ('approx') los productos se resumen con un SpaceSaving de
+capacidad fija en vez de un dict completo, y los candidatos se verifican con una
+segunda pasada que cuenta de forma exacta solo esos códigos.
+
+Para comparar períodos (`aggregate_ranges`) se lee una sola vez la unión de los
+rangos y cada fila se suma al acumulador de cada rango que contiene su fecha.
+
+Sin detalle por producto (`products=False`) los archivos archivados no se leen: se
+suman los totales por lugar precalculados en el índice de su partición.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from config import parse_amount
+from topk import SpaceSaving
+
+# Pool de procesos compartido, se crea en el primer reporte largo
+_executor = None
+_executor_lock = threading.Lock()   # hilos de gthread pidiendo el pool a la vez
+
+
+def new_partial(product_capacity=None):
+    """Acumulador vacío de un fragmento (con resumen acotado de productos si se indica capacidad)"""
+    return {
+        'total_sales': 0,
+        'total_returns': 0,
+        'total_amount': 0,
+        'locations': set(),
+        'daily': {},        # fecha -> [ventas, devoluciones, monto, set(lugares)]
+        'products': {},     # código -> [ventas, devoluciones, monto]
+        'location_sales': {},  # lugar -> [ventas, devoluciones, monto]
+        'product_sketch': SpaceSaving(product_capacity) if product_capacity else None
+    }
+
+
+def aggregate_shard(storage, start_date, end_date, delimiter=';', product_capacity=None, products=True):
+    """Agregar ventas y devoluciones de un fragmento del rango (se ejecuta en un proceso del pool)"""
+    return aggregate_ranges_shard(storage, start_date, end_date, [(start_date, end_date)],
+                                  delimiter, product_capacity, products)[0]
+
+
+def _add_totals(targets, is_return, totals):
+    """Sumar los totales precalculados de un archivo archivado, sin leer sus filas"""
+    for partial, day, _, _, location_sales in targets:
+        if is_return:
+            partial['total_returns'] += totals['rows']
+            day[1] += totals['rows']
+        else:
+            partial['total_sales'] += totals['rows']
+            day[0] += totals['rows']
+        partial['total_amount'] += totals['amount']
+        day[2] += totals['amount']
+        for location, (count, amount) in totals['locations'].items():
+            if location:
+                counters = location_sales.get(location)
+                if counters is None:
+                    counters = location_sales[location] = [0, 0, 0]
+                counters[1 if is_return else 0] += count
+                counters[2] += amount
+
+
+def aggregate_ranges_shard(storage, start_date, end_date, ranges, delimiter=';', product_capacity=None,
+                           products=True):
+    """
+    Agregar un fragmento una sola vez para varios rangos: retorna un acumulador por
+    rango con las filas del fragmento cuya fecha cae en ese rango. Con
+    products=False no se cuentan productos y los archivos archivados se suman desde
+    los totales de la partición.
+    """
+    partials = [new_partial(product_capacity) for _ in ranges]
+    bounds = [(start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')) for start, end in ranges]
+    sources_by_date = storage.range_sources(start_date, end_date)
+
+    for date_str, sources in sources_by_date.items():
+        targets = [(partial, partial['daily'].setdefault(date_str, [0, 0, 0, set()]),
+                    partial['products'], partial['product_sketch'], partial['location_sales'])
+                   for partial, (start, end) in zip(partials, bounds) if start <= date_str <= end]
+        if not targets:
+            continue
+        for source in sources:
+            is_return = source.kind == 'returns'
+            if not is_return:
+                for partial, day, _, _, _ in targets:
+                    day[3].add(source.location)
+                    partial['locations'].add(source.location)
+            totals = None if products else source.totals
+            if totals is not None:
+                _add_totals(targets, is_return, totals)
+                continue
+            try:
+                for row in source.rows(delimiter):
+                    product_code = (row.get('cod_venta') or row.get('cod_fabrica', '')) if products else ''
+                    location = row.get('lugar', '') if is_return else source.location
+                    amount = parse_amount(row.get('precio', '0'))
+                    if amount is None:
+                        amount = 0
+
+                    for partial, day, products, sketch, location_sales in targets:
+                        if is_return:
+                            partial['total_returns'] += 1
+                            day[1] += 1
+                        else:
+                            partial['total_sales'] += 1
+                            day[0] += 1
+                        partial['total_amount'] += amount
+                        day[2] += amount
+
+                        if product_code and sketch is not None:
+                            sketch.add(product_code, amount)
+                        elif product_code:
+                            counters = products.get(product_code)
+                            if counters is None:
+                                counters = products[product_code] = [0, 0, 0]
+                            counters[1 if is_return else 0] += 1
+                            counters[2] += amount
+
+                        if location:
+                            counters = location_sales.get(location)
+                            if counters is None:
+                                counters = location_sales[location] = [0, 0, 0]
+                            counters[1 if is_return else 0] += 1
+                            counters[2] += amount
+            except Exception as e:
+                print(f"Error procesando {source.filename}: {e}")
+
+    return partials
+
+
+def _merge_counters(target, source):
+    for key, values in source.items():
+        current = target.get(key)
+        if current is None:
+            target[key] = list(values)
+        else:
+            for i, value in enumerate(values):
+                current[i] += value
+
+
+def combine_partials(a, b):
+    """Combinar dos acumuladores (operación asociativa); modifica y retorna `a`"""
+    a['total_sales'] += b['total_sales']
+    a['total_returns'] += b['total_returns']
+    a['total_amount'] += b['total_amount']
+    a['locations'] |= b['locations']
+    for date_str, (sales, returns, amount, locations) in b['daily'].items():
+        day = a['daily'].get(date_str)
+        if day is None:
+            a['daily'][date_str] = [sales, returns, amount, set(locations)]
+        else:
+            day[0] += sales
+            day[1] += returns
+            day[2] += amount
+            day[3] |= locations
+    _merge_counters(a['products'], b['products'])
+    _merge_counters(a['location_sales'], b['location_sales'])
+    if b['product_sketch'] is not None:
+        if a['product_sketch'] is None:
+            a['product_sketch'] = SpaceSaving(b['product_sketch'].capacity)
+        a['product_sketch'].merge(b['product_sketch'])
+    return a
+
+
+def count_products_shard(storage, start_date, end_date, codes, delimiter=';'):
+    """Conteo exacto [ventas, devoluciones, monto] solo para los códigos candidatos"""
+    codes = set(codes)
+    products = {}
+    sources_by_date = storage.range_sources(start_date, end_date)
+    for sources in sources_by_date.values():
+        for source in sources:
+            is_return = source.kind == 'returns'
+            try:
+                for row in source.rows(delimiter):
+                    product_code = row.get('cod_venta') or row.get('cod_fabrica', '')
+                    if product_code not in codes:
+                        continue
+                    counters = products.get(product_code)
+                    if counters is None:
+                        counters = products[product_code] = [0, 0, 0]
+                    counters[1 if is_return else 0] += 1
+                    counters[2] += parse_amount(row.get('precio', '0')) or 0
+            except Exception as e:
+                print(f"Error procesando {source.filename}: {e}")
+    return products
+
+
+def split_range(start_date, end_date, workers):
+    """
+    Dividir el rango en fragmentos contiguos: por mes si hay al menos tantos meses
+    como procesos, si no en grupos de días (dos por proceso).
+    """
+    days = (end_date - start_date).days + 1
+    months = (end_date.year - start_date.year) * 12 + end_date.month - start_date.month + 1
+
+    shards = []
+    if months >= workers:
+        current = start_date
+        while current <= end_date:
+            next_month = (current.replace(day=28) + timedelta(days=4)).replace(day=1)
+            shards.append((current, min(end_date, next_month - timedelta(days=1))))
+            current = next_month
+    else:
+        size = max(1, -(-days // (workers * 2)))
+        current = start_date
+        while current <= end_date:
+            shard_end = min(end_date, current + timedelta(days=size - 1))
+            shards.append((current, shard_end))
+            current = shard_end + timedelta(days=1)
+    return shards
+
+
+def _get_executor(workers):
+    """Pool compartido, creado una vez con `workers` (REPORT_WORKERS) y nunca reemplazado"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Los procesos del forkserver solo importan este módulo (no la app)
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload(['reports', 'storage'])
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        return _executor
+
+
+def _run_shards(function, shards, workers, storage, *args):
+    """Ejecutar `function(storage, inicio, fin, *args)` por fragmento en el pool"""
+    executor = _get_executor(workers)
+    futures = [executor.submit(function, storage, shard_start, shard_end, *args)
+               for shard_start, shard_end in shards]
+    return [future.result() for future in futures]
+
+
+def aggregate_range(storage, start_date, end_date, workers=1, min_parallel_days=31,
+                    delimiter=';', product_capacity=None, products=True):
+    """
+    Agregar un rango completo. Los rangos cortos (o workers <= 1) se procesan en
+    línea; los largos se reparten en el pool de procesos y se combinan al final.
+    Con `product_capacity` los productos se resumen en memoria acotada y luego se
+    cuentan de forma exacta solo los candidatos. Con products=False no hay detalle
+    por producto y los meses archivados se suman desde los totales de la partición.
+    """
+    if not products:
+        product_capacity = None
+    days = (end_date - start_date).days + 1
+    parallel = workers > 1 and days >= min_parallel_days
+    shards = split_range(start_date, end_date, workers) if parallel else [(start_date, end_date)]
+
+    result = None
+    if parallel:
+        try:
+            result = new_partial()
+            for partial in _run_shards(aggregate_shard, shards, workers, storage, delimiter,
+                                       product_capacity, products):
+                combine_partials(result, partial)
+        except Exception as e:
+            # Si el pool falla (proceso caído, entorno sin fork, etc.) se calcula en línea
+            print(f"Error en agregación paralela, se procesa en línea: {e}")
+            parallel = False
+            result = None
+    if result is None:
+        result = aggregate_shard(storage, start_date, end_date, delimiter, product_capacity, products)
+
+    sketch = result['product_sketch']
+    if sketch is not None:
+        # Verificación exacta de los candidatos del resumen
+        candidates = sketch.candidates()
+        if parallel:
+            for counted in _run_shards(count_products_shard, shards, workers, storage, candidates, delimiter):
+                _merge_counters(result['products'], counted)
+        else:
+            result['products'] = count_products_shard(storage, start_date, end_date, candidates, delimiter)
+    return result
+
+
+def merge_ranges(ranges):
+    """Unión de los rangos como intervalos disjuntos y ordenados"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def aggregate_ranges(storage, ranges, workers=1, min_parallel_days=31, delimiter=';', products=True):
+    """
+    Agregar varios rangos (que pueden superponerse) leyendo una sola vez cada archivo
+    de su unión. Retorna un acumulador por rango, en el mismo orden.
+    """
+    intervals = merge_ranges(ranges)
+    days = sum((end - start).days + 1 for start, end in intervals)
+    parallel = workers > 1 and days >= min_parallel_days
+
+    if parallel:
+        shards = [shard for start, end in intervals for shard in split_range(start, end, workers)]
+        try:
+            results = [new_partial() for _ in ranges]
+            for partials in _run_shards(aggregate_ranges_shard, shards, workers, storage, ranges, delimiter,
+                                        None, products):
+                for result, partial in zip(results, partials):
+                    combine_partials(result, partial)
+            return results
+        except Exception as e:
+            print(f"Error en agregación paralela, se procesa en línea: {e}")
+
+    results = [new_partial() for _ in ranges]
+    for start, end in intervals:
+        partials = aggregate_ranges_shard(storage, start, end, ranges, delimiter, None, products)
+        for result, partial in zip(results, partials):
+            combine_partials(result, partial)
+    return results
@@ -0,0 +1,374 @@
+"""
+Snapshots incrementales en línea de data/, sales_data/, sales_archive/ y comments/.
+
+Cada snapshot es un manifiesto (snapshots/manifests/<id>.json) que describe cada
+archivo como una lista de bloques guardados en snapshots/objects/ por su sha256:
+un contenido repetido se guarda una sola vez, sin importar el archivo ni el
+snapshot. Para no releer todo en cada snapshot:
+
+- Los archivos sin cambios (mismo inode, tamaño y mtime que en el snapshot
+  anterior) reutilizan sus bloques sin leerse.
+- Los archivos que solo crecieron (ventas, devoluciones y comentarios del día)
+  agregan un bloque con los bytes desde el offset registrado en el snapshot
+  anterior, después de comprobar que el final del contenido previo no cambió.
+- El resto (tablas reescritas con rename, archivos nuevos) se copia entero y se
+  deduplica por contenido.
+
+Las escrituras no se detienen: el tamaño de cada archivo se toma con un lock
+compartido (las ventas y comentarios se agregan con lock exclusivo), así que el
+snapshot nunca incluye una fila a medias; si el archivo cambió hace menos de
+RECENT_SECONDS se corta además en el último salto de línea. Cada archivo queda
+en un estado que existió, aunque no todos en el mismo instante. Con
+STORAGE_BACKEND=sqlite la base se copia con la API de backup de SQLite.
+
+CLI:  python snapshot.py create
+      python snapshot.py list
+      python snapshot.py restore <id> <carpeta destino>
+      python snapshot.py prune --keep 14
+"""
+import fcntl
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+BLOCK_SIZE = 1024 * 1024
+TAIL_CHECK = 4096
+RECENT_SECONDS = 60
+SQLITE_NAME = 'shared/progesven.db'
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class SnapshotStore:
+    """Snapshots incrementales con bloques deduplicados por sha256"""
+
+    def __init__(self, snapshot_dir, roots, sqlite_path=None, exclude=()):
+        self.snapshot_dir = snapshot_dir
+        self.roots = roots                # [(nombre en el snapshot, carpeta)]
+        self.sqlite_path = sqlite_path
+        self.exclude = {os.path.abspath(path) for path in exclude}
+        self.objects_dir = os.path.join(snapshot_dir, 'objects')
+        self.manifests_dir = os.path.join(snapshot_dir, 'manifests')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.manifests_dir, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # Objetos
+    # ------------------------------------------------------------------
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def _store(self, source, offset, length, stats):
+        """Guardar `length` bytes de `source` desde `offset` como objeto; retorna [sha256, largo]"""
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.objects_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                source.seek(offset)
+                remaining = length
+                while remaining:
+                    block = source.read(min(BLOCK_SIZE, remaining))
+                    if not block:
+                        raise SnapshotError(f'{source.name} se acortó durante el snapshot')
+                    digest.update(block)
+                    out.write(block)
+                    remaining -= len(block)
+                out.flush()
+                os.fsync(out.fileno())
+            key = digest.hexdigest()
+            path = self._object_path(key)
+            if os.path.exists(path):
+                stats['deduplicated_bytes'] += length
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+                stats['stored_bytes'] += length
+            return [key, length]
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _tail_matches(self, source, entry):
+        """True si los últimos bytes del contenido anterior siguen iguales en el archivo"""
+        key, length = entry['chunks'][-1]
+        check = min(TAIL_CHECK, length)
+        if not check:
+            return True
+        with open(self._object_path(key), 'rb') as previous:
+            previous.seek(length - check)
+            expected = previous.read(check)
+        source.seek(entry['size'] - check)
+        return source.read(check) == expected
+
+    # ------------------------------------------------------------------
+    # Archivos
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _stable_size(source, stat):
+        """Tamaño hasta la última fila completa (con lock compartido frente a los que agregan)"""
+        fcntl.flock(source, fcntl.LOCK_SH)
+        try:
+            size = os.fstat(source.fileno()).st_size
+        finally:
+            fcntl.flock(source, fcntl.LOCK_UN)
+        if size and time.time() - stat.st_mtime < RECENT_SECONDS:
+            # Escritores sin lock: no incluir una línea que se está escribiendo
+            start = max(0, size - BLOCK_SIZE)
+            source.seek(start)
+            tail = source.read(size - start)
+            cut = tail.rfind(b'\n')
+            if cut >= 0:
+                size = start + cut + 1
+            elif start == 0:
+                size = 0
+        return size
+
+    def _snapshot_file(self, path, previous, stats):
+        """Entrada del manifiesto para `path`, reutilizando la del snapshot anterior si sirve"""
+        with open(path, 'rb') as source:
+            stat = os.fstat(source.fileno())
+            if previous and (previous['inode'], previous['mtime_ns']) == (stat.st_ino, stat.st_mtime_ns) \
+                    and previous['size'] == stat.st_size:
+                stats['unchanged'] += 1
+                return previous
+            size = self._stable_size(source, stat)
+            entry = {'size': size, 'mtime_ns': stat.st_mtime_ns, 'inode': stat.st_ino}
+            if previous and previous['inode'] == stat.st_ino and previous['size'] <= size \
+                    and self._tail_matches(source, previous):
+                # Solo creció: se copian los bytes agregados desde el offset anterior
+                entry['chunks'] = list(previous['chunks'])
+                if size > previous['size']:
+                    entry['chunks'].append(self._store(source, previous['size'], size - previous['size'], stats))
+                stats['appended'] += 1
+                return entry
+            entry['chunks'] = [self._store(source, 0, size, stats)] if size else []
+            stats['copied'] += 1
+            return entry
+
+    def _snapshot_sqlite(self, previous, stats):
+        """Copia consistente de la base SQLite (API de backup) como un objeto"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.snapshot_dir, suffix='.db.tmp')
+        os.close(fd)
+        try:
+            source = sqlite3.connect(self.sqlite_path, timeout=30)
+            target = sqlite3.connect(tmp_path)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+            size = os.path.getsize(tmp_path)
+            with open(tmp_path, 'rb') as backup:
+                chunks = [self._store(backup, 0, size, stats)]
+            if previous and previous['chunks'] == chunks:
+                stats['unchanged'] += 1
+            else:
+                stats['copied'] += 1
+            return {'size': size, 'mtime_ns': os.stat(self.sqlite_path).st_mtime_ns, 'inode': None, 'chunks': chunks}
+        finally:
+            os.remove(tmp_path)
+
+    def _walk(self):
+        """(nombre relativo, ruta) de los archivos a respaldar"""
+        for name, root in self.roots:
+            if not os.path.isdir(root):
+                continue
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    path = os.path.join(dirpath, filename)
+                    if filename.endswith('.tmp') or os.path.abspath(path) in self.exclude:
+                        continue
+                    yield f"{name}/{os.path.relpath(path, root)}".replace(os.sep, '/'), path
+
+    # ------------------------------------------------------------------
+    # Snapshots
+    # ------------------------------------------------------------------
+    def _exclusive(self, operation):
+        """Ejecutar `operation` con el lock de la carpeta de snapshots (entre procesos)"""
+        lock = open(os.path.join(self.snapshot_dir, '.lock'), 'w')
+        try:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise SnapshotError('Ya hay un snapshot o una limpieza en curso')
+            return operation()
+        finally:
+            lock.close()
+
+    def create(self):
+        """Tomar un snapshot incremental; retorna su id y estadísticas"""
+        return self._exclusive(self._create)
+
+    def _create(self):
+        started = time.monotonic()
+        parent = self.latest()
+        previous_files = parent['files'] if parent else {}
+        stats = {'files': 0, 'unchanged': 0, 'appended': 0, 'copied': 0,
+                 'stored_bytes': 0, 'deduplicated_bytes': 0}
+        files = {}
+        for name, path in self._walk():
+            try:
+                files[name] = self._snapshot_file(path, previous_files.get(name), stats)
+            except FileNotFoundError:
+                continue    # borrado o renombrado mientras se recorría (ej: un .tmp ya publicado)
+            stats['files'] += 1
+        if self.sqlite_path and os.path.exists(self.sqlite_path):
+            files[SQLITE_NAME] = self._snapshot_sqlite(previous_files.get(SQLITE_NAME), stats)
+            stats['files'] += 1
+        for directory in {os.path.dirname(self._object_path(key)) for entry in files.values()
+                          for key, _ in entry['chunks']}:
+            _fsync_dir(directory)
+
+        now = datetime.now()
+        snapshot_id = now.strftime('%Y%m%d-%H%M%S-%f')
+        stats['seconds'] = round(time.monotonic() - started, 3)
+        manifest = {
+            'id': snapshot_id,
+            'created': now.strftime('%Y-%m-%d %H:%M:%S'),
+            'parent': parent['id'] if parent else None,
+            'size': sum(entry['size'] for entry in files.values()),
+            'stats': stats,
+            'files': files
+        }
+        path = os.path.join(self.manifests_dir, f"{snapshot_id}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, ensure_ascii=False, separators=(',', ':'))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+        _fsync_dir(self.manifests_dir)
+        print(f"Snapshot {snapshot_id}: {stats['files']} archivos, {stats['stored_bytes']} bytes nuevos "
+              f"en {stats['seconds']} s")
+        return {'id': snapshot_id, 'created': manifest['created'], 'parent': manifest['parent'],
+                'size': manifest['size'], 'stats': stats}
+
+    def _ids(self):
+        return sorted(name[:-5] for name in os.listdir(self.manifests_dir) if name.endswith('.json'))
+
+    def load(self, snapshot_id):
+        """Manifiesto de un snapshot o None"""
+        if not snapshot_id or snapshot_id not in self._ids():
+            return None
+        with open(os.path.join(self.manifests_dir, f"{snapshot_id}.json"), 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+    def latest(self):
+        ids = self._ids()
+        return self.load(ids[-1]) if ids else None
+
+    def list(self):
+        """Snapshots del más reciente al más antiguo (sin la lista de archivos)"""
+        snapshots = []
+        for snapshot_id in reversed(self._ids()):
+            manifest = self.load(snapshot_id)
+            manifest.pop('files')
+            snapshots.append(manifest)
+        return snapshots
+
+    def restore(self, snapshot_id, target_dir):
+        """Reconstruir los archivos de un snapshot en `target_dir` (verificando cada bloque)"""
+        manifest = self.load(snapshot_id)
+        if manifest is None:
+            raise SnapshotError(f'Snapshot {snapshot_id} no encontrado')
+        if os.path.isdir(target_dir) and os.listdir(target_dir):
+            raise SnapshotError(f'{target_dir} no está vacía')
+        for name, entry in manifest['files'].items():
+            path = os.path.join(target_dir, *name.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as out:
+                for key, length in entry['chunks']:
+                    digest = hashlib.sha256()
+                    with open(self._object_path(key), 'rb') as chunk:
+                        for block in iter(lambda: chunk.read(BLOCK_SIZE), b''):
+                            digest.update(block)
+                            out.write(block)
+                    if digest.hexdigest() != key:
+                        raise SnapshotError(f'Bloque {key} de {name} dañado')
+            os.utime(path, ns=(entry['mtime_ns'], entry['mtime_ns']))
+        return len(manifest['files'])
+
+    def prune(self, keep):
+        """Dejar los `keep` snapshots más recientes y borrar los bloques que ya nadie usa"""
+        # Con el mismo lock que create: sus bloques no están en ningún manifiesto hasta el final
+        return self._exclusive(lambda: self._prune(keep))
+
+    def _prune(self, keep):
+        ids = self._ids()
+        removed = ids[:-keep] if keep > 0 else ids
+        for snapshot_id in removed:
+            os.remove(os.path.join(self.manifests_dir, f"{snapshot_id}.json"))
+        used = set()
+        for snapshot_id in self._ids():
+            for entry in self.load(snapshot_id)['files'].values():
+                used.update(key for key, _ in entry['chunks'])
+        freed = 0
+        for prefix in os.listdir(self.objects_dir):
+            directory = os.path.join(self.objects_dir, prefix)
+            if not os.path.isdir(directory):
+                continue
+            for key in os.listdir(directory):
+                if key not in used:
+                    path = os.path.join(directory, key)
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+        return {'removed': removed, 'freed_bytes': freed}
+
+
+def create_snapshot_store(config_obj):
+    """SnapshotStore con las carpetas de datos de la configuración"""
+    roots = [('data', config_obj.DATA_DIR), ('sales_data', config_obj.SALES_DIR),
+             ('sales_archive', config_obj.SALES_ARCHIVE_DIR), ('comments', config_obj.COMMENTS_DIR)]
+    sqlite_path = config_obj.STORAGE_SQLITE_PATH if config_obj.STORAGE_BACKEND == 'sqlite' else None
+    # El catálogo compilado se regenera desde productos.csv
+    return SnapshotStore(config_obj.SNAPSHOTS_DIR, roots, sqlite_path, exclude=[config_obj.CATALOG_COMPILED_PATH])
+
+
+if __name__ == '__main__':
+    import argparse
+    from config import get_config
+
+    parser = argparse.ArgumentParser(description='Snapshots incrementales de los datos')
+    parser.add_argument('command', choices=['create', 'list', 'restore', 'prune'])
+    parser.add_argument('snapshot_id', nargs='?', help='Id del snapshot (para restore)')
+    parser.add_argument('target', nargs='?', help='Carpeta destino vacía (para restore)')
+    parser.add_argument('--keep', type=int, default=14, help='Snapshots a conservar (para prune)')
+    args = parser.parse_args()
+
+    store = create_snapshot_store(get_config())
+    try:
+        if args.command == 'create':
+            print(json.dumps(store.create(), indent=2))
+        elif args.command == 'list':
+            for item in store.list():
+                stats = item['stats']
+                print(f"{item['id']}  {item['created']}  {stats['files']} archivos  {item['size']} bytes  "
+                      f"+{stats['stored_bytes']} nuevos")
+        elif args.command == 'restore':
+            if not args.snapshot_id or not args.target:
+                parser.error('restore necesita el id del snapshot y la carpeta destino')
+            count = store.restore(args.snapshot_id, args.target)
+            print(f"{count} archivos restaurados en {args.target}")
+        else:
+            result = store.prune(args.keep)
+            print(f"{len(result['removed'])} snapshots borrados, {result['freed_bytes']} bytes liberados")
+    except SnapshotError as e:
+        print(f"Error: {e}")
+        raise SystemExit(1)
@@ -0,0 +1,192 @@
+"""
+Índice en memoria de solicitudes para consultas paginadas y filtradas.
+
+Las solicitudes se mantienen ordenadas por (timestamp, id) en una lista de claves,
+y por cada estado, tipo y solicitante hay otra lista ordenada con las claves que le
+corresponden. Crear o cerrar una solicitud actualiza las listas con bisect, sin
+volver a leer la tabla (con archivos, la escritura se hace con el lock de la tabla).
+Si la tabla cambió por otro proceso (su versión no es la que dejó la última
+escritura propia), el índice se reconstruye en la próxima consulta.
+"""
+import bisect
+import random
+import threading
+from datetime import datetime
+
+from pagination import encode_cursor
+
+TABLE = 'solicitudes.csv'
+FIELDNAMES = ['id', 'timestamp', 'solicitante_nombre', 'tipo', 'cliente_nombre',
+              'banco', 'rut', 'email', 'monto', 'motivo', 'estado', 'comentario_cierre']
+# Filtros disponibles: parámetro -> columna
+FILTERS = {
+    'estado': 'estado',
+    'tipo': 'tipo',
+    'solicitante': 'solicitante_nombre'
+}
+_NOT_LOADED = object()
+
+
+def _key(solicitud):
+    return (solicitud.get('timestamp', ''), solicitud.get('id', ''))
+
+
+class SolicitudesIndex:
+    """Solicitudes ordenadas por (timestamp, id) con índices por estado, tipo y solicitante"""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._lock = threading.RLock()
+        self._version = _NOT_LOADED
+        self._rows = []        # en el orden de la tabla (para reescribirla al cerrar)
+        self._by_key = {}      # (timestamp, id) -> solicitud
+        self._by_id = {}
+        self._keys = []        # claves ordenadas de menor a mayor
+        self._filters = {}     # columna -> valor -> claves ordenadas
+
+    # ------------------------------------------------------------------
+    # Construcción y mantenimiento
+    # ------------------------------------------------------------------
+    def _rebuild(self, version):
+        rows = self.storage.load_table(TABLE)
+        self._rows = rows
+        self._by_key = {}
+        self._by_id = {}
+        self._filters = {column: {} for column in FILTERS.values()}
+        for solicitud in rows:
+            self._by_key[_key(solicitud)] = solicitud
+            self._by_id[solicitud.get('id', '')] = solicitud
+        self._keys = sorted(self._by_key)
+        for key in self._keys:
+            solicitud = self._by_key[key]
+            for column, values in self._filters.items():
+                values.setdefault(solicitud.get(column, ''), []).append(key)
+        self._version = version
+
+    def _ensure_loaded(self):
+        version = self.storage.table_version(TABLE)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._rebuild(version)
+
+    def _index(self, solicitud):
+        key = _key(solicitud)
+        self._by_key[key] = solicitud
+        self._by_id[solicitud.get('id', '')] = solicitud
+        bisect.insort(self._keys, key)
+        for column, values in self._filters.items():
+            bisect.insort(values.setdefault(solicitud.get(column, ''), []), key)
+
+    def _unindex_filters(self, solicitud):
+        key = _key(solicitud)
+        for column, values in self._filters.items():
+            keys = values.get(solicitud.get(column, ''), [])
+            i = bisect.bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                keys.pop(i)
+
+    def _after_write(self, version_before, update):
+        """
+        Aplicar `update` al índice si la versión que deja la escritura es solo la nuestra.
+        Con archivos, crear y cerrar escriben con el lock de la tabla (nadie más escribe
+        entre las dos lecturas de versión); en SQLite cada escritura suma 1 a la versión.
+        """
+        version_after = self.storage.table_version(TABLE)
+        exact = not isinstance(version_before, int) or version_after == version_before + 1
+        if self._version == version_before and exact:
+            update()
+            self._version = version_after
+        else:
+            self._version = _NOT_LOADED  # se reconstruye en la próxima consulta
+
+    # ------------------------------------------------------------------
+    # Escrituras
+    # ------------------------------------------------------------------
+    def create(self, data):
+        """Registrar una solicitud nueva (estado Pendiente) y retornarla"""
+        now = datetime.now()
+        nueva = {
+            'id': f"{now.strftime('%Y%m%d%H%M%S')}{random.randint(10, 99)}",
+            'timestamp': now.strftime('%Y-%m-%d %H:%M:%S'),
+            'solicitante_nombre': data.get('solicitante', ''),
+            'tipo': data.get('tipo', 'Devolución'),
+            'cliente_nombre': data.get('cliente', ''),
+            'banco': data.get('banco', ''),
+            'rut': data.get('rut', ''),
+            'email': data.get('email', ''),
+            'monto': data.get('monto', '0'),
+            'motivo': data.get('motivo', ''),
+            'estado': 'Pendiente',
+            'comentario_cierre': ''
+        }
+        with self._lock, self.storage.table_lock(TABLE):
+            self._ensure_loaded()
+            version_before = self.storage.table_version(TABLE)
+            self.storage.append_table_row(TABLE, nueva, FIELDNAMES)
+
+            def update():
+                self._rows.append(nueva)
+                self._index(nueva)
+            self._after_write(version_before, update)
+        return nueva
+
+    def close(self, sid, comment):
+        """Cerrar una solicitud con su comentario; False si no existe"""
+        with self._lock, self.storage.table_lock(TABLE):
+            # Recargar con el lock tomado: se reescribe desde _rows y no debe perder filas de otros
+            self._ensure_loaded()
+            solicitud = self._by_id.get(sid)
+            if solicitud is None:
+                return False
+            updated = dict(solicitud, estado='Cerrado', comentario_cierre=comment)
+            rows = [updated if row is solicitud else row for row in self._rows]
+            version_before = self.storage.table_version(TABLE)
+            if not self.storage.save_table(TABLE, rows, FIELDNAMES):
+                raise IOError('No se pudo guardar solicitudes.csv')
+
+            def update():
+                self._unindex_filters(solicitud)
+                self._rows = rows
+                self._by_key[_key(updated)] = updated
+                self._by_id[sid] = updated
+                for column, values in self._filters.items():
+                    bisect.insort(values.setdefault(updated.get(column, ''), []), _key(updated))
+            self._after_write(version_before, update)
+            return True
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+    def count(self, **filters):
+        """Cantidad de solicitudes que cumplen los filtros (ej: estado='Pendiente')"""
+        self._ensure_loaded()
+        with self._lock:
+            return len(self._matching_keys(filters))
+
+    def _matching_keys(self, filters):
+        """Claves (de menor a mayor) que cumplen todos los filtros"""
+        checks = [(FILTERS[name], value) for name, value in filters.items() if value]
+        lists = [self._filters[column].get(value, []) for column, value in checks]
+        if not lists:
+            return self._keys
+        if len(lists) == 1:
+            return lists[0]
+        # Se recorre la lista más corta y se verifican los demás filtros sobre la solicitud
+        return [k for k in min(lists, key=len)
+                if all(self._by_key[k].get(column, '') == value for column, value in checks)]
+
+    def page(self, cursor=None, limit=20, **filters):
+        """
+        Página de solicitudes de la más reciente a la más antigua, después del cursor
+        (timestamp, id). Sin `limit` se retornan todas. Retorna
+        (solicitudes, siguiente_cursor o None, total_filtrado).
+        """
+        self._ensure_loaded()
+        with self._lock:
+            keys = self._matching_keys(filters)
+            end = bisect.bisect_left(keys, cursor) if cursor is not None else len(keys)
+            start = max(0, end - limit) if limit else 0
+            page_keys = keys[start:end][::-1]
+            next_cursor = encode_cursor(page_keys[-1]) if start > 0 and page_keys else None
+            return [self._by_key[k] for k in page_keys], next_cursor, len(keys)
@@ -0,0 +1,353 @@
+"""
+Stock por lugar y código de venta.
+
+stock = asignación inicial (tabla stock_inicial.csv: lugar;cod_venta;cantidad)
+        - ventas + devoluciones
+
+Los movimientos se acumulan en memoria: después de cada venta o devolución se lee
+solo lo nuevo del archivo diario (igual que las métricas), y antes de responder una
+consulta se leen las filas que otros procesos hayan agregado (si no cambió el
+directorio ni creció un archivo de ayer u hoy, no se lista sales_dir). Cada cierto
+número de movimientos los contadores se guardan en un checkpoint
+(metrics/stock_checkpoint.json) junto con el offset leído de cada archivo; al
+reiniciar se carga el checkpoint y se leen solo los bytes (o filas, en SQLite)
+posteriores.
+
+Con los mismos movimientos se lleva la ventana de devoluciones: por lugar y código,
+las unidades vendidas y devueltas de cada día de los últimos RETURN_WINDOW_DAYS
+días. Cada devolución se descuenta de la venta más antigua de la ventana que aún
+tenga unidades sin devolver, así validar una devolución es sumar a lo más
+RETURN_WINDOW_DAYS pares sin leer ningún archivo. `record_return` valida y escribe
+la devolución con el lock del ledger y un flock por lugar (locks/ junto al
+checkpoint), así dos devoluciones simultáneas no pueden pasar por la misma unidad.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from archive import SalesSource, get_partition, parse_sales_filename, read_new_rows
+from storage import clean_location
+
+ALLOCATION_TABLE = 'stock_inicial.csv'
+CHECKPOINT_EVERY = 50        # movimientos
+CHECKPOINT_MAX_AGE = 60      # segundos
+CHECKPOINT_VERSION = 2
+
+
+class StockLedger:
+    """Contadores de unidades movidas por lugar y código, con checkpoint en disco"""
+
+    def __init__(self, storage, checkpoint_path, encoding='utf-8', delimiter=';', return_window_days=30):
+        self.storage = storage
+        self.checkpoint_path = checkpoint_path
+        self.encoding = encoding
+        self.delimiter = delimiter
+        self.return_window_days = return_window_days
+        self._lock = threading.RLock()
+        self._moved = {}          # lugar -> {cod_venta: unidades vendidas - devueltas}
+        self._sold = {}           # lugar -> {cod_venta: {fecha: [vendidas, devueltas]}} (ventana de devoluciones)
+        self._window_from = ''     # primera fecha de la ventana (se actualiza en cada lectura)
+        self._pruned_on = None
+        self._files = {}          # archivo diario -> [offset, header] (o 'archived')
+        self._last_id = 0         # último movimiento leído (SQLite)
+        self._scan_from = None    # fecha desde la que se revisan archivos nuevos
+        self._dir_mtime = None    # mtime de sales_dir en la última revisión
+        self._recent = []         # rutas de los archivos desde _scan_from (los que pueden crecer)
+        self._pending = 0
+        self._saved_at = time.time()
+        self._recovered = False
+
+    # ------------------------------------------------------------------
+    # Checkpoint
+    # ------------------------------------------------------------------
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"Checkpoint de stock inválido, se recalcula desde cero: {e}")
+            return
+        if data.get('version') != CHECKPOINT_VERSION or data.get('return_window_days') != self.return_window_days:
+            print("Checkpoint de stock de otra versión, se recalcula desde cero")
+            return
+        self._moved = data.get('moved', {})
+        self._sold = data.get('sold', {})
+        self._files = data.get('files', {})
+        self._last_id = data.get('last_id', 0)
+        self._scan_from = data.get('scan_from')
+
+    def save_checkpoint(self):
+        """Guardar contadores y offsets (archivo temporal y rename)"""
+        with self._lock:
+            data = {
+                'version': CHECKPOINT_VERSION,
+                'saved_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'return_window_days': self.return_window_days,
+                'moved': self._moved,
+                'sold': self._sold,
+                'files': self._files,
+                'last_id': self._last_id,
+                'scan_from': self._scan_from
+            }
+            tmp_path = f"{self.checkpoint_path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as file:
+                    json.dump(data, file, ensure_ascii=False)
+                os.replace(tmp_path, self.checkpoint_path)
+                self._pending = 0
+                self._saved_at = time.time()
+            except Exception as e:
+                print(f"Error guardando checkpoint de stock: {e}")
+
+    def _maybe_checkpoint(self):
+        if self._pending >= CHECKPOINT_EVERY or (self._pending and time.time() - self._saved_at > CHECKPOINT_MAX_AGE):
+            self.save_checkpoint()
+
+    # ------------------------------------------------------------------
+    # Movimientos
+    # ------------------------------------------------------------------
+    def _window_start(self):
+        """Primera fecha ('YYYY-MM-DD') dentro de la ventana de devoluciones"""
+        return (datetime.now().date() - timedelta(days=self.return_window_days - 1)).strftime('%Y-%m-%d')
+
+    def _apply(self, location, row, is_return, date_str=''):
+        code = row.get('cod_venta') or row.get('cod_fabrica') or ''
+        lugar = clean_location(row.get('lugar') or location or '')
+        if not code or not lugar:
+            return
+        counters = self._moved.setdefault(lugar, {})
+        counters[code] = counters.get(code, 0) + (-1 if is_return else 1)
+        self._pending += 1
+        if date_str and date_str >= self._window_from:
+            self._apply_window(lugar, code, date_str, is_return)
+
+    def _apply_window(self, lugar, code, date_str, is_return):
+        days = self._sold.setdefault(lugar, {}).setdefault(code, {})
+        if not is_return:
+            days.setdefault(date_str, [0, 0])[0] += 1
+            return
+        # La devolución se descuenta de la venta más antigua (hasta ese día) con unidades sin devolver
+        for day in sorted(days):
+            sold, returned = days[day]
+            if day <= date_str and returned < sold:
+                days[day][1] += 1
+                return
+
+    def _prune_window(self):
+        """Quitar los días que salieron de la ventana (una vez al día)"""
+        start = self._window_from
+        if self._pruned_on == start:
+            return
+        for lugar in list(self._sold):
+            codes = self._sold[lugar]
+            for code in list(codes):
+                days = {day: counts for day, counts in codes[code].items() if day >= start}
+                if days:
+                    codes[code] = days
+                else:
+                    del codes[code]
+            if not codes:
+                del self._sold[lugar]
+        self._pruned_on = start
+
+    def _read_file(self, path):
+        filename = os.path.basename(path)
+        parsed = parse_sales_filename(filename)
+        if not parsed:
+            return
+        location, date_str, kind = parsed
+        state = self._files.get(filename, [0, None])
+        if state == 'archived':
+            return
+        rows, offset, header = read_new_rows(path, state[0], state[1], self.encoding, self.delimiter)
+        for row in rows:
+            self._apply(location, row, kind == 'returns', date_str)
+        self._files[filename] = [offset, header]
+
+    def _replay_archived(self):
+        """Archivos que se archivaron antes de ser leídos (la app estuvo detenida): se leen completos"""
+        archive_dir = getattr(self.storage, 'archive_dir', None)
+        if not archive_dir or not os.path.isdir(archive_dir):
+            return
+        for name in sorted(os.listdir(archive_dir)):
+            if not name.endswith('.part'):
+                continue
+            partition = get_partition(archive_dir, name[:-5])
+            if partition is None:
+                continue
+            # Por fecha y con las ventas antes que las devoluciones del mismo día
+            for entry in sorted(partition.entries, key=lambda e: (e['date'], e['kind'] == 'returns')):
+                if entry['filename'] in self._files:
+                    continue
+                source = SalesSource(entry['filename'], entry['location'], entry['date'], entry['kind'],
+                                     partition=partition, entry=entry, encoding=self.encoding)
+                for row in source.rows(self.delimiter):
+                    self._apply(source.location, row, source.kind == 'returns', source.date)
+                self._files[entry['filename']] = 'archived'
+
+    def _files_changed(self, dir_mtime):
+        """Si hay algo nuevo sin listar sales_dir: cambió el directorio o creció un archivo reciente"""
+        if dir_mtime is None or dir_mtime != self._dir_mtime:
+            return True
+        for path in self._recent:
+            state = self._files.get(os.path.basename(path))
+            if state == 'archived':
+                continue
+            try:
+                if state is None or os.stat(path).st_size > state[0]:
+                    return True
+            except OSError:
+                return True  # archivado o borrado
+        return False
+
+    def _catch_up_files(self):
+        sales_dir = self.storage.sales_dir
+        if not self._recovered:
+            self._replay_archived()
+        # Antes de listar: lo que cambie durante la revisión se ve en la próxima
+        try:
+            dir_mtime = os.stat(sales_dir).st_mtime_ns
+        except OSError:
+            dir_mtime = None
+        if not self._files_changed(dir_mtime):
+            return
+        entries = []
+        for entry in os.scandir(sales_dir):
+            parsed = parse_sales_filename(entry.name)
+            if parsed:
+                entries.append((parsed[1], parsed[2] == 'returns', entry, parsed))
+        entries.sort(key=lambda item: item[:2])
+        for _, _, entry, parsed in entries:
+            # Después de la primera pasada solo crecen los archivos recientes
+            if self._scan_from and parsed[1] < self._scan_from:
+                continue
+            state = self._files.get(entry.name)
+            if state is None or (state != 'archived' and entry.stat().st_size > state[0]):
+                self._read_file(entry.path)
+        self._scan_from = (datetime.now().date() - timedelta(days=1)).strftime('%Y-%m-%d')
+        self._recent = [entry.path for date_str, _, entry, _ in entries if date_str >= self._scan_from]
+        self._dir_mtime = dir_mtime
+
+    def _catch_up_database(self):
+        for movement_id, kind, location, fecha, row in self.storage.movements_since(self._last_id):
+            self._apply(location, row, kind == 'returns', fecha)
+            self._last_id = movement_id
+
+    def catch_up(self):
+        """Aplicar lo escrito desde la última lectura (o desde el checkpoint al iniciar)"""
+        with self._lock:
+            if not self._recovered:
+                self._load_checkpoint()
+            self._window_from = self._window_start()
+            if self.storage.has_local_files:
+                self._catch_up_files()
+            else:
+                self._catch_up_database()
+            self._prune_window()
+            if not self._recovered:
+                self._recovered = True
+                self.save_checkpoint()
+            self._maybe_checkpoint()
+
+    def observe_write(self, key):
+        """Aplicar una venta o devolución recién escrita en el archivo diario `key`"""
+        with self._lock:
+            if not self._recovered:
+                self.catch_up()
+                return
+            self._window_from = self._window_start()
+            path = self.storage.local_path(key)
+            if path:
+                self._read_file(path)
+            else:
+                self._catch_up_database()
+            self._maybe_checkpoint()
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+    def allocations(self):
+        """lugar (limpio) -> {cod_venta: cantidad inicial}"""
+        allocation = {}
+        for row in self.storage.load_table(ALLOCATION_TABLE):
+            lugar = clean_location(row.get('lugar', ''))
+            code = (row.get('cod_venta') or '').upper()
+            try:
+                quantity = int(row.get('cantidad') or 0)
+            except ValueError:
+                print(f"Cantidad inválida en {ALLOCATION_TABLE}: {row}")
+                continue
+            if lugar and code:
+                counters = allocation.setdefault(lugar, {})
+                counters[code] = counters.get(code, 0) + quantity
+        return allocation
+
+    def location_stock(self, lugar):
+        """Stock por código de un lugar: [{cod_venta, inicial, movidos, stock}]"""
+        self.catch_up()
+        lugar = clean_location(lugar)
+        allocation = self.allocations().get(lugar, {})
+        with self._lock:
+            moved = dict(self._moved.get(lugar, {}))
+        items = []
+        for code in sorted(allocation.keys() | moved.keys()):
+            initial = allocation.get(code, 0)
+            items.append({
+                'cod_venta': code,
+                'inicial': initial,
+                'movidos': moved.get(code, 0),
+                'stock': initial - moved.get(code, 0)
+            })
+        return items
+
+    def returnable(self, lugar, code):
+        """Unidades de `code` vendidas en `lugar` dentro de la ventana y aún no devueltas"""
+        self.catch_up()
+        start = self._window_start()
+        with self._lock:
+            days = self._sold.get(clean_location(lugar), {}).get(code, {})
+            return sum(sold - returned for day, (sold, returned) in days.items() if day >= start)
+
+    @contextmanager
+    def _location_lock(self, lugar):
+        """Lock entre procesos de las devoluciones de un lugar"""
+        lock_dir = os.path.join(os.path.dirname(self.checkpoint_path), 'locks')
+        os.makedirs(lock_dir, exist_ok=True)
+        name = hashlib.sha1(clean_location(lugar).encode('utf-8')).hexdigest()[:16]
+        with open(os.path.join(lock_dir, f"devoluciones_{name}.lock"), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def record_return(self, lugar, code, write):
+        """
+        Validar y registrar una devolución sin que otra se cuele entre medio: `write()`
+        escribe la fila y retorna su clave, y solo se llama si quedan unidades por devolver.
+        Retorna (unidades que quedaban, clave) o (unidades, None) si no se registró.
+        """
+        with self._lock, self._location_lock(lugar):
+            # returnable lee antes lo que escribieron otros procesos (ya liberaron el flock)
+            available = self.returnable(lugar, code)
+            if available <= 0:
+                return available, None
+            key = write()
+            self.observe_write(key)
+            return available, key
+
+    def summary(self):
+        """Stock total por lugar"""
+        self.catch_up()
+        allocation = self.allocations()
+        with self._lock:
+            moved = {lugar: sum(codes.values()) for lugar, codes in self._moved.items()}
+        return {lugar: sum(allocation.get(lugar, {}).values()) - moved.get(lugar, 0)
+                for lugar in sorted(allocation.keys() | moved.keys())}
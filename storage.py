@@ -0,0 +1,615 @@
+"""
+Capa de almacenamiento de la aplicación.
+
+Las rutas usan solo la interfaz `Storage` (catálogos, ventas/devoluciones,
+comentarios y solicitudes). Hay dos implementaciones:
+
+- FileSystemStorage: el comportamiento de siempre (data/, sales_data/, comments/).
+- SQLiteStorage: una base compartida (por ejemplo en un volumen común) para poder
+  correr varios contenedores de la app detrás de un balanceador.
+
+Se elige con STORAGE_BACKEND=filesystem|sqlite (ver config.py).
+
+Uso:  python storage.py import   (copia los datos de disco a la base SQLite configurada)
+"""
+import csv
+import fcntl
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta
+
+from archive import SalesSource, get_day_sources, get_range_sources, get_range_version
+from comments import COMMENT_KINDS, CommentStore, tokenize
+
+SALES_FIELDNAMES = ['timestamp', 'lugar', 'cod_fabrica', 'cod_venta', 'descripcion', 'precio']
+RETURNS_FIELDNAMES = ['timestamp', 'lugar', 'cod_fabrica', 'cod_venta', 'descripcion', 'precio', 'motivo', 'tipo']
+
+
+def clean_location(lugar):
+    """Nombre del lugar apto para nombre de archivo"""
+    return "".join(c for c in lugar if c.isalnum() or c in (' ', '-', '_')).rstrip()
+
+
+def sales_key(lugar, fecha):
+    """Clave (nombre de archivo) de las ventas de un lugar en una fecha"""
+    return f"{clean_location(lugar)}_{fecha}.csv"
+
+
+def returns_key(fecha):
+    """Clave (nombre de archivo) de las devoluciones de una fecha"""
+    return f"devoluciones_{fecha}.csv"
+
+
+def read_csv_table(filepath, filename, fieldnames=None, encoding='utf-8'):
+    """Cargar archivo CSV con manejo de errores"""
+    data = []
+    try:
+        with open(filepath, 'r', encoding=encoding) as file:
+            # Detectar delimitador
+            sample = file.read(1024)
+            file.seek(0)
+
+            # Determinar delimitador
+            if ';' in sample:
+                delimiter = ';'
+            elif ',' in sample:
+                delimiter = ','
+            else:
+                delimiter = ','  # por defecto
+
+            print(f"Archivo: {filename}, Delimitador detectado: '{delimiter}'")  # Debug
+
+            # Manejar archivos sin encabezados
+            if filename == 'productos.csv' and fieldnames:
+                reader = csv.DictReader(file, delimiter=delimiter, fieldnames=fieldnames)
+            else:
+                reader = csv.DictReader(file, delimiter=delimiter)
+
+            for row in reader:
+                # Limpiar valores y normalizar nombres de columnas
+                cleaned_row = {}
+                for k, v in row.items():
+                    if v is not None:
+                        # Normalizar nombres de columnas (minúsculas, sin espacios)
+                        clean_key = k.strip().lower().replace(' ', '_')
+                        cleaned_row[clean_key] = v.strip() if isinstance(v, str) else str(v)
+                    else:
+                        cleaned_row[k.strip().lower()] = ''
+
+                data.append(cleaned_row)
+
+        print(f"Archivo {filename} cargado: {len(data)} registros")  # Debug
+        if data:
+            print(f"Columnas disponibles: {list(data[0].keys())}")  # Debug
+
+    except Exception as e:
+        print(f"Error cargando {filename}: {e}")
+    return data
+
+
+class Storage(ABC):
+    """Interfaz de almacenamiento que usan las rutas"""
+
+    # True si las ventas quedan en archivos locales que se pueden leer de forma incremental
+    has_local_files = False
+
+    # Catálogos y tablas (productos, telefonos, bazares, solicitudes, ...)
+    @abstractmethod
+    def load_table(self, name, fieldnames=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_table(self, name, rows, fieldnames):
+        raise NotImplementedError
+
+    @abstractmethod
+    def append_table_row(self, name, row, fieldnames):
+        raise NotImplementedError
+
+    @abstractmethod
+    def table_version(self, name):
+        """Valor que cambia cada vez que cambia la tabla (para cachés)"""
+        raise NotImplementedError
+
+    def table_lock(self, name):
+        """
+        Lock entre procesos para leer la versión, escribir y volver a leerla sin que otro
+        escriba la tabla entre medio (solo lo respetan quienes escriben con él)
+        """
+        return nullcontext()
+
+    # Ventas y devoluciones
+    @abstractmethod
+    def append_sale(self, lugar, row, fecha):
+        """Agregar una venta; retorna la clave del archivo diario"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def append_return(self, row, fecha):
+        """Agregar una devolución; retorna la clave del archivo diario"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def sales_rows(self, lugar, fecha):
+        """Ventas de un lugar en una fecha"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def returns_rows(self, fecha):
+        """Devoluciones (de todos los lugares) de una fecha"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def day_sources(self, date_str):
+        """Fuentes (archivos diarios) de una fecha, con .rows()"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def range_sources(self, start_date, end_date):
+        """dict fecha -> fuentes, para un rango"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def key_version(self, key):
+        """Valor que cambia con cada fila agregada al archivo diario `key` (sin leerlo)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def range_version(self, start_date, end_date):
+        """Valor que cambia con cada venta o devolución del rango (sin leer los archivos)"""
+        raise NotImplementedError
+
+    def last_modified(self, versions):
+        """Fecha (epoch) de la última modificación según estas versiones, o None si no se sabe"""
+        return None
+
+    def local_path(self, key):
+        """Ruta en disco de una clave, o None si el backend no usa archivos"""
+        return None
+
+    # Comentarios
+    @abstractmethod
+    def append_comment(self, kind, comment):
+        raise NotImplementedError
+
+    @abstractmethod
+    def search_comments(self, query='', kind=None, start_date=None, end_date=None, page=1, per_page=20):
+        raise NotImplementedError
+
+
+class FileSystemStorage(Storage):
+    """Archivos CSV en los directorios locales (comportamiento original)"""
+
+    has_local_files = True
+
+    def __init__(self, data_dir, sales_dir, archive_dir, comments_dir, encoding='utf-8', delimiter=';'):
+        self.data_dir = data_dir
+        self.sales_dir = sales_dir
+        self.archive_dir = archive_dir
+        self.comments_dir = comments_dir
+        self.encoding = encoding
+        self.delimiter = delimiter
+        self._comments = None
+
+    def __getstate__(self):
+        # Para enviarlo a los procesos de reportes: sin cachés ni locks
+        state = self.__dict__.copy()
+        state['_comments'] = None
+        return state
+
+    def load_table(self, name, fieldnames=None):
+        return read_csv_table(os.path.join(self.data_dir, name), name, fieldnames, self.encoding)
+
+    def save_table(self, name, rows, fieldnames):
+        """Guardar datos en CSV (archivo temporal y rename: los lectores nunca ven un archivo a medias)"""
+        filepath = os.path.join(self.data_dir, name)
+        tmp_path = f"{filepath}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', newline='', encoding=self.encoding) as file:
+                writer = csv.DictWriter(file, fieldnames=fieldnames, delimiter=self.delimiter)
+                writer.writeheader()
+                writer.writerows(rows)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, filepath)
+            return True
+        except Exception as e:
+            print(f"Error guardando {name}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+    def _append_row(self, filepath, row, fieldnames):
+        with open(filepath, 'a', newline='', encoding=self.encoding) as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                writer = csv.DictWriter(file, fieldnames=fieldnames, delimiter=self.delimiter)
+                # Si el archivo no existe (o está vacío), crearlo con header
+                if file.seek(0, os.SEEK_END) == 0:
+                    writer.writeheader()
+                writer.writerow(row)
+                file.flush()
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def append_table_row(self, name, row, fieldnames):
+        self._append_row(os.path.join(self.data_dir, name), row, fieldnames)
+
+    @contextmanager
+    def table_lock(self, name):
+        # Archivo aparte: save_table reemplaza la tabla (otro inode) y _append_row la bloquea
+        with open(os.path.join(self.data_dir, f".{name}.lock"), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def table_version(self, name):
+        try:
+            stat = os.stat(os.path.join(self.data_dir, name))
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def append_sale(self, lugar, row, fecha):
+        key = sales_key(lugar, fecha)
+        self._append_row(os.path.join(self.sales_dir, key), row, SALES_FIELDNAMES)
+        return key
+
+    def append_return(self, row, fecha):
+        key = returns_key(fecha)
+        self._append_row(os.path.join(self.sales_dir, key), row, RETURNS_FIELDNAMES)
+        return key
+
+    def _file_rows(self, key, kind):
+        path = os.path.join(self.sales_dir, key)
+        if not os.path.exists(path):
+            return []
+        source = SalesSource(key, '', key[-14:-4], kind, path=path, encoding=self.encoding)
+        return list(source.rows(self.delimiter))
+
+    def sales_rows(self, lugar, fecha):
+        return self._file_rows(sales_key(lugar, fecha), 'sales')
+
+    def returns_rows(self, fecha):
+        return self._file_rows(returns_key(fecha), 'returns')
+
+    def day_sources(self, date_str):
+        return get_day_sources(self.sales_dir, self.archive_dir, date_str, self.encoding)
+
+    def range_sources(self, start_date, end_date):
+        return get_range_sources(self.sales_dir, self.archive_dir, start_date, end_date, self.encoding)
+
+    def local_path(self, key):
+        return os.path.join(self.sales_dir, key)
+
+    def key_version(self, key):
+        try:
+            stat = os.stat(os.path.join(self.sales_dir, key))
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def range_version(self, start_date, end_date):
+        return get_range_version(self.sales_dir, self.archive_dir, start_date, end_date)
+
+    def last_modified(self, versions):
+        # Todas las versiones de este backend empiezan con el mtime_ns
+        mtimes = [version[0] for version in versions if version]
+        return max(mtimes) / 1e9 if mtimes else None
+
+    @property
+    def comments(self):
+        if self._comments is None:
+            self._comments = CommentStore(self.comments_dir, self.encoding, self.delimiter)
+        return self._comments
+
+    def append_comment(self, kind, comment):
+        self.comments.append(kind, comment)
+
+    def search_comments(self, query='', kind=None, start_date=None, end_date=None, page=1, per_page=20):
+        return self.comments.search(query, kind, start_date, end_date, page, per_page)
+
+
+class RowsSource:
+    """Fuente de un día/lugar leída desde la base (misma forma que SalesSource)"""
+
+    archived = False
+    path = None
+    totals = None
+
+    def __init__(self, storage, filename, location, date, kind):
+        self.storage = storage
+        self.filename = filename
+        self.location = location
+        self.date = date
+        self.kind = kind
+
+    def rows(self, delimiter=';'):
+        cursor = self.storage._connection().execute(
+            'SELECT data FROM movements WHERE filename = ? ORDER BY id', (self.filename,))
+        for (data,) in cursor:
+            yield json.loads(data)
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS table_meta (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    fieldnames TEXT
+);
+CREATE TABLE IF NOT EXISTS table_rows (
+    name TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_table_rows_name ON table_rows (name, position);
+CREATE TABLE IF NOT EXISTS movements (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fecha TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    location TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_movements_fecha ON movements (fecha, filename);
+CREATE INDEX IF NOT EXISTS idx_movements_filename ON movements (filename);
+CREATE TABLE IF NOT EXISTS comments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    comment TEXT NOT NULL,
+    words TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_comments_timestamp ON comments (timestamp);
+"""
+
+
+class SQLiteStorage(Storage):
+    """
+    Base SQLite compartida. Las tablas de data/ se copian desde los CSV la primera
+    vez que se leen (si la base aún no las tiene); desde ahí la base es la fuente.
+    """
+
+    def __init__(self, db_path, data_dir, encoding='utf-8'):
+        self.db_path = db_path
+        self.data_dir = data_dir
+        self.encoding = encoding
+        self._local = None
+        self._pid = None
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(_SQLITE_SCHEMA)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_local'] = None
+        state['_pid'] = None
+        return state
+
+    def _connection(self):
+        # Una conexión por hilo y por proceso (no se comparten después de un fork)
+        if self._local is None or self._pid != os.getpid():
+            self._local = threading.local()
+            self._pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA busy_timeout = 30000')
+            self._local.conn = conn
+        return conn
+
+    def _write(self, statements):
+        """Ejecutar escrituras en una transacción exclusiva"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for sql, params in statements:
+                conn.execute(sql, params)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    # Tablas
+    def _seed_table(self, name):
+        rows = read_csv_table(os.path.join(self.data_dir, name), name, None, self.encoding)
+        fieldnames = list(rows[0].keys()) if rows else []
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Otro nodo pudo haberla copiado mientras tanto
+            if conn.execute('SELECT 1 FROM table_meta WHERE name = ?', (name,)).fetchone() is None:
+                conn.execute('INSERT INTO table_meta (name, version, fieldnames) VALUES (?, 1, ?)',
+                             (name, json.dumps(fieldnames)))
+                conn.executemany('INSERT INTO table_rows (name, position, data) VALUES (?, ?, ?)',
+                                 [(name, i, json.dumps(row, ensure_ascii=False)) for i, row in enumerate(rows)])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def load_table(self, name, fieldnames=None):
+        conn = self._connection()
+        if conn.execute('SELECT 1 FROM table_meta WHERE name = ?', (name,)).fetchone() is None:
+            self._seed_table(name)
+        cursor = conn.execute('SELECT data FROM table_rows WHERE name = ? ORDER BY position', (name,))
+        return [json.loads(data) for (data,) in cursor]
+
+    def save_table(self, name, rows, fieldnames):
+        try:
+            statements = [('DELETE FROM table_rows WHERE name = ?', (name,)),
+                          ('INSERT INTO table_meta (name, version, fieldnames) VALUES (?, 1, ?) '
+                           'ON CONFLICT(name) DO UPDATE SET version = version + 1, fieldnames = excluded.fieldnames',
+                           (name, json.dumps(fieldnames)))]
+            statements += [('INSERT INTO table_rows (name, position, data) VALUES (?, ?, ?)',
+                            (name, i, json.dumps({k: row.get(k, '') for k in fieldnames}, ensure_ascii=False)))
+                           for i, row in enumerate(rows)]
+            self._write(statements)
+            return True
+        except Exception as e:
+            print(f"Error guardando {name}: {e}")
+            return False
+
+    def append_table_row(self, name, row, fieldnames):
+        self.load_table(name)  # asegura que la tabla exista (copiada desde el CSV si corresponde)
+        self._write([
+            ('INSERT INTO table_rows (name, position, data) VALUES '
+             '(?, (SELECT COALESCE(MAX(position), -1) + 1 FROM table_rows WHERE name = ?), ?)',
+             (name, name, json.dumps({k: row.get(k, '') for k in fieldnames}, ensure_ascii=False))),
+            ('UPDATE table_meta SET version = version + 1 WHERE name = ?', (name,))
+        ])
+
+    def table_version(self, name):
+        row = self._connection().execute('SELECT version FROM table_meta WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    # Ventas y devoluciones
+    def _append_movement(self, key, fecha, kind, location, row):
+        self._write([('INSERT INTO movements (fecha, kind, location, filename, data) VALUES (?, ?, ?, ?, ?)',
+                      (fecha, kind, location, key, json.dumps(row, ensure_ascii=False)))])
+        return key
+
+    def append_sale(self, lugar, row, fecha):
+        return self._append_movement(sales_key(lugar, fecha), fecha, 'sales', clean_location(lugar), row)
+
+    def append_return(self, row, fecha):
+        return self._append_movement(returns_key(fecha), fecha, 'returns', '', row)
+
+    def _key_rows(self, key):
+        cursor = self._connection().execute('SELECT data FROM movements WHERE filename = ? ORDER BY id', (key,))
+        return [json.loads(data) for (data,) in cursor]
+
+    def sales_rows(self, lugar, fecha):
+        return self._key_rows(sales_key(lugar, fecha))
+
+    def returns_rows(self, fecha):
+        return self._key_rows(returns_key(fecha))
+
+    def movements_since(self, last_id):
+        """(id, tipo, lugar, fecha, fila) de los movimientos posteriores a `last_id`, en orden"""
+        cursor = self._connection().execute(
+            'SELECT id, kind, location, fecha, data FROM movements WHERE id > ? ORDER BY id', (last_id,))
+        for movement_id, kind, location, fecha, data in cursor:
+            yield movement_id, kind, location, fecha, json.loads(data)
+
+    def range_sources(self, start_date, end_date):
+        cursor = self._connection().execute(
+            'SELECT DISTINCT fecha, filename, kind, location FROM movements WHERE fecha BETWEEN ? AND ?',
+            (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
+        by_date = {}
+        for fecha, filename, kind, location in cursor.fetchall():
+            by_date.setdefault(fecha, []).append(RowsSource(self, filename, location, fecha, kind))
+        return by_date
+
+    def day_sources(self, date_str):
+        day = datetime.strptime(date_str, '%Y-%m-%d').date()
+        return self.range_sources(day, day).get(date_str, [])
+
+    def key_version(self, key):
+        return tuple(self._connection().execute(
+            'SELECT COUNT(*), MAX(id) FROM movements WHERE filename = ?', (key,)).fetchone())
+
+    def range_version(self, start_date, end_date):
+        return tuple(self._connection().execute(
+            'SELECT COUNT(*), MAX(id) FROM movements WHERE fecha BETWEEN ? AND ?',
+            (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))).fetchone())
+
+    # Comentarios
+    def insert_comment(self, timestamp, kind, comment):
+        # Palabras separadas por espacios (también al inicio y al final) para buscar con LIKE '% palabra %'
+        words = ' ' + ' '.join(sorted(tokenize(comment))) + ' '
+        self._write([('INSERT INTO comments (timestamp, kind, comment, words) VALUES (?, ?, ?, ?)',
+                      (timestamp, kind, comment, words))])
+
+    def append_comment(self, kind, comment):
+        if kind not in COMMENT_KINDS:
+            raise ValueError(f"Tipo de comentario desconocido: {kind}")
+        self.insert_comment(datetime.now().strftime('%Y-%m-%d %H:%M:%S'), kind, comment)
+
+    def search_comments(self, query='', kind=None, start_date=None, end_date=None, page=1, per_page=20):
+        where = []
+        params = []
+        for word in sorted(tokenize(query or '')):
+            where.append('words LIKE ?')
+            params.append(f'% {word} %')
+        if kind:
+            where.append('kind = ?')
+            params.append(kind)
+        if start_date:
+            where.append('timestamp >= ?')
+            params.append(start_date)
+        if end_date:
+            where.append('timestamp < ?')
+            params.append((datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d'))
+        clause = ('WHERE ' + ' AND '.join(where)) if where else ''
+        conn = self._connection()
+        total = conn.execute(f'SELECT COUNT(*) FROM comments {clause}', params).fetchone()[0]
+        cursor = conn.execute(
+            f'SELECT timestamp, kind, comment FROM comments {clause} ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?',
+            params + [per_page, (page - 1) * per_page])
+        comments = [{'timestamp': t, 'tipo': k, 'comment': c} for t, k, c in cursor]
+        return comments, total
+
+
+def create_storage(config_obj):
+    """Crear el backend configurado (STORAGE_BACKEND)"""
+    if config_obj.STORAGE_BACKEND == 'sqlite':
+        return SQLiteStorage(config_obj.STORAGE_SQLITE_PATH, config_obj.DATA_DIR, config_obj.CSV_ENCODING)
+    return FileSystemStorage(config_obj.DATA_DIR, config_obj.SALES_DIR, config_obj.SALES_ARCHIVE_DIR,
+                             config_obj.COMMENTS_DIR, config_obj.CSV_ENCODING, config_obj.CSV_DELIMITER)
+
+
+def import_filesystem(source, target):
+    """Copiar tablas, ventas/devoluciones y comentarios de FileSystemStorage a una base SQLite vacía"""
+    if target._connection().execute('SELECT 1 FROM movements LIMIT 1').fetchone():
+        print("La base ya tiene movimientos; no se importa para no duplicar datos")
+        return
+    for name in sorted(os.listdir(source.data_dir)):
+        if name.endswith('.csv'):
+            rows = source.load_table(name)
+            target.save_table(name, rows, list(rows[0].keys()) if rows else [])
+
+    sources_by_date = source.range_sources(datetime(2000, 1, 1).date(), datetime.now().date() + timedelta(days=1))
+    count = 0
+    for date_str in sorted(sources_by_date):
+        for day_source in sources_by_date[date_str]:
+            for row in day_source.rows(source.delimiter):
+                if day_source.kind == 'returns':
+                    target.append_return(row, date_str)
+                else:
+                    # La clave se arma con el lugar del archivo, igual que en disco
+                    target._append_movement(day_source.filename, date_str, 'sales', day_source.location, row)
+                count += 1
+
+    comments = 0
+    page = 1
+    while True:
+        batch, total = source.search_comments(page=page, per_page=500)
+        for item in reversed(batch):
+            target.insert_comment(item['timestamp'], item['tipo'], item['comment'])
+            comments += 1
+        if page * 500 >= total:
+            break
+        page += 1
+    print(f"Importados: {count} movimientos, {comments} comentarios")
+
+
+if __name__ == '__main__':
+    import argparse
+    from config import get_config
+
+    parser = argparse.ArgumentParser(description='Herramientas de almacenamiento')
+    parser.add_argument('command', choices=['import'], help='import: copiar datos de disco a SQLite')
+    args = parser.parse_args()
+
+    app_config = get_config()
+    filesystem = FileSystemStorage(app_config.DATA_DIR, app_config.SALES_DIR, app_config.SALES_ARCHIVE_DIR,
+                                   app_config.COMMENTS_DIR, app_config.CSV_ENCODING, app_config.CSV_DELIMITER)
+    database = SQLiteStorage(app_config.STORAGE_SQLITE_PATH, app_config.DATA_DIR, app_config.CSV_ENCODING)
+    import_filesystem(filesystem, database)
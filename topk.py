@@ -0,0 +1,83 @@
+"""
+Selección de los k mayores sin ordenar listas completas.
+
+`SpaceSaving` es un resumen de "heavy hitters" con memoria acotada (capacidad fija):
+mantiene los elementos con mayor peso acumulado y una cota de error por elemento.
+Se usa para obtener candidatos en rangos muy largos; los candidatos se verifican
+luego con un conteo exacto.
+"""
+import heapq
+
+
+def top_k(items, k, key):
+    """Los k elementos con mayor `key` (equivale a sorted(reverse=True)[:k] sin ordenar todo)"""
+    return heapq.nlargest(k, items, key=key)
+
+
+class SpaceSaving:
+    """Resumen Space-Saving con pesos (Metwally et al.), combinable entre fragmentos"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}   # elemento -> peso estimado (cota superior)
+        self.errors = {}   # elemento -> sobreestimación máxima
+        self._heap = []    # (peso, elemento) con entradas obsoletas que se descartan al sacar el mínimo
+
+    def _push(self, item):
+        heapq.heappush(self._heap, (self.counts[item], item))
+        if len(self._heap) > 4 * self.capacity + 16:
+            self._heap = [(count, key) for key, count in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self):
+        while self._heap:
+            count, item = heapq.heappop(self._heap)
+            if self.counts.get(item) == count:
+                return item
+        return min(self.counts, key=self.counts.get)
+
+    def add(self, item, weight=1):
+        """Sumar peso a un elemento; si no cabe, reemplaza al de menor peso"""
+        if weight <= 0:
+            # Pesos negativos (devoluciones) solo descuentan a elementos ya monitoreados
+            if item in self.counts:
+                self.counts[item] += weight
+                self._push(item)
+            return
+        if item in self.counts:
+            self.counts[item] += weight
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = weight
+            self.errors[item] = 0
+        else:
+            victim = self._pop_min()
+            floor = self.counts.pop(victim)
+            self.errors.pop(victim, None)
+            self.counts[item] = floor + weight
+            self.errors[item] = floor
+        self._push(item)
+
+    def min_count(self):
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.values(), default=0)
+
+    def merge(self, other):
+        """Combinar con otro resumen (elementos ausentes en uno suman el mínimo de ese resumen)"""
+        own_floor = self.min_count()
+        other_floor = other.min_count()
+        counts = {}
+        errors = {}
+        for item in set(self.counts) | set(other.counts):
+            counts[item] = self.counts.get(item, own_floor) + other.counts.get(item, other_floor)
+            errors[item] = self.errors.get(item, own_floor) + other.errors.get(item, other_floor)
+        kept = top_k(counts, self.capacity, key=counts.get)
+        self.counts = {item: counts[item] for item in kept}
+        self.errors = {item: errors[item] for item in kept}
+        self._heap = [(count, item) for item, count in self.counts.items()]
+        heapq.heapify(self._heap)
+        return self
+
+    def candidates(self):
+        """Elementos monitoreados, de mayor a menor peso estimado"""
+        return top_k(self.counts, len(self.counts), key=self.counts.get)